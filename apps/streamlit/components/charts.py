@@ -1,52 +1,50 @@
 """
 Chart Components
 Render charts from health data
+
+Long time series are downsampled with Largest-Triangle-Three-Buckets (keeps
+the visual shape: peaks, dips and trends) and drawn with WebGL; histograms are
+binned here with NumPy, so only the bars are sent to the browser.
 """
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 
-def render_chart_from_data(data: list) -> go.Figure:
+# Max points drawn per time series (longer series are downsampled with LTTB)
+CHART_MAX_POINTS = int(os.getenv("HEALTHSYNC_CHART_MAX_POINTS", "2000"))
+# Series with more points than this are drawn with WebGL (scattergl)
+WEBGL_MIN_POINTS = int(os.getenv("HEALTHSYNC_CHART_WEBGL_POINTS", "1000"))
+# Upper bound for the number of histogram bins
+HISTOGRAM_MAX_BINS = int(os.getenv("HEALTHSYNC_CHART_MAX_BINS", "100"))
+# Figures kept per session by FigureCache (least recently shown are dropped first)
+FIGURE_CACHE_SIZE = int(os.getenv("HEALTHSYNC_FIGURE_CACHE_SIZE", "32"))
+
+def render_chart_from_data(data) -> go.Figure:
     """
     Automatically render appropriate chart from data
     
     Args:
-        data: List of dictionaries with health data
+        data: DataFrame or list of dictionaries with health data
     
     Returns:
         Plotly figure or None
     """
-    if not data or len(data) == 0:
+    if data is None or len(data) == 0:
         return None
     
     try:
-        df = pd.DataFrame(data)
+        # Shallow copy - the date column is converted below without touching the caller's frame
+        df = data.copy(deep=False) if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
         
         if df.empty:
             return None
         
-        # Try to find date/time column
-        date_col = None
-        for col in df.columns:
-            if "date" in col.lower() or "time" in col.lower() or "timestamp" in col.lower():
-                date_col = col
-                break
-        
-        # Try to find value column
-        value_col = None
-        for col in df.columns:
-            if col != date_col and ("value" in col.lower() or "count" in col.lower() or 
-                                   "step" in col.lower() or "rate" in col.lower() or
-                                   "bpm" in col.lower() or "distance" in col.lower()):
-                value_col = col
-                break
-        
-        # If no value column found, use first numeric column
-        if not value_col:
-            numeric_cols = df.select_dtypes(include=['number']).columns
-            if len(numeric_cols) > 0:
-                value_col = numeric_cols[0]
+        date_col, value_col = find_chart_columns(df)
         
         if not value_col:
             return None
@@ -56,10 +54,12 @@ def render_chart_from_data(data: list) -> go.Figure:
             try:
                 df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
                 df = df.sort_values(date_col)
+                df = downsample_time_series(df, date_col, value_col)
                 
-                # Line chart for time series
+                # Line chart for time series (WebGL for long series)
                 fig = px.line(df, x=date_col, y=value_col, 
-                            title=f"{value_col} Over Time")
+                            title=f"{value_col} Over Time",
+                            render_mode="webgl" if len(df) > WEBGL_MIN_POINTS else "svg")
                 return fig
             except:
                 pass
@@ -70,14 +70,118 @@ def render_chart_from_data(data: list) -> go.Figure:
                         title=f"{value_col} Distribution")
             return fig
         else:  # Histogram for large datasets
-            fig = px.histogram(df, x=value_col, 
-                             title=f"{value_col} Distribution")
-            return fig
+            return histogram_figure(df[value_col], value_col, title=f"{value_col} Distribution")
     
     except Exception as e:
         print(f"Error rendering chart: {e}")
         return None
 
+def find_chart_columns(df: pd.DataFrame) -> tuple:
+    """
+    Columns a chart is drawn from
+
+    Returns:
+        (date/time column or None, value column or None)
+    """
+    # Try to find date/time column
+    date_col = None
+    for col in df.columns:
+        name = str(col).lower()
+        if "date" in name or "time" in name or name.endswith("_ts"):  # start_ts/end_ts typed columns
+            date_col = col
+            break
+    
+    # Try to find value column
+    value_col = None
+    for col in df.columns:
+        name = str(col).lower()
+        if col != date_col and ("value" in name or "count" in name or 
+                               "step" in name or "rate" in name or
+                               "bpm" in name or "distance" in name):
+            value_col = col
+            break
+    
+    # If no value column found, use first numeric column
+    if not value_col:
+        numeric_cols = df.select_dtypes(include=['number']).columns
+        if len(numeric_cols) > 0:
+            value_col = numeric_cols[0]
+    return date_col, value_col
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: positions of the points that best keep a series' shape
+
+    Args:
+        x: Sorted x values (numeric)
+        y: y values
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted positions into x/y (first and last point always kept)
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Buckets between the fixed first and last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        # Point of this bucket forming the largest triangle with the previous pick and the next average
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def downsample_time_series(df: pd.DataFrame, date_col, value_col, max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """
+    Rows of a time series sorted by date, downsampled with LTTB to at most max_points
+
+    Rows without a date or a numeric value are dropped first when downsampling.
+    """
+    if len(df) <= max_points:
+        return df
+    values = pd.to_numeric(df[value_col], errors='coerce')
+    dates = pd.to_datetime(df[date_col], errors='coerce')
+    valid = values.notna() & dates.notna()
+    df, values, dates = df[valid], values[valid], dates[valid]
+    if len(df) <= max_points:
+        return df
+    x = (dates - pd.Timestamp(0, tz=dates.dt.tz)).dt.total_seconds().to_numpy()
+    return df.iloc[lttb_indices(x, values.to_numpy(), max_points)]
+
+def histogram_figure(values: pd.Series, value_col, title: str) -> go.Figure:
+    """Histogram binned with NumPy (only bin counts are sent to the browser)"""
+    values = pd.to_numeric(values, errors='coerce').dropna().to_numpy()
+    if len(values) == 0:
+        return None
+    edges = np.histogram_bin_edges(values, bins="auto")
+    if len(edges) - 1 > HISTOGRAM_MAX_BINS:
+        edges = np.histogram_bin_edges(values, bins=HISTOGRAM_MAX_BINS)
+    counts, edges = np.histogram(values, bins=edges)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.stack([edges[:-1], edges[1:]], axis=-1),
+        hovertemplate="%{customdata[0]:.4g} – %{customdata[1]:.4g}<br>count=%{y}<extra></extra>"
+    ))
+    fig.update_layout(title=title, xaxis_title=str(value_col), yaxis_title="count", bargap=0)
+    return fig
+
 def plot_steps_timeline(data: pd.DataFrame, date_col: str, value_col: str) -> go.Figure:
     """Plot steps over time"""
     fig = px.line(data, x=date_col, y=value_col, title="Steps Over Time")
@@ -93,3 +197,41 @@ def plot_sleep_quality(data: pd.DataFrame, date_col: str, duration_col: str) ->
     fig = px.bar(data, x=date_col, y=duration_col, title="Sleep Duration")
     return fig
 
+class FigureCache:
+    """
+    Bounded LRU cache of built figures (e.g. one per Streamlit session), so charts
+    of unchanged data aren't rebuilt on every rerun
+    """
+
+    def __init__(self, max_entries: int = FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()  # key -> figure, least recently used first
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Cache key of a chart from what identifies its data (e.g. message ID and data version)"""
+        return hashlib.sha1("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+    def get_or_build(self, key: str, data) -> go.Figure:
+        """
+        Figure for chart data, built with render_chart_from_data only on a miss
+
+        Args:
+            key: Cache key (see FigureCache.key)
+            data: Chart data (DataFrame or list of dicts), or a function returning it,
+                so data is only loaded on a miss
+
+        Returns:
+            Plotly figure or None (a miss that yields no figure is cached too)
+        """
+        if key in self._figures:
+            self._figures.move_to_end(key)
+            return self._figures[key]
+        figure = render_chart_from_data(data() if callable(data) else data)
+        self._figures[key] = figure
+        while len(self._figures) > self.max_entries:
+            self._figures.popitem(last=False)
+        return figure
+
+    def __len__(self) -> int:
+        return len(self._figures)
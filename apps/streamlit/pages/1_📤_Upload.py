@@ -72,6 +72,10 @@ if csv_files:
         if storage_path.exists():
             shutil.rmtree(storage_path)
             storage_path.mkdir(parents=True, exist_ok=True)
+            import sys
+            sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+            from result_cache import invalidate_user_results
+            invalidate_user_results(user_id)
             st.session_state.health_data_loaded = False
             st.success("✅ All data cleared!")
             st.rerun()
@@ -112,10 +116,23 @@ if uploaded_file:
             # List CSV files
             csv_names = [f.name for f in csv_files]
             
-            # Validate CSV files can be loaded into DuckDB
+            # Validate every CSV file can be loaded into DuckDB (files run in parallel)
             from utils.csv_validator import validate_csv_files
-            validation_result = validate_csv_files(storage_path, max_files=min(20, len(csv_files)))
-            
+            validation_result = validate_csv_files(storage_path)
+
+            # Build the persistent DuckDB catalog once, so chat queries don't reload every CSV
+            import sys
+            sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+            from health_catalog import build_catalog
+            from result_cache import invalidate_user_results
+            try:
+                catalog_manifest = build_catalog(storage_path)
+            except Exception as catalog_error:
+                catalog_manifest = {}
+                st.warning(f"⚠️ Could not build query catalog, queries will load CSV files directly: {catalog_error}")
+            # Cached query results describe the old files
+            invalidate_user_results(user_id)
+
             # Save metadata to MongoDB
             file_metadata = {
                 "user_id": user_id,
@@ -127,8 +144,11 @@ if uploaded_file:
                 "validation": {
                     "validated": validation_result.get("validated", 0),
                     "failed": validation_result.get("failed", 0),
-                    "total": validation_result.get("total_files", 0)
-                }
+                    "total": validation_result.get("total_files", 0),
+                    "incremental": validation_result.get("incremental", 0),
+                    "appended_rows": validation_result.get("appended_rows", 0)
+                },
+                "catalog_fingerprint": catalog_manifest.get("fingerprint")
             }
             
             save_file_metadata(user_id, file_metadata)
@@ -139,6 +159,11 @@ if uploaded_file:
             # Success message
             if validation_result.get("success"):
                 st.success(f"✅ Uploaded successfully! {validation_result.get('validated', 0)} CSV file(s) validated and ready to query.")
+                if validation_result.get("incremental"):
+                    st.caption(
+                        f"🔁 {validation_result['incremental']} file(s) were already imported - "
+                        f"only {validation_result.get('appended_rows', 0):,} new sample(s) were added."
+                    )
             else:
                 st.warning(f"⚠️ Uploaded but {validation_result.get('failed', 0)} file(s) had issues. Some files may not be queryable.")
             
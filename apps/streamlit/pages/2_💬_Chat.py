@@ -3,14 +3,11 @@ Chat Page - AI Chatbot Interface
 Ask questions about your health data in natural language
 """
 import streamlit as st
-import json
 import asyncio
 import pandas as pd
-from components.charts import render_chart_from_data
-from utils.db import save_chat_message, get_chat_history, clear_chat_history
+from components.charts import FigureCache
+from utils.db import save_chat_message, get_chat_history, get_chat_chart_data, clear_chat_history
 # Using direct query - no MCP server needed
-import google.generativeai as genai
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -70,489 +67,259 @@ if not st.session_state.get("health_data_loaded"):
             st.info(f"📊 Found {len(csv_files)} data file(s). You can upload new data in the **Upload** page.")
 
 # Always use direct query - query CSV files directly + Gemini AI for responses
-from utils.direct_query import get_schema_direct, execute_query_direct
+from utils.direct_query import fetch_page_direct, result_to_dataframe, dataframe_to_records
+from utils.chat_pipeline import ChatPipeline, ChatView, prefetch_schema
+from utils.llm_backend import get_llm_backend
+from utils.chart_store import load_chart_data, clear_chart_data
 st.info("ℹ️ Using direct CSV query + Gemini AI - ready to chat!")
 
-# Initialize Gemini AI client
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
+# LLM backend (Gemini by default, HEALTHSYNC_LLM_BACKEND=stub for offline benchmarks) - shared by all sessions
+llm_client = get_llm_backend()
+if not llm_client:
     st.warning("⚠️ GEMINI_API_KEY not set. AI features will be limited.")
-    gemini_client = None
-else:
-    genai.configure(api_key=gemini_api_key)
-    gemini_client = genai.GenerativeModel("gemini-2.5-flash")
+elif llm_client.name != "gemini":
+    st.caption(f"🧪 LLM backend: {llm_client.name}")
+
+def result_page_state(page_result: dict, page_df: pd.DataFrame) -> dict:
+    """Session state for the currently displayed result page"""
+    return {
+        "df": page_df,
+        "offset": page_result.get("offset", 0),
+        "total_rows": page_result.get("total_rows", page_result.get("row_count", len(page_df))),
+        "next_cursor": page_result.get("next_cursor"),
+        "prev_cursor": page_result.get("prev_cursor")
+    }
 
 # Clear chat history button
 col1, col2 = st.columns([1, 4])
 with col1:
     if st.button("🗑️ Clear History", help="Clear all chat history"):
         deleted_count = clear_chat_history(user_id)
+        clear_chart_data(storage_path)
+        for key in ("older_history", "older_history_cursor", "history_chart_data", "history_figures"):
+            st.session_state.pop(key, None)
         if deleted_count > 0:
             st.success(f"✅ Cleared {deleted_count} message(s)")
             st.rerun()
         else:
             st.info("No messages to clear")
 
-# Load chat history
-chat_history = get_chat_history(user_id)
-
-# Display chat history
-for msg in chat_history[-20:]:  # Show last 20 messages
+# Load the schema in the background while the history renders - a question sent now starts from it
+schema_future = prefetch_schema(user_id)
+
+# Load chat history: the newest page on every run, older pages only when asked for
+history_page = get_chat_history(user_id)
+older_history = st.session_state.get("older_history", [])
+older_cursor = st.session_state.get("older_history_cursor") if older_history else history_page["older_cursor"]
+if older_cursor:
+    if st.button("⬆️ Tải tin nhắn cũ hơn", key="load_older_history"):
+        older_page = get_chat_history(user_id, before=older_cursor)
+        st.session_state.older_history = older_page["messages"] + older_history
+        st.session_state.older_history_cursor = older_page["older_cursor"]
+        st.rerun()
+
+# Display chat history - chart payloads are fetched only for charts the user opens
+for msg in older_history + history_page["messages"]:
     role = msg.get("role", "user")
     content = msg.get("content", "")
-    chart_data = msg.get("chart_data")
     
     with st.chat_message(role):
         st.write(content)
-        if chart_data and role == "assistant":
-            try:
-                chart = render_chart_from_data(chart_data)
-                if chart:
-                    st.plotly_chart(chart, width='stretch')
-            except Exception as e:
-                st.error(f"Error rendering chart: {e}")
+        if msg.get("has_chart") and role == "assistant":
+            if st.toggle("📈 Xem biểu đồ", key=f"show_chart_{msg['_id']}"):
+                chart_cache = st.session_state.setdefault("history_chart_data", {})
+                if msg["_id"] not in chart_cache:
+                    chart_cache[msg["_id"]] = get_chat_chart_data(user_id, msg["_id"])
+                chart_payload = chart_cache[msg["_id"]]
+                # Figures are built once per session - reruns reuse them
+                figures = st.session_state.setdefault("history_figures", FigureCache())
+                chart = None
+                try:
+                    # The message holds a downsampled preview - the full rows are read from the chart store on request
+                    if chart_payload and chart_payload.get("chart_id") and \
+                            chart_payload["chart_rows"] > len(chart_payload["chart_data"]) and \
+                            st.toggle(f"🔍 Đầy đủ {chart_payload['chart_rows']} điểm", key=f"full_chart_{msg['_id']}"):
+                        chart = figures.get_or_build(
+                            FigureCache.key(msg["_id"], chart_payload["chart_id"]),
+                            lambda chart_id=chart_payload["chart_id"]: load_chart_data(storage_path, chart_id)
+                        )
+                        if chart is None:
+                            st.caption("Dữ liệu đầy đủ không còn - hiển thị bản xem trước.")
+                    if chart is None and chart_payload:
+                        chart = figures.get_or_build(FigureCache.key(msg["_id"], "preview"), chart_payload["chart_data"])
+                    if chart:
+                        st.plotly_chart(chart, width='stretch')
+                except Exception as e:
+                    st.error(f"Error rendering chart: {e}")
+
+class StreamlitChatView(ChatView):
+    """Renders a chat turn's progress and results in the assistant message"""
+
+    def __init__(self):
+        self.query_status = None
+
+    def notice(self, level: str, text: str):
+        getattr(st, level)(text)
+
+    def show_sql(self, turn):
+        st.code(turn.sql, language="sql")
+        if turn.sql_source == "template":
+            st.caption("⚡ SQL tạo từ mẫu câu hỏi, không cần gọi AI")
+            if turn.routed.get("anchored_to"):
+                st.caption(f"📅 Dữ liệu chỉ có đến ngày {turn.routed['anchored_to']} - khoảng thời gian được tính đến ngày đó.")
+        elif turn.sql_source == "cache":
+            if turn.cached_sql["match"] == "exact":
+                st.caption("⚡ SQL từ cache")
+            else:
+                st.caption(f"⚡ SQL từ cache (câu hỏi tương tự: \"{turn.cached_sql['question']}\")")
+
+    def query_progress(self, seconds: float):
+        # Streamlit stops the script at this UI update if the user navigated away or sent a
+        # new message - the pipeline then cancels the query
+        if self.query_status is None:
+            self.query_status = st.empty()
+        self.query_status.caption(f"⏳ Đang chạy truy vấn... {seconds:.0f}s")
+
+    def query_finished(self):
+        if self.query_status is not None:
+            self.query_status.empty()
+
+    def query_failed(self, turn):
+        st.error(f"Query error: {turn.query_result['error']}")
+        st.json(turn.query_result)
+
+    def show_debug(self, turn):
+        # Debug: Log query result structure (for troubleshooting)
+        with st.expander("🔍 Debug: Query Result Structure", expanded=False):
+            st.json({k: v for k, v in turn.query_result.items() if k not in ("data", "arrow_ipc")})
+            st.write(f"Result format: {turn.query_result.get('result_format', 'rows')}")
+            st.write(f"Row count: {turn.row_count}")
+            st.write(f"Success: {turn.success}")
+
+    def stream_answer(self, chunks) -> str:
+        placeholder = st.empty()
+        try:
+            streamed = placeholder.write_stream(chunks)
+        except Exception:
+            placeholder.empty()  # any partial answer shown is cleared
+            raise
+        answer = streamed if isinstance(streamed, str) else "".join(map(str, streamed or []))
+        if not answer.strip():
+            placeholder.empty()
+        return answer
+
+    def show_answer(self, turn):
+        # Display answer text (unless it was streamed)
+        if not turn.answer_streamed:
+            st.write(turn.answer)
+        if turn.answer_source == "stats":
+            st.caption("⚡ Trả lời từ thống kê dữ liệu, không cần chạy truy vấn")
+        elif turn.answer_source == "template":
+            st.caption("⚡ Trả lời nhanh từ kết quả truy vấn, không cần chờ AI")
+
+    def show_result(self, turn):
+        # The data table (with paging) is rendered below the chat from session state
+        if turn.has_data:
+            st.session_state.result_pages = result_page_state(turn.query_result, turn.result_df)
+        else:
+            st.session_state.pop("result_pages", None)
+        if turn.answer_source == "stats":
+            return  # No query ran
+        
+        # Display query details - always show if query was executed
+        with st.expander("📊 Xem chi tiết dữ liệu từ CSV", expanded=False):
+            st.write(f"**Tổng số bản ghi:** {turn.row_count}")
+            st.write(f"**Trạng thái query:** {'✅ Thành công' if turn.success else '❌ Lỗi'}")
+            
+            if turn.has_data:
+                # Show first rows as JSON for detailed view
+                with st.expander("📋 Xem dữ liệu dạng JSON"):
+                    st.json(dataframe_to_records(turn.result_df, limit=50))  # Show first 50 rows
+                    if turn.row_count > 50:
+                        st.info(f"... và {turn.row_count - 50} bản ghi khác")
+            elif turn.row_count > 0:
+                # Query returned rows but no data came back
+                st.info(f"ℹ️ Query trả về {turn.row_count} bản ghi nhưng dữ liệu chi tiết không có sẵn.")
+                if "columns" in turn.query_result:
+                    st.write(f"**Các cột có sẵn:** {', '.join(turn.query_result.get('columns', []))}")
+            elif turn.success:
+                st.info("ℹ️ Query thực hiện thành công nhưng không có dữ liệu trả về.")
+        
+        # Chart (built during the answer stage, first page only so chart_data stays bounded)
+        if turn.chart:
+            st.plotly_chart(turn.chart, width='stretch')
+            if turn.row_count > len(turn.result_df):
+                st.caption(f"📈 Biểu đồ dựa trên {len(turn.result_df)} / {turn.row_count} bản ghi đầu tiên.")
 
 # Chat input
 if prompt := st.chat_input("Ask about your health data... (e.g., 'How many steps did I take last week?')"):
     # Add user message to UI
     with st.chat_message("user"):
         st.write(prompt)
+    st.session_state.pop("pending_narrative", None)  # AI analysis offered for the previous answer
+    # Older pages were loaded relative to the previous newest page - start again from the newest
+    st.session_state.pop("older_history", None)
+    st.session_state.pop("older_history_cursor", None)
     
-    # Save user message
-    save_chat_message(user_id, "user", prompt)
-    
-    # Generate AI response
+    # Generate AI response - the whole turn (schema, SQL, query, answer, saving both
+    # messages) runs on one event loop
     with st.chat_message("assistant"):
         with st.spinner("🤔 Thinking..."):
             try:
-                # Step 1: Get schema directly from CSV files (always use direct query)
-                schema_result = get_schema_direct(user_id)
-                
-                if isinstance(schema_result, str):
-                    schema_result = json.loads(schema_result)
-                
-                # Step 2: Generate SQL from natural language
-                if gemini_client:
-                    # Build table info for AI
-                    tables_info = []
-                    if isinstance(schema_result, dict) and schema_result.get('tables'):
-                        for orig_name, table_info in schema_result['tables'].items():
-                            if isinstance(table_info, dict):
-                                table_name = table_info.get('table_name', orig_name)
-                                escaped = table_info.get('escaped_name', f'"{table_name}"')
-                                tables_info.append(f"{table_name} (use in SQL: {escaped})")
-                    
-                    sql_prompt = f"""You are a SQL expert. Based on this health data schema:
-
-{json.dumps(schema_result, indent=2)}
-
-User question: {prompt}
-
-IMPORTANT RULES:
-1. Use the EXACT table names as shown in the schema (they may contain dashes and special characters)
-2. When querying multiple tables, you MUST use JOINs, not comma-separated tables in FROM
-3. Always qualify column names with table names when querying multiple tables (e.g., table1.value, table2.value)
-4. If you need data from multiple tables, use UNION ALL or separate queries, not comma-separated FROM
-5. Each table has a "value" column - you MUST qualify it with table name when multiple tables are involved
-6. **CRITICAL: The "value" column is stored as VARCHAR in CSV files, but contains numeric data**
-   - **You MUST cast it to DOUBLE when using in aggregate functions: CAST(value AS DOUBLE) or CAST(table.value AS DOUBLE)**
-   - Example: AVG(CAST(value AS DOUBLE)), SUM(CAST(t1.value AS DOUBLE))
-   - Example: AVG(value) is WRONG, use AVG(CAST(value AS DOUBLE)) instead
-6. **CRITICAL: Use DuckDB date functions and casting:**
-   - Use: CURRENT_DATE - INTERVAL '7 days' (NOT DATE_SUB(CURRENT_DATE, INTERVAL 7 DAY))
-   - Use: CURRENT_DATE - INTERVAL '1 month' (NOT DATE_SUB(CURRENT_DATE, INTERVAL 1 MONTH))
-   - Use: CURRENT_TIMESTAMP - INTERVAL '1 hour' (NOT DATE_SUB(CURRENT_TIMESTAMP, INTERVAL 1 HOUR))
-   - Date arithmetic: date_column - INTERVAL 'N days', date_column + INTERVAL 'N days'
-   - Extract: EXTRACT(day FROM date_column), EXTRACT(month FROM date_column), EXTRACT(year FROM date_column)
-   - Date formatting: strftime(date_column, '%Y-%m-%d')
-   - **IMPORTANT: Date columns (startDate, endDate, date, timestamp) are stored as VARCHAR in CSV files**
-   - **These columns may contain timezone info (e.g., "2019-02-12 10:15:05 +0000")**
-   - **Use TRY_CAST with TIMESTAMPTZ to handle timezone-aware timestamps: TRY_CAST(column AS TIMESTAMPTZ)**
-   - Example: WHERE TRY_CAST(startDate AS TIMESTAMPTZ) >= CURRENT_DATE - INTERVAL '7 days'
-
-Available tables:
-{chr(10).join(tables_info) if tables_info else 'No tables available'}
-
-Example of CORRECT query with date filtering:
-SELECT * FROM "Table1" 
-WHERE TRY_CAST(startDate AS TIMESTAMPTZ) >= CURRENT_DATE - INTERVAL '7 days'
-
-Note: Always cast date columns (startDate, endDate, date, timestamp) to TIMESTAMPTZ using TRY_CAST before comparing with CURRENT_DATE or date literals. This handles timezone-aware timestamps gracefully.
-
-Example of WRONG query (DO NOT DO THIS):
-SELECT * FROM "Table1" 
-WHERE startDate >= DATE_SUB(CURRENT_DATE, INTERVAL 7 DAY)  -- This will fail in DuckDB
-
-Example of CORRECT query with multiple tables:
-SELECT t1.value as heart_rate, t2.value as steps
-FROM "Table1" t1
-JOIN "Table2" t2 ON t1.date = t2.date
-
-Example of WRONG query (DO NOT DO THIS):
-SELECT value FROM "Table1", "Table2"  -- This causes ambiguous column error
-
-Generate a SQL query to answer this question. Use the exact table names from the schema above.
-Use DuckDB date syntax (subtraction with INTERVAL, not DATE_SUB function).
-Only return the SQL query, nothing else. Do not include markdown code blocks, just the SQL query.
-"""
-                    
-                    try:
-                        sql_response = gemini_client.generate_content(sql_prompt)
-                        # Extract SQL query safely
-                        if sql_response and sql_response.text:
-                            sql_query = sql_response.text.strip()
-                        else:
-                            raise ValueError("No response from Gemini API for SQL generation")
-                    except Exception as gemini_error:
-                        st.error(f"❌ Lỗi khi tạo SQL query từ Gemini API: {str(gemini_error)}")
-                        # Fallback to simple query
-                        sql_query = f"SELECT * FROM steps LIMIT 10"
-                        st.warning("⚠️ Sử dụng SQL query mặc định do lỗi API")
-                    
-                    # Clean SQL query (remove markdown if present)
-                    if sql_query.startswith("```sql"):
-                        sql_query = sql_query[6:]
-                    if sql_query.startswith("```"):
-                        sql_query = sql_query[3:]
-                    if sql_query.endswith("```"):
-                        sql_query = sql_query[:-3]
-                    sql_query = sql_query.strip()
-                    
-                    st.code(sql_query, language="sql")
-                else:
-                    # Fallback: simple SQL generation
-                    sql_query = f"SELECT * FROM steps LIMIT 10"  # Placeholder
-                    st.warning("Using placeholder SQL (Gemini not configured)")
-                
-                # Step 3: Execute query directly on CSV files (always use direct query)
-                query_result = execute_query_direct(sql_query, user_id)
-                
-                if isinstance(query_result, str):
-                    query_result = json.loads(query_result)
-                
-                # Debug: Check query result structure
-                if "error" in query_result:
-                    st.error(f"Query error: {query_result['error']}")
-                    st.json(query_result)
-                    st.stop()  # Stop execution instead of return
-                
-                # Debug: Log query result structure (for troubleshooting)
-                with st.expander("🔍 Debug: Query Result Structure", expanded=False):
-                    st.json(query_result)
-                    st.write(f"Has 'data' key: {'data' in query_result}")
-                    st.write(f"Data type: {type(query_result.get('data'))}")
-                    st.write(f"Data value: {query_result.get('data')}")
-                    st.write(f"Row count: {query_result.get('row_count', 'N/A')}")
-                    st.write(f"Success: {query_result.get('success', 'N/A')}")
-                
-                # Step 4: Generate natural language response with Gemini AI
-                # Check if we have data to analyze
-                data_list = query_result.get("data")
-                row_count = query_result.get("row_count", 0)
-                success = query_result.get("success", False)
-                
-                has_data = False
-                answer = None
-                
-                # Check multiple ways to determine if we have data
-                if data_list is not None:
-                    if isinstance(data_list, list):
-                        has_data = len(data_list) > 0
-                    elif isinstance(data_list, dict):
-                        has_data = len(data_list) > 0
-                
-                # If data_list check failed but row_count > 0, we likely have data
-                if not has_data and row_count > 0:
-                    has_data = True
-                    if not data_list or (isinstance(data_list, list) and len(data_list) == 0):
-                        st.warning(f"⚠️ Query returned {row_count} rows but data list is empty. This might be a data format issue.")
-                        if "columns" in query_result:
-                            st.info(f"Columns available: {query_result.get('columns')}")
-                
-                # Final check: if success=True and row_count > 0, we should have data
-                if success and row_count > 0 and not has_data:
-                    has_data = True
-                    st.info(f"✅ Query thành công với {row_count} bản ghi. Đang xử lý dữ liệu...")
-                
-                # Generate AI response with Gemini
-                if gemini_client and has_data:
-                    # Get schema context for better understanding
-                    schema_context = ""
-                    if isinstance(schema_result, dict) and schema_result.get('tables'):
-                        schema_context = "\n\nAvailable health data tables and their meanings:\n"
-                        for table_name, table_info in schema_result['tables'].items():
-                            if isinstance(table_info, dict):
-                                metric_type = table_name
-                                if "HeartRate" in table_name:
-                                    metric_type = "Heart Rate (beats per minute)"
-                                elif "Steps" in table_name or "DistanceWalkingRunning" in table_name:
-                                    metric_type = "Steps / Walking Distance"
-                                elif "ActiveEnergyBurned" in table_name:
-                                    metric_type = "Active Energy Burned (calories)"
-                                elif "BasalEnergyBurned" in table_name:
-                                    metric_type = "Basal Energy Burned (calories)"
-                                elif "Sleep" in table_name:
-                                    metric_type = "Sleep Data"
-                                elif "BodyMass" in table_name or "Weight" in table_name:
-                                    metric_type = "Body Weight (kg)"
-                                elif "Height" in table_name:
-                                    metric_type = "Height (cm)"
-                                elif "VO2Max" in table_name:
-                                    metric_type = "VO2 Max (cardiorespiratory fitness)"
-                                elif "BodyFatPercentage" in table_name:
-                                    metric_type = "Body Fat Percentage (%)"
-                                elif "RestingHeartRate" in table_name:
-                                    metric_type = "Resting Heart Rate (bpm)"
-                                elif "FlightsClimbed" in table_name:
-                                    metric_type = "Flights Climbed"
-                                else:
-                                    metric_type = table_name
-                                
-                                columns = table_info.get('columns', [])
-                                schema_context += f"- {table_name}: {metric_type}\n"
-                                if columns:
-                                    schema_context += f"  Columns: {', '.join(columns[:5])}\n"
-                    
-                    # Build data summary
-                    data_rows = query_result.get('data', [])
-                    columns = query_result.get('columns', [])
-                    data_summary = ""
-                    
-                    if data_rows and len(data_rows) > 0:
-                        if isinstance(data_rows[0], dict):
-                            columns = list(data_rows[0].keys())
-                            data_summary = f"\nColumns in result: {', '.join(columns)}\n\n"
-                            data_summary += "Sample data (first 10 rows):\n"
-                            data_summary += json.dumps(data_rows[:10], indent=2)
-                        else:
-                            data_summary = json.dumps(data_rows[:10], indent=2)
-                    elif columns:
-                        data_summary = f"\nColumns in result: {', '.join(columns)}\n"
-                        data_summary += f"Total rows: {row_count}\n"
-                        data_summary += "Note: Data rows are not available in the response, but the query returned results."
-                    elif row_count > 0:
-                        data_summary = f"\nQuery returned {row_count} rows.\n"
-                        data_summary += "Note: Detailed data is not available in the response format."
-                    
-                    response_prompt = f"""You are a health data assistant helping users understand their Apple Health data.
-
-User's question: {prompt}
-
-{schema_context}
-
-Query executed successfully. Results:
-{data_summary}
-
-Total rows returned: {query_result.get('row_count', len(data_rows))}
-
-SQL query used: {sql_query}
-
-Please provide a helpful, natural language answer in Vietnamese that:
-1. Directly answers the user's question
-2. Mentions specific numbers and values from the data
-3. Highlights key insights or trends if applicable
-4. Explains what the data means in the context of health and fitness
-5. Be concise but informative
-
-If the data shows health metrics, interpret them appropriately (e.g., heart rate ranges, step counts, etc.).
-"""
-                    
-                    try:
-                        ai_response = gemini_client.generate_content(response_prompt)
-                        if ai_response and ai_response.text:
-                            answer = ai_response.text.strip()
-                            if not answer or answer.strip() == "":
-                                answer = "Xin lỗi, tôi không thể tạo phản hồi. Vui lòng thử lại."
-                        else:
-                            answer = "Không nhận được phản hồi từ AI. Vui lòng thử lại."
-                    except Exception as gemini_error:
-                        st.error(f"❌ Lỗi khi gọi Gemini API: {str(gemini_error)}")
-                        if data_rows and len(data_rows) > 0:
-                            answer = f"Tôi tìm thấy {row_count} bản ghi. Dữ liệu:\n\n{json.dumps(data_rows[:5], indent=2, ensure_ascii=False)}"
-                        else:
-                            answer = f"Truy vấn thành công với {row_count} bản ghi, nhưng không thể tạo phản hồi tự động."
-                elif gemini_client and query_result.get("success") and not has_data:
-                    actual_row_count = query_result.get("row_count", 0)
-                    if actual_row_count > 0:
-                        st.info(f"⚠️ Phát hiện {actual_row_count} bản ghi nhưng format dữ liệu có thể không đúng. Đang xử lý...")
-                        response_prompt = f"""User asked: {prompt}
-
-SQL query executed: {sql_query}
-
-The query executed successfully and returned {actual_row_count} rows, but the data format might be different.
-
-Please provide a helpful response in Vietnamese explaining:
-1. The query found {actual_row_count} records
-2. But the data format might need adjustment
-3. Suggest the user check their query or try a different question
-
-Be positive and helpful.
-"""
-                        try:
-                            ai_response = gemini_client.generate_content(response_prompt)
-                            if ai_response and ai_response.text:
-                                answer = ai_response.text.strip()
-                            else:
-                                answer = f"Truy vấn tìm thấy {actual_row_count} bản ghi, nhưng format dữ liệu có thể cần điều chỉnh."
-                        except Exception as gemini_error:
-                            st.warning(f"⚠️ Lỗi khi gọi Gemini API: {str(gemini_error)}")
-                            answer = f"Truy vấn tìm thấy {actual_row_count} bản ghi, nhưng format dữ liệu có thể cần điều chỉnh. Vui lòng thử câu hỏi khác."
-                    else:
-                        response_prompt = f"""User asked: {prompt}
-
-SQL query executed: {sql_query}
-
-The query executed successfully but returned no data (0 rows).
-
-Please explain to the user in Vietnamese that:
-1. The query ran successfully
-2. But there is no data matching their criteria
-3. Suggest they might need to check their data or adjust their question
-"""
-                        try:
-                            ai_response = gemini_client.generate_content(response_prompt)
-                            if ai_response and ai_response.text:
-                                answer = ai_response.text.strip()
-                            else:
-                                answer = "Truy vấn đã thực hiện thành công nhưng không có dữ liệu trả về phù hợp với tiêu chí."
-                        except Exception as gemini_error:
-                            st.warning(f"⚠️ Lỗi khi gọi Gemini API: {str(gemini_error)}")
-                            answer = "Truy vấn đã thực hiện thành công nhưng không có dữ liệu trả về phù hợp với tiêu chí. Vui lòng thử câu hỏi khác hoặc kiểm tra lại dữ liệu."
-                else:
-                    # Fallback response (when Gemini is not available)
-                    if query_result.get("data") and len(query_result.get("data", [])) > 0:
-                        answer = f"Tôi tìm thấy {query_result.get('row_count', 0)} bản ghi. Dữ liệu:\n\n{json.dumps(query_result.get('data', [])[:5], indent=2, ensure_ascii=False)}"
-                    elif query_result.get("success") and row_count > 0:
-                        answer = f"Truy vấn thành công với {row_count} bản ghi, nhưng dữ liệu chi tiết không có sẵn."
-                    elif query_result.get("success"):
-                        answer = "Truy vấn đã thực hiện thành công nhưng không có dữ liệu trả về phù hợp với tiêu chí."
-                    else:
-                        error_msg = query_result.get('error', 'Unknown error')
-                        answer = f"Lỗi truy vấn: {error_msg}"
-                
-                # Ensure answer is always set
-                if not answer:
-                    answer = "Không thể tạo phản hồi. Vui lòng thử lại."
-                
-                # Display answer text
-                st.write(answer)
-                
-                # Get query result info for data display
-                data_rows = query_result.get("data")
-                actual_row_count = query_result.get("row_count", 0)
-                query_success = query_result.get("success", False)
-                
-                # Check if we have data to display
-                has_data_rows = False
-                if data_rows is not None:
-                    if isinstance(data_rows, list):
-                        has_data_rows = len(data_rows) > 0
-                    elif isinstance(data_rows, dict):
-                        has_data_rows = len(data_rows) > 0
-                
-                # Display data table directly if we have data
-                if has_data_rows and isinstance(data_rows, list) and len(data_rows) > 0:
-                    st.markdown("### 📊 Dữ liệu từ CSV:")
-                    try:
-                        df = pd.DataFrame(data_rows)
-                        st.dataframe(df, width='stretch', use_container_width=False)
-                        if len(data_rows) > 20:
-                            st.caption(f"Hiển thị tất cả {len(data_rows)} bản ghi. Cuộn để xem thêm.")
-                    except Exception as df_error:
-                        st.warning(f"⚠️ Không thể hiển thị dạng bảng: {str(df_error)}")
-                        # Fallback to JSON
-                        if len(data_rows) <= 20:
-                            st.json(data_rows)
-                        else:
-                            st.json(data_rows[:20])
-                            st.info(f"... và {len(data_rows) - 20} bản ghi khác")
-                elif actual_row_count > 0:
-                    st.info(f"ℹ️ Query trả về {actual_row_count} bản ghi nhưng dữ liệu chi tiết không có sẵn.")
-                
-                # Display raw data from CSV files - always show if query was executed (detailed view)
-                with st.expander("📊 Xem chi tiết dữ liệu từ CSV", expanded=False):
-                    # Get data from query result
-                    data_rows = query_result.get("data")
-                    actual_row_count = query_result.get("row_count", 0)
-                    query_success = query_result.get("success", False)
-                    
-                    st.write(f"**Tổng số bản ghi:** {actual_row_count}")
-                    st.write(f"**Trạng thái query:** {'✅ Thành công' if query_success else '❌ Lỗi'}")
-                    
-                    # Check if we have data to display
-                    has_data_rows = False
-                    if data_rows is not None:
-                        if isinstance(data_rows, list):
-                            has_data_rows = len(data_rows) > 0
-                        elif isinstance(data_rows, dict):
-                            has_data_rows = len(data_rows) > 0
-                    
-                    if has_data_rows:
-                        # Display as table
-                        try:
-                            if isinstance(data_rows, list) and len(data_rows) > 0:
-                                df = pd.DataFrame(data_rows)
-                                st.dataframe(df, width='stretch', use_container_width=False)
-                                
-                                # Also show as JSON for detailed view
-                                with st.expander("📋 Xem dữ liệu dạng JSON"):
-                                    st.json(data_rows[:50])  # Show first 50 rows
-                                    if len(data_rows) > 50:
-                                        st.info(f"... và {len(data_rows) - 50} bản ghi khác")
-                            else:
-                                st.json(data_rows)
-                        except Exception as df_error:
-                            st.warning(f"⚠️ Không thể hiển thị dạng bảng: {str(df_error)}")
-                            # Fallback to JSON
-                            if isinstance(data_rows, list):
-                                st.json(data_rows[:20])
-                            else:
-                                st.json(data_rows)
-                    elif actual_row_count > 0:
-                        # Query returned rows but data list is empty or None
-                        st.info(f"ℹ️ Query trả về {actual_row_count} bản ghi nhưng dữ liệu chi tiết không có sẵn.")
-                        if "columns" in query_result:
-                            st.write(f"**Các cột có sẵn:** {', '.join(query_result.get('columns', []))}")
-                        # Show full query result for debugging
-                        with st.expander("🔍 Xem chi tiết query result"):
-                            st.json(query_result)
-                    elif query_success:
-                        st.info("ℹ️ Query thực hiện thành công nhưng không có dữ liệu trả về.")
-                        with st.expander("🔍 Xem chi tiết query result"):
-                            st.json(query_result)
-                    else:
-                        # Query failed
-                        error_msg = query_result.get('error', 'Unknown error')
-                        st.error(f"❌ Query lỗi: {error_msg}")
-                        with st.expander("🔍 Xem chi tiết query result"):
-                            st.json(query_result)
-                
-                # Step 5: Render chart if data exists
-                if query_result.get("data") and len(query_result["data"]) > 0:
-                    try:
-                        chart = render_chart_from_data(query_result["data"])
-                        if chart:
-                            st.plotly_chart(chart, width='stretch')
-                            save_chat_message(
-                                user_id,
-                                "assistant",
-                                answer,
-                                chart_data=query_result["data"]
-                            )
-                        else:
-                            save_chat_message(user_id, "assistant", answer)
-                    except Exception as e:
-                        st.warning(f"Could not render chart: {e}")
-                        save_chat_message(user_id, "assistant", answer)
-                else:
-                    save_chat_message(user_id, "assistant", answer)
-            
+                pipeline = ChatPipeline(user_id, storage_path, llm=llm_client, view=StreamlitChatView(),
+                                        save_message=save_chat_message, schema_future=schema_future)
+                turn = asyncio.run(pipeline.run(prompt))
+                if turn.narrative_prompt:
+                    st.session_state.pending_narrative = turn.narrative_prompt
             except Exception as e:
                 error_msg = f"❌ Error: {str(e)}"
                 st.error(error_msg)
                 save_chat_message(user_id, "assistant", error_msg)
                 st.exception(e)
 
+# Data table of the latest query - further pages are fetched from the server only when requested
+result_pages = st.session_state.get("result_pages")
+if result_pages:
+    page_df = result_pages["df"]
+    offset = result_pages["offset"]
+    total_rows = result_pages["total_rows"]
+    st.markdown("### 📊 Dữ liệu từ CSV:")
+    st.dataframe(page_df, width='stretch')
+    if total_rows > len(page_df):
+        st.caption(f"Bản ghi {offset + 1}–{offset + len(page_df)} / {total_rows}")
+        prev_col, next_col, _ = st.columns([1, 1, 4])
+        with prev_col:
+            go_prev = st.button("⬅️ Trang trước", disabled=not result_pages.get("prev_cursor"), key="result_prev")
+        with next_col:
+            go_next = st.button("Trang sau ➡️", disabled=not result_pages.get("next_cursor"), key="result_next")
+        cursor = result_pages.get("prev_cursor") if go_prev else result_pages.get("next_cursor") if go_next else None
+        if cursor:
+            page_result = fetch_page_direct(cursor, user_id, result_format="arrow")
+            if "error" in page_result:
+                if page_result.get("error_type") == "expired":
+                    st.session_state.pop("result_pages", None)
+                    st.warning("⚠️ Kết quả đã hết hạn. Vui lòng hỏi lại để chạy lại truy vấn.")
+                else:
+                    st.error(f"❌ Không thể tải trang: {page_result['error']}")
+            else:
+                st.session_state.result_pages = result_page_state(page_result, result_to_dataframe(page_result))
+                st.rerun()
+
+# Gemini's narrative for a locally phrased answer - generated only when asked for
+pending_narrative = st.session_state.get("pending_narrative")
+if pending_narrative and llm_client:
+    if st.button("✨ Phân tích chi tiết bằng AI", key="narrative"):
+        with st.chat_message("assistant"):
+            try:
+                narrative = StreamlitChatView().stream_answer(llm_client.stream(pending_narrative)).strip()
+                if narrative:
+                    save_chat_message(user_id, "assistant", narrative)
+                    st.session_state.pop("pending_narrative", None)
+                else:
+                    st.warning("Không nhận được phản hồi từ AI. Vui lòng thử lại.")
+            except Exception as gemini_error:
+                st.error(f"❌ Lỗi khi gọi Gemini API: {str(gemini_error)}")
+
 # Example questions
 with st.expander("💡 Example Questions"):
     st.markdown("""
@@ -58,32 +58,38 @@ if not csv_files:
     st.warning("⚠️ No CSV files found")
     st.stop()
 
-# Connect to DuckDB
-conn = duckdb.connect()
+# Reuse the user's catalog (shared by all pages and sessions, rebuilt only when the CSV files change)
+import sys
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from table_utils import escape_table_name
+from health_catalog import load_csv_table
+from utils.catalog_cache import get_user_catalog
 
 try:
-    # Register CSV files as tables - keep original names
-    import sys
-    from pathlib import Path
-    project_root = Path(__file__).parent.parent.parent.parent
-    sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
-    from table_utils import escape_table_name
-    
+    with st.spinner("📦 Preparing your health data..."):
+        conn, manifest = get_user_catalog(storage_path)
+    tables = list(manifest.get("tables", {}))
+    for failed in manifest.get("failed_files", []):
+        st.warning(f"Could not load {failed.get('file')}: {failed.get('error')}")
+except Exception as e:
+    # Catalog couldn't be built - load the CSV files directly for this rerun
+    print(f"Catalog unavailable, loading CSV files directly: {e}")
+    conn = duckdb.connect()
+    tables = []
     for csv_file in csv_files:
-        original_name = csv_file.stem
-        # Keep original name, just escape it
-        escaped_name = escape_table_name(original_name)
-        try:
-            conn.execute(f"""
-                CREATE TABLE IF NOT EXISTS {escaped_name} AS 
-                SELECT * FROM read_csv_auto('{csv_file}')
-            """)
-        except Exception as e:
-            st.warning(f"Could not load {original_name} (normalized: {normalized_name}): {e}")
-    
-    # Get available tables (use original names)
-    tables = [f.stem for f in csv_files]  # Keep original names
-    
+        error = load_csv_table(conn, csv_file, csv_file.stem)
+        if error:
+            st.warning(f"Could not load {csv_file.stem}: {error}")
+        else:
+            tables.append(csv_file.stem)
+
+if not tables:
+    conn.close()
+    st.warning("⚠️ No health data could be loaded")
+    st.stop()
+
+try:
     # Health Cards
     render_health_cards(conn, tables)
     
@@ -0,0 +1,9 @@
+"""
+Shared setup for the Streamlit app tests
+Helpers are imported as `utils.x` / `components.x`, like the pages do
+"""
+import sys
+from pathlib import Path
+
+app_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(app_dir))
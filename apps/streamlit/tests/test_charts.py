@@ -0,0 +1,29 @@
+"""Tests for LTTB downsampling of chart series"""
+import numpy as np
+import pandas as pd
+from components.charts import lttb_indices, downsample_time_series
+
+def test_keeps_first_last_and_spikes():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500)
+    y[1234] = 50  # spike
+    y[7777] = -50  # dip
+    kept = lttb_indices(x, y, 200)
+    assert len(kept) == 200
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert 1234 in kept and 7777 in kept
+    assert np.all(np.diff(kept) > 0)
+
+def test_short_series_are_kept_whole():
+    x = np.arange(50, dtype=float)
+    assert np.array_equal(lttb_indices(x, x, 100), np.arange(50))
+
+def test_downsample_time_series_keeps_rows_and_columns():
+    dates = pd.date_range("2025-01-01", periods=5_000, freq="min", tz="UTC")
+    df = pd.DataFrame({"start_ts": dates, "value_num": np.random.default_rng(0).random(5_000), "unit": "count"})
+    df.loc[2500, "value_num"] = 100
+    sampled = downsample_time_series(df, "start_ts", "value_num", max_points=300)
+    assert len(sampled) == 300
+    assert list(sampled.columns) == list(df.columns)
+    assert sampled.index[0] == 0 and sampled.index[-1] == 4_999
+    assert 2500 in sampled.index
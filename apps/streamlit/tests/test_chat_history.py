@@ -0,0 +1,79 @@
+"""Tests for keyset pagination of the chat history"""
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from utils import db
+
+class FakeMessages:
+    """In-memory chat_messages supporting the aggregate stages get_chat_history uses"""
+
+    def __init__(self, documents: list):
+        self.documents = documents
+
+    def aggregate(self, pipeline: list) -> list:
+        documents = list(self.documents)
+        for stage in pipeline:
+            if "$match" in stage:
+                documents = [d for d in documents if self._matches(d, stage["$match"])]
+            elif "$sort" in stage:
+                for field, direction in reversed(list(stage["$sort"].items())):
+                    documents.sort(key=lambda d: d[field], reverse=direction < 0)
+            elif "$limit" in stage:
+                documents = documents[:stage["$limit"]]
+            elif "$project" in stage:
+                documents = [
+                    {"_id": d["_id"], "role": d["role"], "content": d["content"], "timestamp": d["timestamp"],
+                     "has_chart": d.get("has_chart", bool(d.get("chart_data")))}
+                    for d in documents
+                ]
+        return documents
+
+    def _matches(self, document: dict, query: dict) -> bool:
+        for field, condition in query.items():
+            if field == "$or":
+                if not any(self._matches(document, option) for option in condition):
+                    return False
+            elif isinstance(condition, dict):
+                if not document[field] < condition["$lt"]:
+                    return False
+            elif document[field] != condition:
+                return False
+        return True
+
+@pytest.fixture
+def messages(monkeypatch):
+    start = datetime(2025, 1, 1, 12, 0)
+    documents = []
+    for i in range(45):
+        # Pairs of messages share a timestamp, like a question and its instant answer
+        documents.append({"_id": ObjectId(), "user_id": "u1", "role": "user" if i % 2 == 0 else "assistant",
+                          "content": f"message {i}", "timestamp": start + timedelta(seconds=i // 2),
+                          "chart_data": [{"x": 1}] if i % 5 == 0 else None})
+    documents.append({"_id": ObjectId(), "user_id": "u2", "role": "user", "content": "other user",
+                      "timestamp": start})
+    fake_db = type("FakeDb", (), {"chat_messages": FakeMessages(documents)})()
+    monkeypatch.setattr(db, "get_db", lambda: fake_db)
+    return documents
+
+def test_pages_cover_history_once_newest_first(messages):
+    page = db.get_chat_history("u1", limit=10)
+    assert [m["content"] for m in page["messages"]] == [f"message {i}" for i in range(35, 45)]
+    seen = [m["content"] for m in page["messages"]]
+    pages = 1
+    while page["older_cursor"]:
+        page = db.get_chat_history("u1", limit=10, before=page["older_cursor"])
+        seen = [m["content"] for m in page["messages"]] + seen
+        pages += 1
+    assert pages == 5
+    assert seen == [f"message {i}" for i in range(45)]
+
+def test_pages_leave_out_chart_payloads(messages):
+    page = db.get_chat_history("u1", limit=10)
+    assert all("chart_data" not in m for m in page["messages"])
+    assert [m["has_chart"] for m in page["messages"]] == [i % 5 == 0 for i in range(35, 45)]
+    assert all(isinstance(m["_id"], str) for m in page["messages"])
+
+def test_cursor_round_trips_timestamp_and_id(messages):
+    page = db.get_chat_history("u1", limit=10)
+    oldest = messages[35]
+    assert db._parse_history_cursor(page["older_cursor"]) == (oldest["timestamp"], oldest["_id"])
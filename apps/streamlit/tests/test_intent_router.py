@@ -0,0 +1,82 @@
+"""Tests for routing common questions to SQL templates"""
+from datetime import date
+import pytest
+from utils.intent_router import route_question
+
+TODAY = date(2025, 10, 25)
+COLUMNS = ["startDate", "endDate", "value", "local_date", "value_num", "start_ts", "end_ts"]
+
+def _table(last_date="2025-10-25", units="count"):
+    return {"columns": COLUMNS, "stats": {"last_date": last_date, "value_max": 150, "units": [units]}}
+
+SCHEMA = {"tables": {
+    "steps": _table(),
+    "heart_rate": _table(units="count/min"),
+    "resting_heart_rate": _table(units="count/min"),
+    "workouts": _table(),
+}}
+
+@pytest.mark.parametrize("question, table, aggregate, window_type", [
+    ("How many steps did I take last week?", "steps", "total", "rolling"),
+    ("What was my average heart rate in the last 30 days?", "heart_rate", "average", "rolling"),
+    ("How many workouts did I do this month?", "workouts", "count", "to_date"),
+    ("What's my step count trend over the last month?", "steps", "series", "rolling"),
+    ("average resting heart rate last week", "resting_heart_rate", "average", "rolling"),
+    ("nhịp tim trung bình hôm qua?", "heart_rate", "average", "yesterday"),
+    ("Tổng số bước chân tuần này là bao nhiêu?", "steps", "total", "to_date"),
+    ("total steps", "steps", "total", None),
+])
+def test_routes_common_questions(question, table, aggregate, window_type):
+    routed = route_question(question, SCHEMA, today=TODAY)
+    assert routed is not None
+    assert (routed["table"], routed["aggregate"]) == (table, aggregate)
+    assert (routed["window"] or {}).get("type") == window_type
+
+@pytest.mark.parametrize("question", [
+    "How many steps did I take in October?",
+    "How many steps did I take on 2025-10-01?",
+    "average heart rate in September 2025",
+    "steps on weekends",
+    "heart rate on Friday",
+    "how many days did I walk more than 10000 steps last month",
+    "how many running workouts this year",
+    "how many steps last week compared to the week before",
+    "highest heart rate during workouts",
+    "average and max heart rate",
+    "max heart rate last 5000 days",
+    "how many steps didn't I take last week",
+    "Số bước trong tháng 10?",
+])
+def test_unexpressed_constraints_fall_back_to_the_llm(question):
+    assert route_question(question, SCHEMA, today=TODAY) is None
+
+def test_metric_without_a_table_falls_back():
+    schema = {"tables": {"steps": _table()}}
+    assert route_question("average heart rate during my steps last week", schema, today=TODAY) is None
+
+def test_rolling_windows_end_on_the_last_data_date():
+    schema = {"tables": {"steps": _table(last_date="2025-10-01")}}
+    routed = route_question("How many steps did I take in the last 7 days?", schema, today=TODAY)
+    assert routed["anchored_to"] == "2025-10-01"
+    assert "DATE '2025-10-01' - INTERVAL '7 days'" in routed["sql"]
+
+def test_calendar_windows_stay_on_real_dates():
+    schema = {"tables": {"steps": _table(last_date="2025-10-01")}}
+    routed = route_question("How many steps did I take today?", schema, today=TODAY)
+    assert routed["anchored_to"] is None
+    assert "local_date = CURRENT_DATE" in routed["sql"]
+
+@pytest.mark.parametrize("question", [
+    "What is the number of steps I took last week?",
+    "number of steps yesterday",
+    "Số lượng bước chân tuần này?",
+])
+def test_number_of_a_cumulative_metric_is_a_total(question):
+    routed = route_question(question, SCHEMA, today=TODAY)
+    assert routed["aggregate"] == "total"
+    assert routed["sql"].startswith('SELECT SUM(value_num) AS total FROM "steps"')
+
+def test_number_of_events_is_a_count():
+    routed = route_question("number of workouts this month", SCHEMA, today=TODAY)
+    assert routed["aggregate"] == "count"
+    assert "COUNT(*)" in routed["sql"]
@@ -0,0 +1,43 @@
+"""Tests for answering questions about the data itself from the schema statistics"""
+import pytest
+from utils.quick_answers import answer_from_stats
+
+def _table(first_date, last_date, sources=("Apple Watch",)):
+    return {"row_count": 100, "stats": {
+        "first_date": first_date, "last_date": last_date, "days_with_data": 30,
+        "sources": list(sources), "units": ["count"]
+    }}
+
+SCHEMA = {"tables": {
+    "sleep": _table("2024-01-01", "2025-03-01"),
+    "steps": _table("2023-06-01", "2025-02-15"),
+    "heart_rate": _table("2024-05-01", "2025-01-31"),
+}}
+
+@pytest.mark.parametrize("question, expected", [
+    ("When does my data start?", "2023-06-01"),
+    ("When does my sleep data end?", "2025-03-01"),
+    ("How far back does my step data go?", "2023-06-01"),
+    ("Dữ liệu của tôi bắt đầu từ ngày nào?", "2023-06-01"),
+    ("Dữ liệu nhịp tim có đến ngày nào?", "2025-01-31"),
+])
+def test_coverage_questions_are_answered_from_stats(question, expected):
+    answer = answer_from_stats(question, SCHEMA)
+    assert answer is not None
+    assert expected in answer
+
+def test_source_questions_are_answered_from_stats():
+    assert "Apple Watch" in answer_from_stats("Which devices recorded my heart rate?", SCHEMA)
+
+@pytest.mark.parametrize("question", [
+    "Show me my sleep data for the last 7 days",
+    "Show me my sleep data for the past 7 days",
+    "sleep records since the start of the month",
+    "show my step data for the first week of January",
+    "Dữ liệu giấc ngủ tuần gần nhất",
+    "my last sleep data",
+    "first step records",
+    "which devices recorded my heart rate last week",
+])
+def test_value_questions_need_a_query(question):
+    assert answer_from_stats(question, SCHEMA) is None
@@ -0,0 +1,40 @@
+"""Tests for reusing generated SQL across repeated questions"""
+import pytest
+from utils.sql_cache import SqlCache
+
+SCHEMA = {"tables": {"steps": {"columns": ["value"]}, "heart_rate": {"columns": ["value"]}}}
+
+@pytest.fixture
+def cache(tmp_path):
+    return SqlCache(tmp_path / "sql_cache.json")
+
+def test_exact_and_reworded_questions_reuse_sql(cache):
+    cache.store("How many steps did I take last week?", SCHEMA, "SQL-1")
+    assert cache.lookup("how many steps did i take last week", SCHEMA)["match"] == "exact"
+    similar = cache.lookup("Show me how many steps did I take last week", SCHEMA)
+    assert similar == {"sql": "SQL-1", "match": "similar", "question": "how many steps did i take last week"}
+
+@pytest.mark.parametrize("cached, asked", [
+    ("How many steps did I take in October?", "How many steps did I take in November?"),
+    ("heart rate on Monday", "heart rate on Friday"),
+    ("days with more than 10000 steps", "days with less than 10000 steps"),
+    ("days with more than 10000 steps", "days with more than 8000 steps"),
+    ("how many steps did I take last week", "how many steps didn't I take last week"),
+    ("steps last week", "steps last month"),
+    ("steps last week", "heart rate last week"),
+    ("average steps last week", "max steps last week"),
+])
+def test_guard_words_must_match(cache, cached, asked):
+    cache.store(cached, SCHEMA, "SQL")
+    assert cache.lookup(asked, SCHEMA) is None
+
+def test_schema_change_misses(cache):
+    cache.store("steps last week", SCHEMA, "SQL")
+    other_schema = {"tables": {"steps": {"columns": ["value", "unit"]}}}
+    assert cache.lookup("steps last week", other_schema) is None
+
+def test_entries_persist_and_failed_sql_is_evicted(tmp_path, cache):
+    cache.store("steps last week", SCHEMA, "SQL")
+    assert SqlCache(tmp_path / "sql_cache.json").lookup("steps last week", SCHEMA)["sql"] == "SQL"
+    assert cache.evict("SQL") == 1
+    assert SqlCache(tmp_path / "sql_cache.json").lookup("steps last week", SCHEMA) is None
@@ -0,0 +1,279 @@
+"""
+Answer Formatter
+Phrase scalar and small tabular query results locally (Vietnamese or English,
+following the question) instead of waiting for Gemini
+
+Only results of intent_router templates are phrased here: their metric,
+aggregate and window are known. LLM-written SQL may filter or condition the
+aggregate in ways a column name doesn't show, so its results go to the LLM.
+
+Uses the metric's unit, the user's usual level from the statistics catalog
+and common reference ranges (e.g. 7-9 hours of sleep).
+"""
+import re
+import sys
+from pathlib import Path
+import pandas as pd
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from utils.quick_answers import normalize_text
+
+# Largest series phrased as a list (bigger results go to the LLM)
+SMALL_RESULT_ROWS = 10
+
+# Words only Vietnamese questions use (accents already stripped)
+VIETNAMESE_WORDS = ["bao nhieu", "cua toi", "trung binh", "hom nay", "hom qua", "ngay", "tuan", "thang", "nam",
+                    "buoc", "nhip tim", "giac ngu", "toi", "khong", "la gi", "nhu the nao"]
+
+# Unit -> (Vietnamese, English) display name
+UNIT_NAMES = {
+    "count/min": ("bpm", "bpm"), "hr": ("giờ", "hours"), "h": ("giờ", "hours"), "min": ("phút", "minutes"),
+    "s": ("giây", "seconds"), "kcal": ("kcal", "kcal"), "Cal": ("kcal", "kcal"), "km": ("km", "km"),
+    "m": ("m", "m"), "mi": ("dặm", "miles"), "kg": ("kg", "kg"), "lb": ("lb", "lb"), "%": ("%", "%"),
+    "ms": ("ms", "ms"), "cm": ("cm", "cm")
+}
+# Metric word -> (Vietnamese, English) name, and the noun for unit "count"
+METRIC_NAMES = [
+    ("step", ("số bước", "steps"), ("bước", "steps")),
+    ("flight", ("số tầng leo", "flights climbed"), ("tầng", "floors")),
+    ("heart", ("nhịp tim", "heart rate"), None),
+    ("sleep", ("giấc ngủ", "sleep"), None),
+    ("workout", ("buổi tập", "workouts"), ("buổi", "workouts")),
+    ("energy", ("năng lượng tiêu hao", "energy burned"), None),
+    ("distance", ("quãng đường", "distance"), None),
+    ("mass", ("cân nặng", "body weight"), None),
+]
+# Metric word -> (low, high, (Vietnamese, English) unit, (Vietnamese, English) note) of common reference ranges
+REFERENCE_RANGES = {
+    "heart": (60, 100, ("bpm", "bpm"), ("nhịp tim nghỉ bình thường của người lớn", "normal resting heart rate for adults")),
+    "step": (7000, 10000, ("bước/ngày", "steps/day"), ("mức khuyến nghị", "commonly recommended")),
+    "sleep": (7, 9, ("giờ/đêm", "hours/night"), ("mức khuyến nghị cho người lớn", "recommended for adults")),
+}
+
+AGGREGATE_LABELS = {
+    "total": ("Tổng", "Total"), "average": ("Trung bình", "Average"), "max": ("Cao nhất", "Highest"),
+    "min": ("Thấp nhất", "Lowest"), "count": ("Số lần", "Number of")
+}
+
+def format_result_answer(question: str, result_df: pd.DataFrame, total_rows: int = None, routed: dict = None,
+                         schema_result: dict = None) -> str:
+    """
+    Phrase a small query result without the LLM
+
+    Args:
+        question: User's question (decides the answer language)
+        result_df: Result rows (first page)
+        total_rows: Total rows of the result (default: len(result_df))
+        routed: intent_router.route_question() result the SQL came from
+        schema_result: health_schema result (units and statistics)
+
+    Returns:
+        Answer text, or None if the result needs the LLM to explain it
+        (always for SQL that didn't come from a template)
+    """
+    if not routed or result_df is None or result_df.empty:
+        return None
+    total_rows = total_rows if total_rows is not None else len(result_df)
+    vietnamese = is_vietnamese(question)
+    metric = _metric_info(routed, schema_result)
+    numeric_columns = [
+        column for column in result_df.columns
+        if (pd.api.types.is_numeric_dtype(result_df[column]) or result_df[column].isna().all())
+        and not _is_date_column(result_df, column)
+    ]
+
+    if total_rows == 1 and 1 <= len(numeric_columns) <= 2 and len(result_df.columns) == len(numeric_columns):
+        return _format_scalars(result_df.iloc[0], numeric_columns, metric, routed, vietnamese)
+
+    date_columns = [column for column in result_df.columns if _is_date_column(result_df, column)]
+    if total_rows <= SMALL_RESULT_ROWS and len(date_columns) == 1 and len(numeric_columns) == 1 and \
+            len(result_df.columns) == 2:
+        return _format_series(result_df, date_columns[0], numeric_columns[0], metric, routed, vietnamese)
+    return None
+
+def is_vietnamese(question: str) -> bool:
+    """Vietnamese if the question has Vietnamese letters or words"""
+    if re.search(r"[^\x00-\x7f]", question):
+        return True
+    text = normalize_text(question)
+    return any(f" {word} " in text for word in VIETNAMESE_WORDS)
+
+def _is_date_column(df: pd.DataFrame, column) -> bool:
+    series = df[column]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    name = str(column).lower()
+    return series.dtype == object and ("date" in name or "day" in name or "time" in name)
+
+def _metric_info(routed: dict, schema_result: dict) -> dict:
+    """Table, metric word, unit and statistics of the metric a routed result is about"""
+    tables = (schema_result or {}).get("tables") or {}
+    table_name = routed.get("table")
+    info = tables.get(table_name) or {}
+    stats = info.get("stats") or {}
+    words = normalize_text(re.sub(r"([a-z])([A-Z])", r"\1 \2", table_name or ""))
+    metric_word = next((word for word, _, _ in METRIC_NAMES if word in words), None)
+    return {
+        "table": table_name,
+        "word": metric_word,
+        "unit": routed.get("unit") or (stats.get("units") or [None])[0],
+        "stats": stats
+    }
+
+def _metric_name(metric: dict, vietnamese: bool) -> str:
+    for word, names, _ in METRIC_NAMES:
+        if word == metric["word"]:
+            return names[0] if vietnamese else names[1]
+    return metric["table"] or ("kết quả" if vietnamese else "result")
+
+def _unit_label(metric: dict, vietnamese: bool) -> str:
+    unit = metric["unit"]
+    if not unit:
+        return ""
+    if unit == "count":
+        for word, _, noun in METRIC_NAMES:
+            if word == metric["word"] and noun:
+                return noun[0] if vietnamese else noun[1]
+        return ""
+    names = UNIT_NAMES.get(unit)
+    return (names[0] if vietnamese else names[1]) if names else unit
+
+def _format_number(value) -> str:
+    value = float(value)
+    if value.is_integer() or abs(value) >= 100:
+        return f"{value:,.0f}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+def _window_phrase(routed: dict, vietnamese: bool) -> str:
+    window = routed.get("window")
+    if not window:
+        return ""
+    unit_names = {"day": ("ngày", "day"), "week": ("tuần", "week"), "month": ("tháng", "month"),
+                  "year": ("năm", "year")}
+    unit_vi, unit_en = unit_names.get(window["unit"], (window["unit"], window["unit"]))
+    if window["type"] == "today":
+        phrase = "hôm nay" if vietnamese else "today"
+    elif window["type"] == "yesterday":
+        phrase = "hôm qua" if vietnamese else "yesterday"
+    elif window["type"] == "to_date":
+        phrase = f"{unit_vi} này" if vietnamese else f"this {unit_en}"
+    elif vietnamese:
+        phrase = f"trong {window['n']} {unit_vi} qua"
+    elif window["n"] == 1:
+        phrase = f"in the last {unit_en}"
+    else:
+        phrase = f"in the last {window['n']} {unit_en}s"
+    anchored_to = routed.get("anchored_to")
+    if anchored_to:
+        phrase += f" (tính đến {anchored_to})" if vietnamese else f" (up to {anchored_to})"
+    return f" {phrase}"
+
+def _format_scalars(row: pd.Series, columns: list, metric: dict, routed: dict, vietnamese: bool) -> str:
+    window = _window_phrase(routed, vietnamese)
+    metric_name = _metric_name(metric, vietnamese)
+    last_date = metric["stats"].get("last_date")
+    last_date_note = ""
+    if last_date:
+        last_date_note = f"Dữ liệu của bạn có đến ngày {last_date}." if vietnamese else \
+            f"Your data goes up to {last_date}."
+    if all(pd.isna(row[column]) for column in columns):
+        answer = f"Không có dữ liệu {metric_name}{window}." if vietnamese else \
+            f"There is no {metric_name} data{window}."
+        return f"{answer} {last_date_note}".strip()
+
+    aggregate = routed.get("aggregate")
+    lines = []
+    for column in columns:
+        value = row[column]
+        if pd.isna(value):
+            continue
+        unit = "" if aggregate == "count" else _unit_label(metric, vietnamese)
+        per_day = str(column).endswith("_per_day")
+        suffix = (" mỗi ngày" if vietnamese else " per day") if per_day else ""
+        if aggregate == "count" and vietnamese and metric_name.startswith("buổi"):
+            label = f"Số {metric_name}"
+        elif aggregate in AGGREGATE_LABELS:
+            label = AGGREGATE_LABELS[aggregate][0 if vietnamese else 1]
+            label = f"{label} {metric_name}" if vietnamese else f"{label} {metric_name}".capitalize()
+        else:
+            label = str(column)
+        lines.append(f"**{label}**{suffix}{window}: **{_format_number(value)}**{' ' + unit if unit else ''}")
+
+    answer = "\n\n".join(lines)
+    if window and last_date_note and all(pd.isna(row[column]) or row[column] == 0 for column in columns):
+        answer += f"\n\n{last_date_note}"  # Nothing in the window - probably past the end of the data
+    context = _typical_context(float(row[columns[0]]) if not pd.isna(row[columns[0]]) else None,
+                               aggregate, str(columns[0]).endswith("_per_day"),
+                               metric, routed, vietnamese)
+    return answer + (f"\n\n{context}" if context else "")
+
+def _typical_context(value: float, aggregate: str, per_day: bool, metric: dict, routed: dict,
+                     vietnamese: bool) -> str:
+    """Compare a value with the user's usual level and the common reference range"""
+    if value is None or aggregate not in ("average", "total", "max", "min"):
+        return ""
+    stats = metric["stats"]
+    kind = routed.get("kind")
+    unit = _unit_label(metric, vietnamese)
+    lines = []
+    # The user's usual level: per-sample mean for measurements, per-day total for the rest
+    single_day = bool(routed.get("window")) and routed["window"]["type"] in ("today", "yesterday")
+    if aggregate == "average" and kind == "instant" and stats.get("value_mean") is not None:
+        usual = stats["value_mean"]
+    elif (per_day or (aggregate == "total" and single_day)) and stats.get("daily_total_mean") is not None:
+        usual = stats["daily_total_mean"]
+    else:
+        usual = None
+    if usual:
+        difference = (value - usual) / usual * 100
+        if abs(difference) < 1:
+            lines.append(f"📊 Mức thường ngày của bạn: {_format_number(usual)} {unit} (tương đương)." if vietnamese
+                         else f"📊 Your usual level: {_format_number(usual)} {unit} (about the same).")
+        elif vietnamese:
+            trend = "cao hơn" if difference > 0 else "thấp hơn"
+            lines.append(f"📊 Mức thường ngày của bạn: {_format_number(usual)} {unit} ({trend} {abs(difference):.0f}%).")
+        else:
+            trend = "above" if difference > 0 else "below"
+            lines.append(f"📊 Your usual level: {_format_number(usual)} {unit} ({abs(difference):.0f}% {trend}).")
+
+    reference = REFERENCE_RANGES.get(metric["word"])
+    if reference and (per_day or aggregate == "average" or single_day):
+        low, high, range_units, notes = reference
+        language = 0 if vietnamese else 1
+        label = "Tham khảo" if vietnamese else "Reference"
+        lines.append(f"💡 {label}: {_format_number(low)}–{_format_number(high)} {range_units[language]} "
+                     f"({notes[language]}).")
+    return "\n".join(lines)
+
+def _format_series(df: pd.DataFrame, date_column, value_column, metric: dict, routed: dict,
+                   vietnamese: bool) -> str:
+    values = df[value_column].dropna()
+    if values.empty:
+        return None
+    unit = _unit_label(metric, vietnamese)
+    unit_suffix = f" {unit}" if unit else ""
+    metric_name = _metric_name(metric, vietnamese)
+    window = _window_phrase(routed, vietnamese)
+
+    def day(value) -> str:
+        return pd.Timestamp(value).strftime("%Y-%m-%d") if not isinstance(value, str) else value
+
+    lines = [
+        f"- {day(row[date_column])}: {_format_number(row[value_column])}{unit_suffix}"
+        for _, row in df.iterrows() if not pd.isna(row[value_column])
+    ]
+    best = df.loc[values.idxmax()]
+    worst = df.loc[values.idxmin()]
+    if vietnamese:
+        header = f"📈 {metric_name.capitalize()} theo ngày{window}:"
+        summary = (f"Trung bình: **{_format_number(values.mean())}**{unit_suffix} · "
+                   f"cao nhất {_format_number(best[value_column])} ({day(best[date_column])}) · "
+                   f"thấp nhất {_format_number(worst[value_column])} ({day(worst[date_column])})")
+    else:
+        header = f"📈 {metric_name.capitalize()} by day{window}:"
+        summary = (f"Average: **{_format_number(values.mean())}**{unit_suffix} · "
+                   f"highest {_format_number(best[value_column])} ({day(best[date_column])}) · "
+                   f"lowest {_format_number(worst[value_column])} ({day(worst[date_column])})")
+    return f"{header}\n\n" + "\n".join(lines) + f"\n\n{summary}"
@@ -0,0 +1,69 @@
+"""
+Catalog Cache
+Per-user DuckDB catalog connections shared by all pages and sessions
+
+Streamlit runs every rerun on a fresh script thread, so the per-thread
+connections of health_catalog don't survive between reruns. Instead one
+read-only connection per user is kept in st.cache_resource and every rerun
+queries it through its own cursor. The connection is only reopened when the
+user's CSV files change (data fingerprint differs).
+"""
+import sys
+import threading
+from pathlib import Path
+import streamlit as st
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from health_catalog import compute_data_fingerprint, open_catalog
+
+class UserCatalog:
+    """Read-only connection to one user's catalog, reopened when the data changes"""
+
+    def __init__(self, storage_path: Path):
+        self.storage_path = storage_path
+        self.fingerprint = None
+        self.manifest = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def cursor(self, fingerprint: str) -> tuple:
+        """
+        Get a cursor on the catalog, reopening it first if the data changed
+
+        Args:
+            fingerprint: Current data fingerprint of the user's directory
+
+        Returns:
+            Tuple of (DuckDB cursor, manifest); close the cursor when done
+        """
+        with self._lock:
+            if self._conn is None or fingerprint != self.fingerprint:
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+                self._conn, self.manifest = open_catalog(self.storage_path)
+                self.fingerprint = fingerprint
+            return self._conn.cursor(), self.manifest
+
+@st.cache_resource(show_spinner=False)
+def _get_user_catalog(storage_key: str) -> UserCatalog:
+    return UserCatalog(Path(storage_key))
+
+def get_user_catalog(storage_path: Path) -> tuple:
+    """
+    Get a cursor on the user's catalog (building it first if needed)
+
+    Args:
+        storage_path: User's data directory
+
+    Returns:
+        Tuple of (DuckDB cursor, manifest). Close the cursor when done; the
+        shared connection behind it stays open for later reruns.
+    """
+    catalog = _get_user_catalog(str(storage_path.resolve()))
+    return catalog.cursor(compute_data_fingerprint(storage_path))
@@ -0,0 +1,91 @@
+"""
+Chart Store
+Chart data of chat messages, kept out of the MongoDB documents
+
+The full rows behind a chat chart are written to a per-user Parquet file
+(.healthsync/charts/<chart_id>.parquet) referenced by ID from the message;
+the message itself only keeps a small downsampled preview, so history reads
+stay light and charts still render instantly.
+"""
+import os
+import shutil
+import sys
+import uuid
+from pathlib import Path
+import pandas as pd
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from health_catalog import get_catalog_dir
+from components.charts import find_chart_columns, downsample_time_series
+
+CHARTS_DIR_NAME = "charts"
+# Max rows of the inline preview saved in the chat message
+CHART_PREVIEW_POINTS = int(os.getenv("HEALTHSYNC_CHART_PREVIEW_POINTS", "200"))
+
+def get_charts_dir(storage_path: Path) -> Path:
+    """Get directory holding chart data of chat messages"""
+    return get_catalog_dir(storage_path) / CHARTS_DIR_NAME
+
+def save_chart_data(storage_path: Path, df: pd.DataFrame) -> str:
+    """
+    Write the rows behind a chart (write temp file, then rename)
+
+    Args:
+        storage_path: User's data directory
+        df: Chart rows
+
+    Returns:
+        Chart ID to reference from the chat message, or None if it couldn't be written
+    """
+    chart_id = uuid.uuid4().hex
+    charts_dir = get_charts_dir(storage_path)
+    tmp_path = charts_dir / f"{chart_id}.parquet.tmp"
+    try:
+        charts_dir.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp_path, index=False, compression="zstd")
+        os.replace(tmp_path, charts_dir / f"{chart_id}.parquet")
+        return chart_id
+    except Exception as e:
+        print(f"Could not save chart data: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return None
+
+def load_chart_data(storage_path: Path, chart_id: str) -> pd.DataFrame:
+    """
+    Read the rows behind a chart
+
+    Returns:
+        DataFrame, or None if the chart data is gone (e.g. the user's data was cleared)
+    """
+    if not chart_id or not chart_id.isalnum():
+        return None
+    try:
+        return pd.read_parquet(get_charts_dir(storage_path) / f"{chart_id}.parquet")
+    except Exception:
+        return None
+
+def clear_chart_data(storage_path: Path):
+    """Delete the chart data of all chat messages of a user"""
+    shutil.rmtree(get_charts_dir(storage_path), ignore_errors=True)
+
+def chart_preview(df: pd.DataFrame, max_points: int = CHART_PREVIEW_POINTS) -> pd.DataFrame:
+    """
+    Downsample chart rows for the inline preview: time series with LTTB (keeps
+    peaks and dips), other rows evenly spaced (first and last kept)
+
+    Returns:
+        At most max_points rows
+    """
+    if len(df) <= max_points:
+        return df
+    date_col, value_col = find_chart_columns(df)
+    if date_col is not None and value_col is not None:
+        try:
+            series = df.assign(**{date_col: pd.to_datetime(df[date_col], errors='coerce')}).sort_values(date_col)
+            return df.loc[downsample_time_series(series, date_col, value_col, max_points).index]
+        except Exception as e:
+            print(f"Could not downsample chart preview: {e}")
+    positions = sorted({round(i * (len(df) - 1) / (max_points - 1)) for i in range(max_points)})
+    return df.iloc[positions]
@@ -0,0 +1,541 @@
+"""
+Chat Pipeline
+One chat turn as explicit async stages on a single event loop:
+schema -> plan (SQL) -> execute -> answer -> persist
+
+Independent work overlaps: the schema can be prefetched while the page
+renders (prefetch_schema), the user message is saved while the schema loads,
+the chart is built while the answer is generated, and the answer is saved
+while the result table and chart render.
+
+The pipeline never touches Streamlit directly - it reports through a ChatView,
+so the same turn runs headless (e.g. scripts/benchmark_chat.py with the stub
+LLM backend).
+"""
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from executor import submit_blocking
+from health_schema import get_health_schema, get_health_schema_sync
+from components.charts import render_chart_from_data
+from utils.direct_query import (
+    submit_query_direct, cancel_query_direct, result_to_dataframe, dataframe_to_records
+)
+from utils.quick_answers import answer_from_stats
+from utils.sql_cache import get_sql_cache
+from utils.intent_router import route_question
+from utils.answer_formatter import format_result_answer
+from utils.chart_store import save_chart_data, chart_preview
+
+# Rows per result page - larger results are paged from the server on demand
+RESULT_PAGE_SIZE = int(os.getenv("HEALTHSYNC_CHAT_PAGE_SIZE", "500"))
+# Seconds between query progress updates while a query runs
+QUERY_POLL_SECONDS = 0.2
+
+STAGES = ("schema", "plan", "execute", "answer", "persist")
+
+def prefetch_schema(user_id: str) -> Future:
+    """
+    Start loading a user's schema in the background (e.g. while the chat page renders)
+
+    Returns:
+        concurrent.futures.Future with the health_schema result, for ChatPipeline(schema_future=...)
+    """
+    return submit_blocking(get_health_schema_sync, user_id)
+
+class ChatView:
+    """
+    How a pipeline reports progress (the base class shows nothing)
+
+    The Streamlit chat page overrides these to render; headless runs (benchmarks)
+    use the base class.
+    """
+    def notice(self, level: str, text: str):
+        """Show a message ("info", "caption", "warning" or "error")"""
+
+    def show_sql(self, turn: "ChatTurn"):
+        """Show the SQL about to run (turn.sql, turn.sql_source)"""
+
+    def query_progress(self, seconds: float):
+        """Called while the query runs"""
+
+    def query_finished(self):
+        """Called when the query stopped running"""
+
+    def query_failed(self, turn: "ChatTurn"):
+        """Show a query error (turn.query_result)"""
+
+    def show_debug(self, turn: "ChatTurn"):
+        """Show details of the query result"""
+
+    def stream_answer(self, chunks) -> str:
+        """
+        Render answer chunks as they arrive
+
+        Returns:
+            Full answer text
+        """
+        return "".join(chunks)
+
+    def show_answer(self, turn: "ChatTurn"):
+        """Show the answer (unless turn.answer_streamed)"""
+
+    def show_result(self, turn: "ChatTurn"):
+        """Show the result table and chart (runs while the answer is saved)"""
+
+class ChatTurn:
+    """State of one chat turn, filled in stage by stage"""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.schema = None
+        self.answer = None
+        self.answer_source = None  # "stats", "template" (local phrasing), "llm" or "fallback"
+        self.answer_streamed = False  # already on the page
+        self.narrative_prompt = None  # LLM prompt for an optional narrative of a locally phrased answer
+        self.routed = None
+        self.cached_sql = None
+        self.sql = None
+        self.sql_source = None  # "template", "cache", "llm" or "placeholder"
+        self.query_result = None
+        self.result_df = None
+        self.row_count = 0
+        self.success = False
+        self.chart = None
+        self.error = None  # query error - the turn stops before answering
+        self.timings = {}  # stage -> seconds
+
+    @property
+    def has_data(self) -> bool:
+        return self.result_df is not None and not self.result_df.empty
+
+class ChatPipeline:
+    """
+    Runs chat turns for one user
+
+    Args:
+        user_id: User ID
+        storage_path: User's data directory
+        llm: LLM backend (see utils.llm_backend), or None to answer without AI
+        view: ChatView to report to (default: headless)
+        save_message: Function (user_id, role, content, chart_data=None, chart_id=None, chart_rows=None)
+            persisting messages (see utils.db.save_chat_message), or None
+        schema_future: Schema prefetched with prefetch_schema (optional)
+        page_size: Rows of the first result page
+    """
+
+    def __init__(self, user_id: str, storage_path: Path, llm=None, view: ChatView = None, save_message=None,
+                 schema_future: Future = None, page_size: int = RESULT_PAGE_SIZE):
+        self.user_id = user_id
+        self.storage_path = storage_path
+        self.llm = llm
+        self.view = view or ChatView()
+        self.save_message = save_message
+        self.schema_future = schema_future
+        self.page_size = page_size
+
+    async def run(self, question: str) -> ChatTurn:
+        """
+        Answer one question
+
+        Returns:
+            The finished ChatTurn (turn.error is set if the query failed)
+        """
+        turn = ChatTurn(question)
+        user_saved = self._in_background(self._save, "user", question)
+        try:
+            await self._stage(turn, "schema", self.load_schema)
+            if turn.answer is None:
+                await self._stage(turn, "plan", self.plan)
+            if turn.answer is None:
+                await self._stage(turn, "execute", self.execute)
+            if turn.error is None:
+                if turn.answer is None:
+                    await self._stage(turn, "answer", self.generate_answer)
+                self.view.show_answer(turn)
+                await self._stage(turn, "persist", self.persist)
+        finally:
+            await user_saved
+        return turn
+
+    async def _stage(self, turn: ChatTurn, name: str, stage):
+        started = time.perf_counter()
+        try:
+            await stage(turn)
+        finally:
+            turn.timings[name] = time.perf_counter() - started
+
+    def _in_background(self, func, *args, **kwargs) -> asyncio.Future:
+        """Start blocking work on a worker thread right away (await the result later)"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def _save(self, role: str, content: str, chart_df=None):
+        if not self.save_message:
+            return
+        if chart_df is None:
+            self.save_message(self.user_id, role, content)
+            return
+        # Only a downsampled preview goes into the message; the full rows go to the chart store
+        preview = chart_preview(chart_df)
+        chart_id = save_chart_data(self.storage_path, chart_df) if len(preview) < len(chart_df) else None
+        self.save_message(self.user_id, role, content, chart_data=dataframe_to_records(preview),
+                          chart_id=chart_id, chart_rows=len(chart_df))
+
+    async def load_schema(self, turn: ChatTurn):
+        """Stage 1: schema (prefetched if available); questions about the data itself are answered here"""
+        schema = None
+        if self.schema_future is not None:
+            try:
+                schema = await asyncio.wrap_future(self.schema_future)
+            except Exception as e:
+                print(f"Schema prefetch failed, loading again: {e}")
+        if schema is None:
+            schema = await get_health_schema(self.user_id)
+        if isinstance(schema, str):
+            schema = json.loads(schema)
+        turn.schema = schema
+
+        # Questions about the data itself (date range, sources, units) are answered
+        # from the statistics catalog, without generating or running SQL
+        quick_answer = answer_from_stats(turn.question, schema)
+        if quick_answer:
+            turn.answer = quick_answer
+            turn.answer_source = "stats"
+
+    async def plan(self, turn: ChatTurn):
+        """
+        Stage 2: SQL for the question
+        Common questions (metric + aggregate + date window) get SQL from local templates;
+        repeated and reworded questions reuse SQL that worked before; the rest ask the LLM
+        """
+        turn.routed = route_question(turn.question, turn.schema)
+        sql_cache = get_sql_cache(self.storage_path)
+        turn.cached_sql = None if turn.routed else sql_cache.lookup(turn.question, turn.schema)
+        if turn.routed:
+            turn.sql = turn.routed["sql"]
+            turn.sql_source = "template"
+        elif turn.cached_sql:
+            turn.sql = turn.cached_sql["sql"]
+            turn.sql_source = "cache"
+        elif self.llm:
+            try:
+                sql_response = await asyncio.to_thread(self.llm.generate, build_sql_prompt(turn.question, turn.schema))
+                if not sql_response:
+                    raise ValueError("No response from Gemini API for SQL generation")
+                turn.sql = clean_sql(sql_response)
+                turn.sql_source = "llm"
+            except Exception as gemini_error:
+                self.view.notice("error", f"❌ Lỗi khi tạo SQL query từ Gemini API: {str(gemini_error)}")
+                # Fallback to simple query
+                turn.sql = "SELECT * FROM steps LIMIT 10"
+                turn.sql_source = "placeholder"
+                self.view.notice("warning", "⚠️ Sử dụng SQL query mặc định do lỗi API")
+        else:
+            # Fallback: simple SQL generation
+            turn.sql = "SELECT * FROM steps LIMIT 10"  # Placeholder
+            turn.sql_source = "placeholder"
+            self.view.notice("warning", "Using placeholder SQL (Gemini not configured)")
+        self.view.show_sql(turn)
+
+    async def execute(self, turn: ChatTurn):
+        """
+        Stage 3: run the query on the tool thread pool
+        If the script is stopped while waiting (the user navigated away or sent a new
+        message), the query is cancelled instead of running on unattended
+        """
+        query_id = uuid.uuid4().hex
+        query_future = submit_query_direct(turn.sql, self.user_id, query_id, result_format="arrow",
+                                           page_size=self.page_size)
+        started = time.time()
+        waiting = asyncio.wrap_future(query_future)
+        try:
+            while True:
+                try:
+                    # Returns as soon as the query finishes; progress is updated in between
+                    query_result = await asyncio.wait_for(asyncio.shield(waiting), QUERY_POLL_SECONDS)
+                    break
+                except asyncio.TimeoutError:
+                    self.view.query_progress(time.time() - started)
+        finally:
+            self.view.query_finished()
+            if not query_future.done():
+                cancel_query_direct(query_id)
+
+        if isinstance(query_result, str):
+            query_result = json.loads(query_result)
+        turn.query_result = query_result
+        sql_cache = get_sql_cache(self.storage_path)
+        if "error" in query_result:
+            # Cached SQL that fails is never reused (timeouts and cancels aren't the SQL's fault)
+            if turn.sql_source == "cache" and query_result.get("error_type") not in ("timeout", "cancelled"):
+                sql_cache.evict(turn.sql)
+            turn.error = query_result["error"]
+            self.view.query_failed(turn)
+            return
+
+        # Build the DataFrame of the first page once - reused for the answer, table and chart
+        turn.result_df = result_to_dataframe(query_result)
+        turn.row_count = query_result.get("total_rows", query_result.get("row_count", 0))
+        turn.success = query_result.get("success", False)
+        if turn.success and turn.sql_source in ("llm", "cache"):
+            sql_cache.store(turn.question, turn.schema, turn.sql)
+        self.view.show_debug(turn)
+
+    async def generate_answer(self, turn: ChatTurn):
+        """
+        Stage 4: answer in natural language
+        Scalar and small daily results are phrased locally (the LLM narrative becomes
+        optional); the chart is built on a worker thread meanwhile
+        """
+        chart_task = self._in_background(render_chart_from_data, turn.result_df) if turn.has_data else None
+        try:
+            self._answer(turn)
+        finally:
+            if chart_task is not None:
+                try:
+                    turn.chart = await chart_task
+                except Exception as e:
+                    self.view.notice("warning", f"Could not render chart: {e}")
+        # Ensure answer is always set
+        if not turn.answer:
+            turn.answer = "Không thể tạo phản hồi. Vui lòng thử lại."
+
+    def _answer(self, turn: ChatTurn):
+        query_result = turn.query_result
+        fast_answer = format_result_answer(
+            turn.question, turn.result_df, turn.row_count, turn.routed, turn.schema
+        ) if turn.has_data else None
+
+        if self.llm and turn.has_data:
+            sample_rows = dataframe_to_records(turn.result_df, limit=10)
+            response_prompt = build_answer_prompt(turn, sample_rows)
+            if fast_answer:
+                turn.answer, turn.answer_source = fast_answer, "template"
+                turn.narrative_prompt = response_prompt
+                return
+            try:
+                turn.answer = self._stream(turn, response_prompt)
+                turn.answer_source = "llm"
+                if not turn.answer:
+                    turn.answer = "Không nhận được phản hồi từ AI. Vui lòng thử lại."
+            except Exception as gemini_error:
+                self.view.notice("error", f"❌ Lỗi khi gọi Gemini API: {str(gemini_error)}")
+                turn.answer = f"Tôi tìm thấy {turn.row_count} bản ghi. Dữ liệu:\n\n{json.dumps(sample_rows[:5], indent=2, ensure_ascii=False)}"
+        elif self.llm and turn.success:
+            actual_row_count = query_result.get("row_count", 0)
+            if actual_row_count > 0:
+                self.view.notice("info", f"⚠️ Phát hiện {actual_row_count} bản ghi nhưng format dữ liệu có thể không đúng. Đang xử lý...")
+                fallback = f"Truy vấn tìm thấy {actual_row_count} bản ghi, nhưng format dữ liệu có thể cần điều chỉnh."
+                response_prompt = f"""User asked: {turn.question}
+
+SQL query executed: {turn.sql}
+
+The query executed successfully and returned {actual_row_count} rows, but the data format might be different.
+
+Please provide a helpful response in Vietnamese explaining:
+1. The query found {actual_row_count} records
+2. But the data format might need adjustment
+3. Suggest the user check their query or try a different question
+
+Be positive and helpful.
+"""
+                error_fallback = f"{fallback} Vui lòng thử câu hỏi khác."
+            else:
+                fallback = "Truy vấn đã thực hiện thành công nhưng không có dữ liệu trả về phù hợp với tiêu chí."
+                response_prompt = f"""User asked: {turn.question}
+
+SQL query executed: {turn.sql}
+
+The query executed successfully but returned no data (0 rows).
+
+Please explain to the user in Vietnamese that:
+1. The query ran successfully
+2. But there is no data matching their criteria
+3. Suggest they might need to check their data or adjust their question
+"""
+                error_fallback = f"{fallback} Vui lòng thử câu hỏi khác hoặc kiểm tra lại dữ liệu."
+            try:
+                turn.answer = self._stream(turn, response_prompt) or fallback
+                turn.answer_source = "llm"
+            except Exception as gemini_error:
+                self.view.notice("warning", f"⚠️ Lỗi khi gọi Gemini API: {str(gemini_error)}")
+                turn.answer = error_fallback
+        else:
+            # Fallback response (when the LLM is not available)
+            turn.answer_source = "fallback"
+            if fast_answer:
+                turn.answer, turn.answer_source = fast_answer, "template"
+            elif turn.has_data:
+                turn.answer = f"Tôi tìm thấy {turn.row_count} bản ghi. Dữ liệu:\n\n{json.dumps(dataframe_to_records(turn.result_df, limit=5), indent=2, ensure_ascii=False)}"
+            elif query_result.get("success") and turn.row_count > 0:
+                turn.answer = f"Truy vấn thành công với {turn.row_count} bản ghi, nhưng dữ liệu chi tiết không có sẵn."
+            elif query_result.get("success"):
+                turn.answer = "Truy vấn đã thực hiện thành công nhưng không có dữ liệu trả về phù hợp với tiêu chí."
+            else:
+                turn.answer = f"Lỗi truy vấn: {query_result.get('error', 'Unknown error')}"
+
+    def _stream(self, turn: ChatTurn, response_prompt: str) -> str:
+        """Stream an LLM answer through the view (turn.answer_streamed once anything was shown)"""
+        answer = (self.view.stream_answer(self.llm.stream(response_prompt)) or "").strip()
+        turn.answer_streamed = bool(answer)
+        return answer
+
+    async def persist(self, turn: ChatTurn):
+        """Stage 5: save the answer (with the chart's data) while the result table and chart render"""
+        chart_df = turn.result_df if turn.chart is not None else None
+        saved = self._in_background(self._save, "assistant", turn.answer, chart_df)
+        try:
+            self.view.show_result(turn)
+        finally:
+            await saved
+
+def clean_sql(sql: str) -> str:
+    """Strip markdown code fences around generated SQL"""
+    sql = sql.strip()
+    if sql.startswith("```sql"):
+        sql = sql[6:]
+    if sql.startswith("```"):
+        sql = sql[3:]
+    if sql.endswith("```"):
+        sql = sql[:-3]
+    return sql.strip()
+
+def build_sql_prompt(prompt: str, schema_result: dict) -> str:
+    """Prompt asking the LLM for the DuckDB SQL answering a question"""
+    # Build table info for AI
+    tables_info = []
+    if isinstance(schema_result, dict) and schema_result.get('tables'):
+        for orig_name, table_info in schema_result['tables'].items():
+            if isinstance(table_info, dict):
+                table_name = table_info.get('table_name', orig_name)
+                escaped = table_info.get('escaped_name', f'"{table_name}"')
+                tables_info.append(f"{table_name} (use in SQL: {escaped})")
+
+    return f"""You are a SQL expert. Based on this health data schema:
+
+{json.dumps(schema_result, indent=2)}
+
+User question: {prompt}
+
+IMPORTANT RULES:
+1. Use the EXACT table names as shown in the schema (they may contain dashes and special characters)
+2. When querying multiple tables, you MUST use JOINs, not comma-separated tables in FROM
+3. Always qualify column names with table names when querying multiple tables (e.g., table1.value, table2.value)
+4. If you need data from multiple tables, use UNION ALL or separate queries, not comma-separated FROM
+5. Each table has a "value" column - you MUST qualify it with table name when multiple tables are involved
+6. **CRITICAL: Use the pre-typed columns every table has - never parse or cast the raw columns:**
+   - value_num (DOUBLE): numeric value of the sample - use it in SUM/AVG/MIN/MAX and arithmetic
+   - start_ts, end_ts (TIMESTAMPTZ): start/end time of the sample
+   - local_date (DATE): local calendar day of the sample - use it for per-day grouping and day filters
+   - Example: SELECT local_date, SUM(value_num) FROM "Table1" GROUP BY local_date
+   - Example: CAST(value AS DOUBLE) is WRONG, use value_num instead
+   - Example: TRY_CAST(startDate AS TIMESTAMPTZ) or strptime(startDate, ...) is WRONG, use start_ts instead
+7. **CRITICAL: Use DuckDB date functions:**
+   - Use: CURRENT_DATE - INTERVAL '7 days' (NOT DATE_SUB(CURRENT_DATE, INTERVAL 7 DAY))
+   - Use: CURRENT_DATE - INTERVAL '1 month' (NOT DATE_SUB(CURRENT_DATE, INTERVAL 1 MONTH))
+   - Use: CURRENT_TIMESTAMP - INTERVAL '1 hour' (NOT DATE_SUB(CURRENT_TIMESTAMP, INTERVAL 1 HOUR))
+   - Date arithmetic: local_date - INTERVAL 'N days', start_ts + INTERVAL 'N hours'
+   - Extract: EXTRACT(day FROM local_date), EXTRACT(month FROM local_date), EXTRACT(hour FROM start_ts)
+   - Date formatting: strftime(start_ts, '%Y-%m-%d')
+8. Each table's "stats" shows the dates it has data for (first_date, last_date), its units, sources and value range.
+   Only filter on dates inside that range - if the user asks about "last week" but last_date is older, use the last 7 days up to last_date instead of CURRENT_DATE
+
+Available tables:
+{chr(10).join(tables_info) if tables_info else 'No tables available'}
+
+Example of CORRECT query with date filtering:
+SELECT local_date, SUM(value_num) AS total
+FROM "Table1"
+WHERE local_date >= CURRENT_DATE - INTERVAL '7 days'
+GROUP BY local_date
+ORDER BY local_date
+
+Example of WRONG query (DO NOT DO THIS):
+SELECT * FROM "Table1" 
+WHERE startDate >= DATE_SUB(CURRENT_DATE, INTERVAL 7 DAY)  -- This will fail in DuckDB
+
+Example of CORRECT query with multiple tables:
+SELECT t1.local_date, AVG(t1.value_num) as heart_rate, SUM(t2.value_num) as steps
+FROM "Table1" t1
+JOIN "Table2" t2 ON t1.local_date = t2.local_date
+GROUP BY t1.local_date
+
+Example of WRONG query (DO NOT DO THIS):
+SELECT value FROM "Table1", "Table2"  -- This causes ambiguous column error
+
+Generate a SQL query to answer this question. Use the exact table names from the schema above.
+Use DuckDB date syntax (subtraction with INTERVAL, not DATE_SUB function).
+Only return the SQL query, nothing else. Do not include markdown code blocks, just the SQL query.
+"""
+
+# Readable meaning of well-known Apple Health tables, for the answer prompt
+METRIC_DESCRIPTIONS = [
+    (("HeartRate",), "Heart Rate (beats per minute)"),
+    (("Steps", "DistanceWalkingRunning"), "Steps / Walking Distance"),
+    (("ActiveEnergyBurned",), "Active Energy Burned (calories)"),
+    (("BasalEnergyBurned",), "Basal Energy Burned (calories)"),
+    (("Sleep",), "Sleep Data"),
+    (("BodyMass", "Weight"), "Body Weight (kg)"),
+    (("Height",), "Height (cm)"),
+    (("VO2Max",), "VO2 Max (cardiorespiratory fitness)"),
+    (("BodyFatPercentage",), "Body Fat Percentage (%)"),
+    (("RestingHeartRate",), "Resting Heart Rate (bpm)"),
+    (("FlightsClimbed",), "Flights Climbed"),
+]
+
+def build_answer_prompt(turn: ChatTurn, sample_rows: list) -> str:
+    """Prompt asking the LLM to explain a query result"""
+    # Get schema context for better understanding
+    schema_context = ""
+    if isinstance(turn.schema, dict) and turn.schema.get('tables'):
+        schema_context = "\n\nAvailable health data tables and their meanings:\n"
+        for table_name, table_info in turn.schema['tables'].items():
+            if isinstance(table_info, dict):
+                metric_type = next(
+                    (description for keys, description in METRIC_DESCRIPTIONS
+                     if any(key in table_name for key in keys)),
+                    table_name
+                )
+                columns = table_info.get('columns', [])
+                schema_context += f"- {table_name}: {metric_type}\n"
+                if columns:
+                    schema_context += f"  Columns: {', '.join(columns[:5])}\n"
+
+    # Build data summary
+    data_summary = f"\nColumns in result: {', '.join(map(str, turn.result_df.columns))}\n\n"
+    data_summary += "Sample data (first 10 rows):\n"
+    data_summary += json.dumps(sample_rows, indent=2)
+
+    return f"""You are a health data assistant helping users understand their Apple Health data.
+
+User's question: {turn.question}
+
+{schema_context}
+
+Query executed successfully. Results:
+{data_summary}
+
+Total rows returned: {turn.row_count}
+
+SQL query used: {turn.sql}
+
+Please provide a helpful, natural language answer in Vietnamese that:
+1. Directly answers the user's question
+2. Mentions specific numbers and values from the data
+3. Highlights key insights or trends if applicable
+4. Explains what the data means in the context of health and fitness
+5. Be concise but informative
+
+If the data shows health metrics, interpret them appropriately (e.g., heart rate ranges, step counts, etc.).
+"""
@@ -1,6 +1,6 @@
 """
 CSV Validator
-Validate and pre-load CSV files into DuckDB to ensure they're queryable
+Validate CSV files can be loaded into DuckDB and convert them to typed Parquet
 """
 import duckdb
 from pathlib import Path
@@ -10,19 +10,39 @@ import sys
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
 from table_utils import escape_table_name
+from health_catalog import ingest_table_parquet, get_storage_lock
+from executor import FILE_WORKERS, map_files, threads_per_file_worker
 
-def validate_csv_files(storage_path: Path, max_files: int = 10) -> dict:
+def _write_parquet(conn: duckdb.DuckDBPyConnection, source_table: str, csv_file: Path, storage_path: Path) -> dict:
+    """
+    Write a validated table as typed Parquet, returning fields for the validation entry
+    Re-uploaded files only append their new samples ("appended_rows")
+    """
+    try:
+        info = ingest_table_parquet(conn, source_table, csv_file, storage_path)
+        if "appended" in info:
+            return {"parquet": True, "appended_rows": info["appended"]}
+        return {"parquet": True}
+    except Exception as e:
+        return {"parquet": False, "parquet_error": str(e)[:200]}
+
+def validate_csv_files(storage_path: Path, max_files: int = None, workers: int = None) -> dict:
     """
     Validate CSV files can be loaded into DuckDB
+    Each validated file is also written as zstd-compressed Parquet
+    (value as DOUBLE, startDate/endDate as TIMESTAMPTZ) for fast queries;
+    files that were converted before only get their new samples appended.
+    Files are processed in parallel, each on its own DuckDB connection.
     
     Args:
         storage_path: Path to directory containing CSV files
-        max_files: Maximum number of files to validate (for performance)
+        max_files: Maximum number of files to validate (default: all)
+        workers: Files validated at the same time (default: HEALTHSYNC_FILE_WORKERS)
     
     Returns:
         Dictionary with validation results
     """
-    csv_files = list(storage_path.glob("*.csv"))
+    csv_files = sorted(storage_path.glob("*.csv"))
     
     if not csv_files:
         return {
@@ -32,91 +52,105 @@ def validate_csv_files(storage_path: Path, max_files: int = 10) -> dict:
             "failed": []
         }
     
-    conn = duckdb.connect()
-    validated = []
-    failed = []
+    files_to_validate = csv_files[:max_files] if max_files else csv_files
+    workers = max(1, min(workers or FILE_WORKERS, len(files_to_validate)))
+    threads = threads_per_file_worker(workers)
+    # Hold the user's storage lock so a catalog build or another upload can't
+    # rewrite the same Parquet parts meanwhile
+    with get_storage_lock(storage_path):
+        results = map_files(lambda csv_file: _validate_csv_file(csv_file, storage_path, threads),
+                            files_to_validate, workers)
     
+    validated = [entry for ok, entry in results if ok]
+    failed = [entry for ok, entry in results if not ok]
+    incremental = [entry for entry in validated if "appended_rows" in entry]
+    return {
+        "success": len(validated) > 0,
+        "validated": len(validated),
+        "incremental": len(incremental),
+        "appended_rows": sum(entry["appended_rows"] for entry in incremental),
+        "failed": len(failed),
+        "total_files": len(csv_files),
+        "validated_files": validated,
+        "failed_files": failed
+    }
+
+def _validate_csv_file(csv_file: Path, storage_path: Path, threads: int) -> tuple:
+    """
+    Validate one CSV file on its own DuckDB connection
+    
+    Returns:
+        Tuple of (True, validated entry) or (False, failed entry)
+    """
+    conn = duckdb.connect()
     try:
-        # Validate first few files (for performance)
-        files_to_validate = csv_files[:max_files]
+        conn.execute(f"SET threads TO {threads}")
+        original_name = csv_file.stem
+        # Keep original name, just escape it
+        escaped_name = escape_table_name(original_name)
+        
+        # Try to read CSV
+        csv_path = str(csv_file).replace("'", "''").replace("\\", "\\\\")
         
-        for csv_file in files_to_validate:
+        try:
+            # Try with read_csv_auto (auto-detects schema)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {escaped_name} AS 
+                SELECT * FROM read_csv_auto('{csv_path}')
+            """)
+            # Verify it worked
+            count = conn.execute(f"SELECT COUNT(*) FROM {escaped_name}").fetchone()[0]
+            return True, {
+                "file": csv_file.name,
+                "table_name": original_name,
+                "row_count": count,
+                "status": "success",
+                **_write_parquet(conn, original_name, csv_file, storage_path)
+            }
+        except Exception as csv_error:
+            # Try with pandas fallback (more forgiving with bad lines)
+            import pandas as pd
             try:
-                original_name = csv_file.stem
-                # Keep original name, just escape it
-                escaped_name = escape_table_name(original_name)
+                df = pd.read_csv(
+                    csv_file,
+                    on_bad_lines='skip',  # Skip bad lines
+                    engine='python',  # More forgiving
+                    quoting=1,
+                    escapechar='\\',
+                    encoding='utf-8',
+                    encoding_errors='replace',  # Replace encoding errors
+                    skipinitialspace=True,  # Skip spaces after delimiter
+                    skip_blank_lines=True  # Skip blank lines
+                )
+                df = df.dropna(how='all')
+                df = df[~df.isnull().all(axis=1)]
                 
-                # Try to read CSV
-                csv_path = str(csv_file).replace("'", "''").replace("\\", "\\\\")
-                
-                try:
-                    # Try with read_csv_auto (auto-detects schema)
-                    conn.execute(f"""
-                        CREATE TABLE IF NOT EXISTS {escaped_name} AS 
-                        SELECT * FROM read_csv_auto('{csv_path}')
-                    """)
-                    # Verify it worked
-                    count = conn.execute(f"SELECT COUNT(*) FROM {escaped_name}").fetchone()[0]
-                    validated.append({
+                if df.empty:
+                    return False, {
                         "file": csv_file.name,
-                        "table_name": original_name,
-                        "row_count": count,
-                        "status": "success"
-                    })
-                    # Clean up temp table
-                    conn.execute(f"DROP TABLE IF EXISTS {escaped_name}")
-                except Exception as csv_error:
-                    # Try with pandas fallback (more forgiving with bad lines)
-                    import pandas as pd
-                    try:
-                        df = pd.read_csv(
-                            csv_file,
-                            on_bad_lines='skip',  # Skip bad lines
-                            engine='python',  # More forgiving
-                            quoting=1,
-                            escapechar='\\',
-                            low_memory=False,
-                            encoding='utf-8',
-                            errors='replace',  # Replace encoding errors
-                            skipinitialspace=True,  # Skip spaces after delimiter
-                            skip_blank_lines=True  # Skip blank lines
-                        )
-                        df = df.dropna(how='all')
-                        df = df[~df.isnull().all(axis=1)]
-                        
-                        if not df.empty:
-                            validated.append({
-                                "file": csv_file.name,
-                                "table_name": original_name,
-                                "row_count": len(df),
-                                "status": "success (pandas)",
-                                "warning": "Some rows may have been skipped due to parsing errors"
-                            })
-                        else:
-                            failed.append({
-                                "file": csv_file.name,
-                                "error": "File is empty after cleaning"
-                            })
-                    except Exception as pandas_error:
-                        failed.append({
-                            "file": csv_file.name,
-                            "error": f"CSV error: {str(csv_error)[:100]}, Pandas error: {str(pandas_error)[:100]}"
-                        })
-            except Exception as e:
-                failed.append({
+                        "error": "File is empty after cleaning"
+                    }
+                temp_reg_name = f"temp_reg_{original_name.replace('-', '_').replace('.', '_')[:50]}"
+                conn.register(temp_reg_name, df)
+                parquet_result = _write_parquet(conn, temp_reg_name, csv_file, storage_path)
+                conn.unregister(temp_reg_name)
+                return True, {
                     "file": csv_file.name,
-                    "error": str(e)[:200]
-                })
-        
-        return {
-            "success": len(validated) > 0,
-            "validated": len(validated),
-            "failed": len(failed),
-            "total_files": len(csv_files),
-            "validated_files": validated,
-            "failed_files": failed
+                    "table_name": original_name,
+                    "row_count": len(df),
+                    "status": "success (pandas)",
+                    "warning": "Some rows may have been skipped due to parsing errors",
+                    **parquet_result
+                }
+            except Exception as pandas_error:
+                return False, {
+                    "file": csv_file.name,
+                    "error": f"CSV error: {str(csv_error)[:100]}, Pandas error: {str(pandas_error)[:100]}"
+                }
+    except Exception as e:
+        return False, {
+            "file": csv_file.name,
+            "error": str(e)[:200]
         }
-    
     finally:
         conn.close()
-
@@ -3,7 +3,9 @@ Database Utilities
 MongoDB connection and operations
 """
 import os
-from pymongo import MongoClient
+import threading
+from bson import ObjectId
+from pymongo import MongoClient, DESCENDING
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -13,19 +15,45 @@ load_dotenv()
 mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 db_name = os.getenv("MONGODB_DB", "healthsync")
 
+# Messages per chat history page (newest first, "load older" fetches the next page)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("HEALTHSYNC_CHAT_HISTORY_PAGE_SIZE", "20"))
+
+# MongoClient is thread-safe and pools connections - share one per process
+_client = None
+_client_lock = threading.Lock()
+
 def get_db():
     """Get MongoDB database instance"""
+    global _client
     try:
-        client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-        # Test connection
-        client.admin.command('ping')
-        return client[db_name]
+        with _client_lock:
+            if _client is None:
+                client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
+                # Test connection
+                client.admin.command('ping')
+                # Newest-first history pages of a user are read straight from this index
+                client[db_name].chat_messages.create_index(
+                    [("user_id", 1), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+                )
+                _client = client
+        return _client[db_name]
     except Exception as e:
         print(f"MongoDB connection error: {e}")
         raise
 
-def save_chat_message(user_id: str, role: str, content: str, chart_data: dict = None):
-    """Save chat message to MongoDB"""
+def save_chat_message(user_id: str, role: str, content: str, chart_data: list = None, chart_id: str = None,
+                      chart_rows: int = None):
+    """
+    Save chat message to MongoDB
+
+    Args:
+        user_id: User ID
+        role: "user" or "assistant"
+        content: Message text
+        chart_data: Rows rendered as the message's chart (a downsampled preview if chart_id is set)
+        chart_id: Chart store ID of the full chart rows (see utils.chart_store)
+        chart_rows: Row count of the full chart data
+    """
     try:
         db = get_db()
         message = {
@@ -33,32 +61,91 @@ def save_chat_message(user_id: str, role: str, content: str, chart_data: dict =
             "role": role,
             "content": content,
             "timestamp": datetime.now(),
-            "chart_data": chart_data
+            "chart_data": chart_data,
+            "chart_id": chart_id,
+            "chart_rows": chart_rows if chart_rows is not None else (len(chart_data) if chart_data else None),
+            "has_chart": bool(chart_data)
         }
         db.chat_messages.insert_one(message)
     except Exception as e:
         print(f"Error saving chat message: {e}")
 
-def get_chat_history(user_id: str, limit: int = 50):
-    """Get chat history for user"""
+def get_chat_history(user_id: str, limit: int = CHAT_HISTORY_PAGE_SIZE, before: str = None) -> dict:
+    """
+    Get a page of chat history, newest messages first (keyset pagination)
+    Chart payloads are left out - load them with get_chat_chart_data when shown.
+
+    Args:
+        user_id: User ID
+        limit: Messages per page
+        before: "older_cursor" of the previous page, to load older messages
+
+    Returns:
+        Dict with "messages" (oldest first, each with "_id", "role", "content",
+        "timestamp" and "has_chart") and "older_cursor" (None when no older messages)
+    """
     try:
         db = get_db()
-        messages = list(
-            db.chat_messages
-            .find({"user_id": user_id})
-            .sort("timestamp", 1)
-            .limit(limit)
-        )
-        # Convert ObjectId to string and remove chart_data for display
+        match = {"user_id": user_id}
+        if before:
+            timestamp, message_id = _parse_history_cursor(before)
+            match["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": message_id}}
+            ]
+        messages = list(db.chat_messages.aggregate([
+            {"$match": match},
+            {"$sort": {"timestamp": -1, "_id": -1}},
+            {"$limit": limit + 1},  # One extra tells whether older messages exist
+            {"$project": {
+                "role": 1,
+                "content": 1,
+                "timestamp": 1,
+                # Messages saved before has_chart existed: check the payload on the server
+                "has_chart": {"$ifNull": ["$has_chart", {"$gt": [{"$ifNull": ["$chart_data", None]}, None]}]}
+            }}
+        ]))
+        older_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            oldest = messages[-1]
+            older_cursor = f"{oldest['timestamp'].isoformat()}|{oldest['_id']}"
+        messages.reverse()
         for msg in messages:
             msg["_id"] = str(msg["_id"])
-            if "chart_data" in msg and msg["chart_data"]:
-                # Keep chart_data but it might be large
-                pass
-        return messages
+        return {"messages": messages, "older_cursor": older_cursor}
     except Exception as e:
         print(f"Error getting chat history: {e}")
-        return []
+        return {"messages": [], "older_cursor": None}
+
+def _parse_history_cursor(cursor: str) -> tuple:
+    timestamp, message_id = cursor.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), ObjectId(message_id)
+
+def get_chat_chart_data(user_id: str, message_id: str) -> dict:
+    """
+    Get the chart payload of one chat message
+
+    Returns:
+        Dict with "chart_data" (inline rows or preview), "chart_id" (full rows in
+        the chart store, if any) and "chart_rows", or None
+    """
+    try:
+        db = get_db()
+        message = db.chat_messages.find_one(
+            {"_id": ObjectId(message_id), "user_id": user_id},
+            {"chart_data": 1, "chart_id": 1, "chart_rows": 1}
+        )
+        if not message or not message.get("chart_data"):
+            return None
+        return {
+            "chart_data": message["chart_data"],
+            "chart_id": message.get("chart_id"),
+            "chart_rows": message.get("chart_rows") or len(message["chart_data"])
+        }
+    except Exception as e:
+        print(f"Error getting chart data: {e}")
+        return None
 
 def clear_chat_history(user_id: str):
     """Clear all chat history for user"""
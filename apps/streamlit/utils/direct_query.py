@@ -2,9 +2,12 @@
 Direct CSV Query Utilities
 Query CSV files directly using DuckDB without MCP server
 """
+import base64
 import duckdb
 import json
 import sys
+import pandas as pd
+from concurrent.futures import Future
 from pathlib import Path
 from datetime import datetime
 
@@ -15,7 +18,10 @@ sys.path.insert(0, str(mcp_tools_path))
 sys.path.insert(0, str(project_root / "packages" / "mcp_server"))
 
 from health_schema import get_health_schema
-from health_query import execute_health_query
+from health_query import (
+    execute_health_query, execute_health_query_sync, fetch_health_query_page_sync, cancel_query
+)
+from executor import submit_blocking
 
 def get_schema_direct(user_id: str) -> dict:
     """
@@ -30,17 +36,99 @@ def get_schema_direct(user_id: str) -> dict:
     import asyncio
     return asyncio.run(get_health_schema(user_id))
 
-def execute_query_direct(sql: str, user_id: str) -> dict:
+def execute_query_direct(sql: str, user_id: str, timeout: float = None, query_id: str = None,
+                         result_format: str = "rows") -> dict:
     """
     Execute SQL query directly on CSV files (without MCP)
     
     Args:
         sql: SQL query string
         user_id: User ID
+        timeout: Seconds before the query is interrupted (optional)
+        query_id: ID usable with cancel_query_direct (optional)
+        result_format: "rows", "columns" or "arrow" (see health_query)
     
     Returns:
         Query result dictionary
     """
     import asyncio
-    return asyncio.run(execute_health_query(sql, user_id))
+    return asyncio.run(execute_health_query(sql, user_id, timeout=timeout, query_id=query_id,
+                                            result_format=result_format))
 
+def submit_query_direct(sql: str, user_id: str, query_id: str, timeout: float = None,
+                        result_format: str = "rows", page_size: int = None) -> Future:
+    """
+    Start a query in the background
+    
+    Args:
+        sql: SQL query string
+        user_id: User ID
+        query_id: ID usable with cancel_query_direct
+        timeout: Seconds before the query is interrupted (optional)
+        result_format: "rows", "columns" or "arrow" (see health_query)
+        page_size: Return only the first page plus "next_cursor" (optional)
+    
+    Returns:
+        Future resolving to the query result dictionary
+    """
+    return submit_blocking(execute_health_query_sync, sql, user_id, None, timeout, query_id,
+                           result_format, page_size)
+
+def fetch_page_direct(cursor: str, user_id: str, result_format: str = "rows") -> dict:
+    """
+    Fetch another page of a paginated query result
+    
+    Args:
+        cursor: "next_cursor" or "prev_cursor" from a previous page
+        user_id: User ID
+        result_format: "rows", "columns" or "arrow" (see health_query)
+    
+    Returns:
+        Page result dictionary ("error_type": "expired" once the result is gone)
+    """
+    return fetch_health_query_page_sync(cursor, user_id, result_format)
+
+def cancel_query_direct(query_id: str) -> bool:
+    """
+    Cancel a query started with submit_query_direct or execute_query_direct
+    
+    Returns:
+        True if a running query was interrupted
+    """
+    return cancel_query(query_id)
+
+def result_to_dataframe(query_result: dict) -> pd.DataFrame:
+    """
+    Build a DataFrame from a health_query result (any result_format)
+    Build it once and reuse it for the table, chart and summary.
+    
+    Args:
+        query_result: Result dictionary from health_query
+    
+    Returns:
+        DataFrame, or None if the result has no data
+    """
+    if not query_result or "error" in query_result:
+        return None
+    
+    if query_result.get("arrow_ipc"):
+        import pyarrow as pa
+        reader = pa.ipc.open_stream(base64.b64decode(query_result["arrow_ipc"]))
+        return reader.read_all().to_pandas()
+    
+    data = query_result.get("data")
+    columns = query_result.get("columns") or None
+    if isinstance(data, dict):
+        return pd.DataFrame(data, columns=columns)
+    if isinstance(data, list):
+        return pd.DataFrame(data, columns=columns)
+    return None
+
+def dataframe_to_records(df: pd.DataFrame, limit: int = None) -> list:
+    """
+    Convert (the first `limit` rows of) a DataFrame to JSON-safe list of dicts
+    Timestamps become ISO strings and NumPy scalars plain Python values.
+    """
+    if limit is not None:
+        df = df.head(limit)
+    return json.loads(df.to_json(orient="records", date_format="iso"))
@@ -0,0 +1,284 @@
+"""
+Intent Router
+Turn common questions ("how many steps did I take last week?", "nhịp tim
+trung bình hôm qua?") into SQL locally, without asking Gemini
+
+A question is routed when it names exactly one metric table, an aggregate
+(total, average, max, min, count or a daily series) and optionally a date
+window (today, yesterday, last N days/weeks/months, this week/month/year), in
+English or Vietnamese. Every other word must be a neutral one ("how", "did",
+"my", "toi"...): a leftover date, month, weekday, number, comparison,
+condition or second metric ("in October", "more than 10000", "running",
+"during workouts") means the template would drop it, so the question returns
+None and goes to Gemini.
+"""
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from table_utils import escape_table_name
+from utils.quick_answers import normalize_text, table_words, question_words, METRIC_ALIASES, METRIC_WORDS
+
+# Aggregate words (normalized: lower-case, Vietnamese without accents)
+SERIES_WORDS = ["trend", "over time", "each day", "every day", "daily", "by day", "day by day", "chart", "plot",
+                "xu huong", "moi ngay", "tung ngay", "theo ngay", "hang ngay", "bieu do"]
+SHOW_WORDS = ["show", "list", "display", "see", "cho xem", "xem", "hien thi", "liet ke"]
+AVERAGE_WORDS = ["average", "avg", "mean", "on average", "trung binh"]
+MAX_WORDS = ["max", "maximum", "highest", "most", "peak", "best", "cao nhat", "nhieu nhat", "toi da"]
+MIN_WORDS = ["min", "minimum", "lowest", "least", "fewest", "thap nhat", "it nhat", "toi thieu"]
+TOTAL_WORDS = ["how many", "how much", "total", "sum", "in total", "bao nhieu", "tong", "tong cong", "duoc bao nhieu"]
+COUNT_WORDS = ["how many times", "how many sessions", "so lan", "may lan", "bao nhieu lan",
+               "bao nhieu buoi", "so buoi", "may buoi"]
+# "Number of" counts events (workouts) but adds up other metrics ("number of steps")
+NUMBER_WORDS = ["number of", "so luong"]
+
+AGGREGATE_PHRASES = {
+    "series": SERIES_WORDS + SHOW_WORDS,
+    "count": COUNT_WORDS + TOTAL_WORDS + NUMBER_WORDS,
+    "average": AVERAGE_WORDS,
+    "max": MAX_WORDS,
+    "min": MIN_WORDS,
+    "total": TOTAL_WORDS + NUMBER_WORDS
+}
+# Words that never change the SQL (anything else left over sends the question to Gemini)
+NEUTRAL_PHRASES = ["how many", "how much", "per day", "a day", "bao nhieu", "mot ngay", "chi so", "nhu the nao",
+                   "the nao", "ra sao"]
+NEUTRAL_WORDS = {
+    "what", "whats", "s", "was", "is", "are", "were", "my", "me", "i", "did", "do", "does", "have", "has", "had",
+    "take", "took", "taken", "walk", "walked", "get", "got", "make", "made", "burn", "burned", "burnt", "record",
+    "recorded", "log", "logged", "the", "a", "an", "of", "in", "on", "over", "for", "within", "data", "value",
+    "values", "level", "levels", "count", "number", "please", "can", "you", "tell", "give", "let", "see",
+    "toi", "cua", "la", "da", "duoc", "co", "trong", "so", "luong", "muc", "cho", "hay", "vay", "a", "nhe", "di"
+}
+
+# Metrics where each row is an event (counted) rather than a measurement
+EVENT_TABLE_WORDS = ["workout"]
+# Metrics measured at a point in time (averaged per day, never summed)
+INSTANT_TABLE_WORDS = ["heart", "mass", "weight", "height", "fat", "oxygen", "saturation", "vo2", "respiratory",
+                       "temperature", "pressure", "glucose", "variability", "bmi", "index"]
+
+WINDOW_UNITS = {
+    "day": "day", "days": "day", "ngay": "day",
+    "week": "week", "weeks": "week", "tuan": "week",
+    "month": "month", "months": "month", "thang": "month",
+    "year": "year", "years": "year", "nam": "year"
+}
+_UNIT_WORDS = "|".join(sorted(WINDOW_UNITS, key=len, reverse=True))
+_RECENT_VI = r"(?:qua|gan day|gan nhat|vua qua|truoc)"
+WINDOW_PATTERNS = [
+    ("today", re.compile(r" (?:today|hom nay) ")),
+    ("yesterday", re.compile(r" (?:yesterday|hom qua) ")),
+    ("rolling", re.compile(rf" (?:last|past|previous|recent) (?P<n>\d+) (?P<unit>{_UNIT_WORDS}) ")),
+    ("rolling", re.compile(rf" (?:trong )?(?P<n>\d+) (?P<unit>{_UNIT_WORDS}) {_RECENT_VI} ")),
+    ("rolling", re.compile(rf" trong (?P<n>\d+) (?P<unit>{_UNIT_WORDS}) ")),
+    ("rolling", re.compile(rf" (?:last|past|previous) (?P<unit>{_UNIT_WORDS}) ")),
+    ("rolling", re.compile(rf" (?P<unit>{_UNIT_WORDS}) {_RECENT_VI} ")),
+    ("to_date", re.compile(r" (?:this|current) (?P<unit>week|month|year) ")),
+    ("to_date", re.compile(r" (?P<unit>tuan|thang|nam) nay ")),
+]
+
+def route_question(question: str, schema_result: dict, today: date = None) -> dict:
+    """
+    Build SQL for a common question without the LLM
+
+    Args:
+        question: User's question
+        schema_result: health_schema result (tables with columns and "stats")
+        today: Current date (default: date.today())
+
+    Returns:
+        Dict with "sql", "table", "aggregate", "kind" ("event", "instant" or
+        "cumulative"), "window", "unit" and "anchored_to" (date rolling windows
+        end on when the data ends before today), or None if not recognized
+    """
+    all_tables = {
+        name: info for name, info in ((schema_result or {}).get("tables") or {}).items() if isinstance(info, dict)
+    }
+    tables = {
+        name: info for name, info in all_tables.items()
+        if {"local_date", "value_num"} <= set(info.get("columns", []))
+    }
+    if not tables:
+        return None
+    text = normalize_text(question)
+    table_name = _single_metric(text, all_tables)
+    if table_name not in tables:
+        return None
+    stats = tables[table_name].get("stats") or {}
+    kind = _metric_kind(table_name)
+
+    aggregate = _detect_aggregate(text, kind)
+    if not aggregate:
+        return None
+    if aggregate != "count" and stats and stats.get("value_max") is None:
+        return None  # Non-numeric values (e.g. sleep categories)
+    window, window_text = _detect_window(text)
+    if window_text is None:
+        return None
+    if _unused_words(text, table_name, AGGREGATE_PHRASES[aggregate], window_text):
+        return None  # A constraint the template can't express
+
+    # Rolling windows ("last 7 days") end on the last day with data when the data ends
+    # before today, so they cover the latest N days of data. Calendar windows (today,
+    # yesterday, this week/month/year) name real dates and are not moved: shifted, the
+    # answer would be about another day under the same label. When they're empty the
+    # answer notes the date the data ends instead (see answer_formatter).
+    today = today or date.today()
+    anchor = "CURRENT_DATE"
+    anchored_to = None
+    last_date = stats.get("last_date")
+    if window and window["type"] == "rolling" and last_date and \
+            re.fullmatch(r"\d{4}-\d{2}-\d{2}", last_date) and last_date < today.isoformat():
+        anchor = f"DATE '{last_date}'"
+        anchored_to = last_date
+
+    where = f" WHERE {_window_condition(window, anchor)}" if window else ""
+    sql = _aggregate_sql(aggregate, kind, escape_table_name(table_name), where)
+    return {
+        "sql": sql,
+        "table": table_name,
+        "aggregate": aggregate,
+        "kind": kind,
+        "window": window,
+        "unit": (stats.get("units") or [None])[0],
+        "anchored_to": anchored_to
+    }
+
+def _single_metric(text: str, tables: dict) -> str:
+    """
+    Table of the one metric a question names
+
+    Returns:
+        Table name, or None if no metric, more than one, or a metric without a table is named
+    """
+    words = question_words(text)
+    mentioned = {name: table_words(name) for name in tables if table_words(name) and table_words(name) <= words}
+    # "resting heart rate" also matches "heart rate" - keep the most specific tables
+    specific = [
+        name for name, name_words in mentioned.items()
+        if not any(name_words < other_words for other_words in mentioned.values())
+    ]
+    if len(specific) != 1:
+        return None
+    # Metric words outside the table's name ("heart rate during workouts" without a workout table)
+    if (words & METRIC_WORDS) - mentioned[specific[0]]:
+        return None
+    return specific[0]
+
+def _unused_words(text: str, table_name: str, aggregate_phrases: list, window_text: str) -> list:
+    """
+    Words of a question that neither the metric, the aggregate, the date window
+    nor NEUTRAL_WORDS account for
+
+    Returns:
+        List of leftover words ([] if the template answers the whole question)
+    """
+    metric_words = table_words(table_name)
+    phrases = [window_text] if window_text else []
+    phrases += aggregate_phrases + NEUTRAL_PHRASES
+    phrases += [alias for alias, metric in METRIC_ALIASES.items() if set(metric.split()) <= metric_words]
+    remaining = text
+    for phrase in sorted(phrases, key=len, reverse=True):
+        while f" {phrase} " in remaining:
+            remaining = remaining.replace(f" {phrase} ", " ")
+    return [
+        word for word in remaining.split()
+        if word not in NEUTRAL_WORDS and not question_words(f" {word} ") <= metric_words
+    ]
+
+def _metric_kind(table_name: str) -> str:
+    words = normalize_text(re.sub(r"([a-z])([A-Z])", r"\1 \2", table_name))
+    if any(word in words for word in EVENT_TABLE_WORDS):
+        return "event"
+    if any(word in words for word in INSTANT_TABLE_WORDS):
+        return "instant"
+    return "cumulative"
+
+def _contains_any(text: str, phrases: list) -> bool:
+    return any(f" {phrase} " in text for phrase in phrases)
+
+def _detect_aggregate(text: str, kind: str) -> str:
+    """
+    Aggregate a question asks for
+
+    Returns:
+        "series", "count", "average", "max", "min", "total" or None
+    """
+    if _contains_any(text, SERIES_WORDS):
+        return "series"
+    # Counting rows only means something for events or when asked for times/sessions
+    if _contains_any(text, COUNT_WORDS) or (kind == "event" and _contains_any(text, TOTAL_WORDS + NUMBER_WORDS)):
+        return "count"
+    if _contains_any(text, AVERAGE_WORDS):
+        return "average"
+    if _contains_any(text, MAX_WORDS):
+        return "max"
+    if _contains_any(text, MIN_WORDS):
+        return "min"
+    if _contains_any(text, TOTAL_WORDS + NUMBER_WORDS):
+        return "total" if kind != "instant" else None  # summing heart rate means nothing
+    if _contains_any(text, SHOW_WORDS):
+        return "series"
+    return None
+
+def _detect_window(text: str) -> tuple:
+    """
+    Date window a question names
+
+    Returns:
+        Tuple of ({"type": "today"|"yesterday"|"rolling"|"to_date", "n", "unit"}
+        or None for all data, matched text or "" if no window); the matched
+        text is None if the window is out of range
+    """
+    for window_type, pattern in WINDOW_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        unit = WINDOW_UNITS.get(groups.get("unit"), groups.get("unit"))
+        n = int(groups["n"]) if groups.get("n") else 1
+        if n <= 0 or n > 3650:
+            return None, None
+        return {"type": window_type, "n": n, "unit": unit}, match.group(0).strip()
+    return None, ""
+
+def _window_condition(window: dict, anchor: str) -> str:
+    if window["type"] == "today":
+        return "local_date = CURRENT_DATE"
+    if window["type"] == "yesterday":
+        return "local_date = CURRENT_DATE - INTERVAL '1 day'"
+    if window["type"] == "to_date":
+        return f"local_date >= date_trunc('{window['unit']}', CURRENT_DATE)"
+    return (
+        f"local_date > {anchor} - INTERVAL '{window['n']} {window['unit']}s' "
+        f"AND local_date <= {anchor}"
+    )
+
+def _aggregate_sql(aggregate: str, kind: str, table: str, where: str) -> str:
+    # Measurements are averaged per day, everything else adds up per day
+    daily = "AVG(value_num)" if kind == "instant" else "SUM(value_num)"
+    if aggregate == "series":
+        column = "average" if kind == "instant" else "total"
+        return (
+            f"SELECT local_date, {daily} AS {column} FROM {table}{where} "
+            f"GROUP BY local_date ORDER BY local_date"
+        )
+    if aggregate == "count":
+        return f"SELECT COUNT(*) AS count FROM {table}{where}"
+    if aggregate == "total":
+        return f"SELECT SUM(value_num) AS total FROM {table}{where}"
+    function = {"average": "AVG", "max": "MAX", "min": "MIN"}[aggregate]
+    if kind == "instant":
+        return f"SELECT {function}(value_num) AS {_result_name(aggregate)} FROM {table}{where}"
+    # Per-day figures of metrics that add up ("average steps" = average daily total)
+    return (
+        f"SELECT {function}(daily_total) AS {_result_name(aggregate)}_per_day FROM ("
+        f"SELECT local_date, SUM(value_num) AS daily_total FROM {table}{where} GROUP BY local_date)"
+    )
+
+def _result_name(aggregate: str) -> str:
+    return {"average": "average", "max": "maximum", "min": "minimum"}[aggregate]
@@ -0,0 +1,255 @@
+"""
+LLM Backend
+One interface for the chat page's LLM calls (SQL generation and answers)
+
+Backends are created once per process and shared, so the Gemini client (and
+its HTTP connections) is reused across chat turns. Every call goes through a
+concurrency limit, a timeout and retries with exponential backoff.
+
+HEALTHSYNC_LLM_BACKEND selects the backend:
+- "gemini" (default): Google Gemini, needs GEMINI_API_KEY
+- "stub": deterministic local backend with canned SQL and answers and a
+  configurable latency, for benchmarking the pipeline without network access
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+
+LLM_BACKEND = os.getenv("HEALTHSYNC_LLM_BACKEND", "gemini").lower()
+GEMINI_MODEL = os.getenv("HEALTHSYNC_GEMINI_MODEL", "gemini-2.5-flash")
+# Max LLM calls in flight per process (further calls wait for a slot)
+LLM_MAX_CONCURRENCY = int(os.getenv("HEALTHSYNC_LLM_CONCURRENCY", "4"))
+# Seconds before an LLM call is abandoned
+LLM_TIMEOUT = float(os.getenv("HEALTHSYNC_LLM_TIMEOUT", "60"))
+# Retries of failed calls (rate limits, timeouts, server errors), with exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("HEALTHSYNC_LLM_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("HEALTHSYNC_LLM_BACKOFF", "1.0"))
+# Stub backend: seconds before the first token and between streamed chunks
+STUB_LATENCY_SECONDS = float(os.getenv("HEALTHSYNC_LLM_STUB_LATENCY", "0.5"))
+STUB_CHUNK_SECONDS = float(os.getenv("HEALTHSYNC_LLM_STUB_CHUNK_DELAY", "0.02"))
+
+# Errors worth retrying (matched by exception class name, so no client library is needed to import this)
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+    "GatewayTimeout", "Aborted", "TimeoutError", "ConnectionError", "RetryError"
+}
+
+class LLMError(Exception):
+    """LLM call failed after all retries"""
+
+class LLMBackend:
+    """
+    Base class of LLM backends
+
+    Subclasses implement _generate(prompt, timeout) and _stream(prompt, timeout);
+    callers use generate() and stream(), which add the concurrency limit and retries.
+    """
+    name = "llm"
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff: float = LLM_BACKOFF_SECONDS):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def generate(self, prompt: str) -> str:
+        """
+        Generate a complete response
+
+        Args:
+            prompt: Prompt text
+
+        Returns:
+            Response text ("" if the model returned nothing)
+
+        Raises:
+            LLMError: If every attempt failed
+        """
+        return self._with_retries(lambda: self._generate(prompt, self.timeout))
+
+    def stream(self, prompt: str):
+        """
+        Generate a response chunk by chunk
+
+        Failed calls are retried only until the first chunk arrives (a partial
+        answer can't be taken back).
+
+        Yields:
+            Text chunks
+
+        Raises:
+            LLMError: If every attempt failed
+        """
+        if not self._acquire():
+            raise LLMError(f"{self.name}: no free slot within {self.timeout:.0f}s")
+        try:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    for chunk in self._stream(prompt, self.timeout):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started or not self._should_retry(e, attempt):
+                        raise LLMError(f"{self.name}: {e}") from e
+                    self._sleep_before_retry(e, attempt)
+                    attempt += 1
+        finally:
+            self._slots.release()
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def _stream(self, prompt: str, timeout: float):
+        raise NotImplementedError
+
+    def _acquire(self) -> bool:
+        return self._slots.acquire(timeout=self.timeout)
+
+    def _with_retries(self, call):
+        if not self._acquire():
+            raise LLMError(f"{self.name}: no free slot within {self.timeout:.0f}s")
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return call()
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        raise LLMError(f"{self.name}: {e}") from e
+                    self._sleep_before_retry(e, attempt)
+                    attempt += 1
+        finally:
+            self._slots.release()
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+    def _sleep_before_retry(self, error: Exception, attempt: int):
+        # Exponential backoff with jitter, so concurrent sessions don't retry in lockstep
+        delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        print(f"{self.name} call failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini (one GenerativeModel shared by all chat sessions)"""
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = GEMINI_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model_name = model
+        self._model = genai.GenerativeModel(model)
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        response = self._model.generate_content(prompt, request_options={"timeout": timeout})
+        try:
+            return (response.text or "").strip() if response else ""
+        except ValueError:
+            return ""  # No text (e.g. blocked by safety filters)
+
+    def _stream(self, prompt: str, timeout: float):
+        response = self._model.generate_content(prompt, stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunks without text (e.g. safety stops)
+            if text:
+                yield text
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic local backend: the same prompt always gets the same response
+
+    SQL prompts get a daily-total query over the table the question names (else
+    the first table listed); other prompts get a canned Vietnamese answer.
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = STUB_LATENCY_SECONDS, chunk_delay: float = STUB_CHUNK_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        time.sleep(min(self.latency, timeout))
+        return self._response(prompt)
+
+    def _stream(self, prompt: str, timeout: float):
+        time.sleep(min(self.latency, timeout))
+        for chunk in re.findall(r"\S+\s*", self._response(prompt)):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield chunk
+
+    def _response(self, prompt: str) -> str:
+        question_match = re.search(r"User(?:'s)? (?:question|asked): (.*)", prompt)
+        question = question_match.group(1).strip() if question_match else ""
+        if "Generate a SQL query" in prompt:
+            return self._sql(prompt, question)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        rows = re.search(r"Total rows returned: (\d+)", prompt)
+        row_text = f" {rows.group(1)} bản ghi" if rows else ""
+        return (
+            f"[stub {digest}] Đây là câu trả lời mẫu cho câu hỏi \"{question}\". "
+            f"Truy vấn đã trả về{row_text or ' kết quả'}; câu trả lời thật sẽ do mô hình AI tạo."
+        )
+
+    def _sql(self, prompt: str, question: str) -> str:
+        # 'StepCount (use in SQL: "StepCount")' lines of the SQL prompt
+        tables = re.findall(r"^(.+?) \(use in SQL: (.+)\)$", prompt, flags=re.MULTILINE)
+        if not tables:
+            return "SELECT 1 AS value"
+        words = {word.rstrip("s") for word in re.findall(r"[a-z]+", question.lower())}
+        escaped = next(
+            (escaped for name, escaped in tables
+             if any(len(word) > 2 and word.lower().rstrip("s") in words
+                    for word in re.findall(r"[A-Z]?[a-z]+", name))),
+            tables[0][1]
+        )
+        return (
+            f"SELECT local_date, SUM(value_num) AS total FROM {escaped} "
+            f"GROUP BY local_date ORDER BY local_date DESC LIMIT 7"
+        )
+
+_backends = {}  # backend name -> shared instance
+_backends_lock = threading.Lock()
+
+def get_llm_backend(name: str = None) -> LLMBackend:
+    """
+    Get the shared LLM backend (created on first use)
+
+    Args:
+        name: "gemini" or "stub" (default: HEALTHSYNC_LLM_BACKEND)
+
+    Returns:
+        Backend instance, or None if it isn't configured (no GEMINI_API_KEY)
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    name = (name or LLM_BACKEND).lower()
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == "stub":
+                backend = StubBackend()
+            elif name == "gemini":
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    return None
+                backend = GeminiBackend(api_key)
+            else:
+                raise ValueError(f"Unknown LLM backend: {name} (expected 'gemini' or 'stub')")
+            _backends[name] = backend
+        return backend
@@ -15,7 +15,7 @@ sys.path.insert(0, str(mcp_tools_path))
 sys.path.insert(0, str(project_root / "packages" / "mcp_server"))
 
 from health_schema import get_health_schema
-from health_query import execute_health_query
+from health_query import execute_health_query, fetch_health_query_page, cancel_query
 from user_context import get_user_context
 
 class MCPHealthClientSimple:
@@ -38,8 +38,24 @@ class MCPHealthClientSimple:
             elif tool_name == "health_query":
                 sql = arguments.get("sql", "")
                 user_id = arguments.get("user_id", "default")
-                result = await execute_health_query(sql, user_id)
+                result = await execute_health_query(
+                    sql,
+                    user_id,
+                    timeout=arguments.get("timeout"),
+                    query_id=arguments.get("query_id"),
+                    result_format=arguments.get("result_format", "rows"),
+                    page_size=arguments.get("page_size")
+                )
                 return result
+            elif tool_name == "health_query_page":
+                return await fetch_health_query_page(
+                    arguments.get("cursor", ""),
+                    arguments.get("user_id", "default"),
+                    arguments.get("result_format", "rows")
+                )
+            elif tool_name == "health_query_cancel":
+                query_id = arguments.get("query_id", "")
+                return {"success": True, "query_id": query_id, "cancelled": cancel_query(query_id)}
             elif tool_name == "get_user_context":
                 user_id = arguments.get("user_id", "default")
                 result = await get_user_context(user_id)
@@ -0,0 +1,203 @@
+"""
+Quick Answers
+Answer simple questions about the data itself ("when does my data start?",
+"which devices recorded my heart rate?") from the per-table statistics in
+the health_schema result, without generating or running SQL
+"""
+import re
+import unicodedata
+
+# Words that make a question about the data itself (Vietnamese without accents)
+DATA_WORDS = ["data", "record", "records", "du lieu", "ban ghi", "so lieu"]
+
+# Questions about values need a real query
+VALUE_WORDS = [
+    "average", "avg", "mean", "total", "sum", "how many", "how much", "highest", "lowest", "max", "min",
+    "trung binh", "tong", "bao nhieu", "cao nhat", "thap nhat", "nhieu nhat", "it nhat"
+]
+
+# Only explicit phrasings about when the data starts or ends: bare "first", "last",
+# "start" or "gan nhat" also appear in value questions ("my sleep data for the last week")
+INTENT_PATTERNS = {
+    "range": ["date range", "time range", "what period", "which period", "cover", "span", "how far back",
+              "khoang thoi gian", "pham vi", "tu ngay nao den ngay nao", "tu khi nao den khi nao"],
+    "start": ["data start", "data starts", "data begin", "data begins", "records start", "records begin",
+              "first record", "earliest record", "oldest record", "first date", "earliest date", "since when",
+              "bat dau tu ngay nao", "bat dau tu khi nao", "bat dau tu bao gio", "bat dau khi nao",
+              "tu ngay nao", "tu khi nao", "tu bao gio", "ban ghi dau tien", "ban ghi cu nhat"],
+    "end": ["data end", "data ends", "records end", "last record", "latest record", "most recent record",
+            "last date", "latest date", "last updated", "until when", "up to date",
+            "co den ngay nao", "den ngay nao", "den khi nao", "den bao gio", "ket thuc khi nao",
+            "ket thuc ngay nao", "ban ghi cuoi cung", "ban ghi moi nhat", "cap nhat den"],
+    "sources": ["source", "sources", "device", "devices", "which app", "nguon", "thiet bi", "ung dung"],
+    "units": ["unit", "units", "don vi"],
+    "metrics": ["what data", "which data", "what metrics", "which metrics", "which tables", "what tables",
+                "du lieu gi", "chi so nao", "nhung chi so", "loai du lieu", "bang nao"]
+}
+# Intents that are ambiguous without a data word ("heart rate on the last date" is a value question)
+NEEDS_DATA_WORD = {"start", "end", "range"}
+
+# A date window ("last 7 days", "this month", "in January", "since March", "tuan nay")
+# asks about values in that window, which the whole-table statistics can't answer
+TIME_WINDOW_PATTERN = re.compile(
+    r" (?:today|yesterday|tonight|ago|day|days|week|weeks|weekend|weekends|month|months|year|years|quarter"
+    r"|since(?! when )|january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec|\d+"
+    r"|hom nay|hom qua|tuan|thang|nam|quy|ngay(?! nao )) "
+)
+
+# Metric names users say -> words found in table names
+METRIC_ALIASES = {
+    "buoc chan": "step", "buoc": "step", "nhip tim": "heart rate", "giac ngu": "sleep", "ngu": "sleep",
+    "can nang": "body mass", "calo": "energy", "nang luong": "energy", "quang duong": "distance",
+    "tap luyen": "workout", "bai tap": "workout", "chieu cao": "height", "mo co the": "body fat",
+    "weight": "body mass", "calorie": "energy", "calories": "energy", "walking": "distance"
+}
+# Health metric words - a question naming one we have no table for isn't about all data
+METRIC_WORDS = {
+    "step", "heart", "sleep", "energy", "distance", "workout", "height", "body", "fat", "oxygen", "vo2",
+    "hrv", "flight", "stand", "exercise", "blood", "pressure", "glucose", "respiratory", "temperature",
+    "water", "mindful", "mass", "bmi"
+}
+
+# Prefixes of Apple Health type identifiers, dropped when matching table names
+TABLE_NAME_PREFIXES = ["HKQuantityTypeIdentifier", "HKCategoryTypeIdentifier", "HKDataType", "HKWorkoutType"]
+
+MAX_LISTED_TABLES = 10
+
+def answer_from_stats(question: str, schema_result: dict) -> str:
+    """
+    Answer a question about the data's date range, sources, units or metrics
+
+    Args:
+        question: User's question
+        schema_result: health_schema result (tables with "stats")
+
+    Returns:
+        Answer text (Vietnamese), or None if the question needs a query
+    """
+    tables = (schema_result or {}).get("tables") or {}
+    tables = {name: info for name, info in tables.items() if isinstance(info, dict) and info.get("stats")}
+    if not tables:
+        return None
+
+    text = normalize_text(question)
+    if _contains_any(text, VALUE_WORDS) or TIME_WINDOW_PATTERN.search(text):
+        return None
+    intent = _detect_intent(text)
+    if not intent:
+        return None
+
+    mentioned = find_mentioned_tables(text, tables)
+    if mentioned is None:
+        return None  # Asks about a metric we don't have - let the query path explain
+    selected = {name: tables[name] for name in mentioned} if mentioned else tables
+    return _format_answer(intent, selected, focused=bool(mentioned))
+
+def normalize_text(text: str) -> str:
+    """Lower-case, drop Vietnamese accents and punctuation"""
+    text = text.lower().replace("đ", "d")
+    text = "".join(ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn")
+    return " " + re.sub(r"[^a-z0-9]+", " ", text).strip() + " "
+
+def _contains_any(text: str, phrases: list) -> bool:
+    return any(f" {phrase} " in text for phrase in phrases)
+
+def _detect_intent(text: str) -> str:
+    has_data_word = _contains_any(text, DATA_WORDS)
+    for intent, phrases in INTENT_PATTERNS.items():
+        if _contains_any(text, phrases) and (has_data_word or intent not in NEEDS_DATA_WORD):
+            return intent
+    return None
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+def table_words(table_name: str) -> set:
+    """Words of a table name: HKQuantityTypeIdentifierHeartRate -> {"heart", "rate"}"""
+    for prefix in TABLE_NAME_PREFIXES:
+        if table_name.startswith(prefix):
+            table_name = table_name[len(prefix):]
+            break
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", table_name)
+    return {_stem(word.lower()) for word in words}
+
+def question_words(text: str) -> set:
+    """Stemmed words of a normalized question, plus the table-name words of metric aliases it uses"""
+    words = {_stem(word) for word in text.split()}
+    for alias, metric in METRIC_ALIASES.items():
+        if f" {alias} " in text:
+            words |= {_stem(word) for word in metric.split()}
+    return words
+
+def find_mentioned_tables(text: str, tables: dict) -> list:
+    """
+    Tables the question names
+
+    Args:
+        text: Question normalized with normalize_text
+        tables: Dict of table name -> schema info
+
+    Returns:
+        List of table names ([] if no metric is named, None if a named metric has no table)
+    """
+    words = question_words(text)
+    mentioned = [name for name in tables if table_words(name) and table_words(name) <= words]
+    if mentioned:
+        # "heart rate" shouldn't also pick "resting heart rate" when the plain metric exists
+        smallest = min(len(table_words(name)) for name in mentioned)
+        return [name for name in mentioned if len(table_words(name)) == smallest]
+    if words & METRIC_WORDS:
+        return None
+    return []
+
+def _format_answer(intent: str, tables: dict, focused: bool) -> str:
+    stats = {name: info["stats"] for name, info in tables.items()}
+    dated = {name: s for name, s in stats.items() if s.get("first_date")}
+    label = f" **{', '.join(tables)}**" if focused else ""
+
+    if intent in ("start", "end", "range"):
+        if not dated:
+            return None
+        first_date = min(s["first_date"] for s in dated.values())
+        last_date = max(s["last_date"] for s in dated.values())
+        if intent == "start":
+            answer = f"📅 Dữ liệu{label} của bạn bắt đầu từ ngày **{first_date}**."
+        elif intent == "end":
+            answer = f"📅 Dữ liệu{label} của bạn có đến ngày **{last_date}**."
+        else:
+            answer = f"📅 Dữ liệu{label} của bạn từ ngày **{first_date}** đến ngày **{last_date}**."
+        if len(dated) > 1:
+            lines = [
+                f"- {name}: {s['first_date']} → {s['last_date']} ({s.get('days_with_data', 0)} ngày có dữ liệu)"
+                for name, s in sorted(dated.items(), key=lambda item: item[1]["first_date"])
+            ]
+            answer += "\n\n" + _limited_lines(lines)
+        else:
+            s = next(iter(dated.values()))
+            answer += f" Có {s.get('days_with_data', 0)} ngày có dữ liệu."
+        return answer
+
+    if intent in ("sources", "units"):
+        key = intent
+        title = "📱 Nguồn dữ liệu" if intent == "sources" else "📏 Đơn vị đo"
+        lines = [f"- {name}: {', '.join(s[key])}" for name, s in stats.items() if s.get(key)]
+        if not lines:
+            return None
+        if len(lines) == 1:
+            return f"{title}{label}: {lines[0].split(': ', 1)[1]}"
+        return f"{title}:\n\n" + _limited_lines(lines)
+
+    # metrics
+    lines = []
+    for name, info in sorted(tables.items()):
+        s = info["stats"]
+        period = f", {s['first_date']} → {s['last_date']}" if s.get("first_date") else ""
+        lines.append(f"- {name}: {info.get('row_count') or 0:,} bản ghi{period}")
+    return f"📊 Bạn có {len(tables)} loại dữ liệu:\n\n" + _limited_lines(lines)
+
+def _limited_lines(lines: list) -> str:
+    shown = lines[:MAX_LISTED_TABLES]
+    if len(lines) > MAX_LISTED_TABLES:
+        shown.append(f"- ... và {len(lines) - MAX_LISTED_TABLES} bảng khác")
+    return "\n".join(shown)
@@ -0,0 +1,218 @@
+"""
+SQL Cache
+Generated SQL keyed by normalized question and schema fingerprint, so repeated
+and reworded questions skip the Gemini round trip
+
+Questions are matched exactly after normalization: lower-cased, punctuation
+and filler words dropped ("show me", "please", "tôi"...), plurals stemmed, so
+"Show me my steps last week" reuses the SQL of "steps last week?". They must
+also name exactly the same guard tokens - metrics (words of the schema's table
+names), numbers, dates, months, weekdays, time windows, aggregates,
+comparisons and negations - so "steps in October" never reuses "steps in
+November" and "less than 10000 steps" never reuses "more than 10000 steps".
+Entries are saved per user in .healthsync/sql_cache.json and evicted when
+their SQL fails.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+# Add MCP tools to path for imports
+project_root = Path(__file__).parent.parent.parent.parent
+sys.path.insert(0, str(project_root / "packages" / "mcp_server" / "tools"))
+from health_catalog import get_catalog_dir
+
+SQL_CACHE_FILE_NAME = "sql_cache.json"
+# Max cached questions per user (least recently used are dropped first)
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("HEALTHSYNC_SQL_CACHE_ENTRIES", "200"))
+
+# Words that change the SQL even when the rest of the question is the same
+GUARD_WORDS = [
+    # Time windows and periods
+    "today", "yesterday", "day", "days", "week", "weeks", "month", "months", "year", "years", "hour", "hours",
+    "morning", "afternoon", "evening", "night", "weekend", "weekends", "weekday", "weekdays",
+    "last", "past", "previous", "this", "next", "since", "before", "after", "between", "until", "ago",
+    "hôm nay", "hôm qua", "ngày", "tuần", "tháng", "năm", "giờ", "sáng", "chiều", "tối", "đêm", "cuối tuần",
+    "trước", "qua", "này", "từ", "đến",
+    # Months
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    # Weekdays
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "mon", "tue", "tues", "wed", "thu", "thur", "thurs", "fri", "sat", "sun",
+    "thứ hai", "thứ ba", "thứ tư", "thứ năm", "thứ sáu", "thứ bảy", "chủ nhật", "thứ",
+    # Aggregates
+    "average", "avg", "mean", "median", "total", "sum", "max", "maximum", "highest", "peak", "most",
+    "min", "minimum", "lowest", "least", "count", "trend", "per", "each", "daily", "weekly", "monthly",
+    "trung bình", "tổng", "cao nhất", "thấp nhất", "nhiều nhất", "ít nhất", "mỗi", "xu hướng",
+    # Comparisons and conditions
+    "more", "less", "fewer", "greater", "higher", "lower", "above", "below", "over", "under", "than",
+    "exceed", "exceeded", "exceeding", "equal", "at least", "at most", "compare", "compared", "versus", "vs",
+    "during", "with", "without", "when", "while", "only",
+    "hơn", "trên", "dưới", "vượt", "so với", "so sánh", "khi", "trong khi", "có", "chỉ",
+    # Negations
+    "not", "no", "never", "none", "nor", "didn", "don", "doesn", "isn", "wasn", "aren", "weren",
+    "haven", "hasn", "hadn", "won", "wouldn", "couldn", "can t", "cannot",
+    "không", "chưa", "chẳng", "chả", "đừng",
+    # Number words
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+    "twenty", "thirty", "fifty", "hundred", "thousand", "million", "half", "first", "second", "third",
+    "một", "hai", "ba", "bốn", "tư", "lăm", "sáu", "bảy", "tám", "chín", "mười", "trăm", "nghìn", "ngàn", "triệu"
+]
+
+# Words dropped before matching (they never change the SQL)
+FILLER_WORDS = {
+    "please", "can", "could", "would", "you", "tell", "show", "give", "let", "see", "me", "i", "my", "mine",
+    "the", "a", "an", "hey", "hi", "hãy", "cho", "tôi", "mình", "xem", "giúp", "của", "vui", "lòng", "làm", "ơn"
+}
+
+def normalize_question(question: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace"""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+def canonical_question(normalized: str) -> str:
+    """Normalized question without filler words and with plurals stemmed (the cache's match key)"""
+    return " ".join(_stem(word) for word in normalized.split() if word not in FILLER_WORDS)
+
+def schema_fingerprint(schema_result: dict) -> str:
+    """
+    Fingerprint of the tables and columns in a health_schema result
+    (new rows don't change it, new or renamed tables/columns do)
+    """
+    tables = (schema_result or {}).get("tables") or {}
+    signature = sorted(
+        (name, sorted(info.get("columns", []))) for name, info in tables.items() if isinstance(info, dict)
+    )
+    return hashlib.sha1(json.dumps(signature).encode("utf-8")).hexdigest()
+
+def schema_vocabulary(schema_result: dict) -> set:
+    """Words of the table names in a health_schema result (HeartRate -> "heart", "rate")"""
+    words = set()
+    for name in ((schema_result or {}).get("tables") or {}):
+        for word in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+", name):
+            if len(word) > 2:
+                words.add(_stem(word.lower()))
+    return words
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def _guard_tokens(normalized: str, vocabulary: set) -> list:
+    """Numbers, guard words and metric words of a normalized question"""
+    padded = f" {normalized} "
+    tokens = set(re.findall(r"\d+", normalized))
+    tokens |= {word for word in GUARD_WORDS if f" {word} " in padded}
+    tokens |= {_stem(word) for word in normalized.split()} & vocabulary
+    return sorted(tokens)
+
+class SqlCache:
+    """Per-user cache of generated SQL, persisted as JSON"""
+
+    def __init__(self, path: Path, max_entries: int = SQL_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # "<schema fp>:<canonical question>" -> entry, least recently used first
+        self._lock = threading.Lock()
+        self._load()
+
+    def lookup(self, question: str, schema_result: dict) -> dict:
+        """
+        Find cached SQL for a question
+
+        Args:
+            question: User's question
+            schema_result: health_schema result the SQL would be generated from
+
+        Returns:
+            Dict with "sql", "match" ("exact", or "similar" when only the
+            wording differs) and the cached "question", or None if not cached
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        schema_fp = schema_fingerprint(schema_result)
+        key = f"{schema_fp}:{canonical_question(normalized)}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or entry.get("guard") != _guard_tokens(normalized, schema_vocabulary(schema_result)):
+                return None
+            self._entries.move_to_end(key)
+            match = "exact" if entry["question"] == normalized else "similar"
+            return {"sql": entry["sql"], "match": match, "question": entry["question"]}
+
+    def store(self, question: str, schema_result: dict, sql: str):
+        """Cache the SQL that answered a question"""
+        normalized = normalize_question(question)
+        if not normalized or not sql:
+            return
+        schema_fp = schema_fingerprint(schema_result)
+        key = f"{schema_fp}:{canonical_question(normalized)}"
+        with self._lock:
+            self._entries[key] = {
+                "question": normalized,
+                "schema": schema_fp,
+                "guard": _guard_tokens(normalized, schema_vocabulary(schema_result)),
+                "sql": sql,
+                "created": time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def evict(self, sql: str) -> int:
+        """
+        Drop every cached question answered by a SQL query (e.g. after it failed)
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry["sql"] == sql]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._save()
+            return len(keys)
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f).get("entries", [])
+        except Exception:
+            return
+        for entry in entries:
+            if all(field in entry for field in ("question", "schema", "sql")):
+                self._entries[f"{entry['schema']}:{canonical_question(entry['question'])}"] = entry
+
+    def _save(self):
+        """Write entries atomically (caller holds the lock)"""
+        tmp_path = self.path.parent / f"{SQL_CACHE_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"entries": list(self._entries.values())}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save SQL cache: {e}")
+
+_caches = {}  # cache file path -> SqlCache
+_caches_lock = threading.Lock()
+
+def get_sql_cache(storage_path: Path) -> SqlCache:
+    """Get the SQL cache of a user's data directory (loaded once per process)"""
+    path = get_catalog_dir(storage_path) / SQL_CACHE_FILE_NAME
+    key = str(path.resolve())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or not path.parent.exists():
+            # Data directory was cleared - start over
+            cache = _caches[key] = SqlCache(path)
+        return cache
@@ -13,7 +13,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from tools.health_schema import get_health_schema
-from tools.health_query import execute_health_query
+from tools.health_query import execute_health_query, fetch_health_query_page, cancel_query
 from tools.user_context import get_user_context
 
 app = Server("healthsync-mcp")
@@ -49,11 +49,65 @@ async def list_tools() -> list[Tool]:
                     "user_id": {
                         "type": "string",
                         "description": "User ID whose data to query"
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": "Seconds before the query is interrupted (optional, default 30)"
+                    },
+                    "query_id": {
+                        "type": "string",
+                        "description": "Client-chosen ID so the query can be cancelled with health_query_cancel (optional)"
+                    },
+                    "result_format": {
+                        "type": "string",
+                        "enum": ["rows", "columns", "arrow"],
+                        "description": "Result layout: rows (list of objects, default), columns (object of arrays) or arrow (base64 Arrow IPC stream in arrow_ipc)"
+                    },
+                    "page_size": {
+                        "type": "integer",
+                        "description": "Return only the first page_size rows plus next_cursor; fetch further pages with health_query_page (optional)"
                     }
                 },
                 "required": ["sql", "user_id"]
             }
         ),
+        Tool(
+            name="health_query_page",
+            description="Fetch another page of a paginated health_query result using its next_cursor/prev_cursor. Cursors expire after a few minutes of inactivity.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor or prev_cursor from a previous page"
+                    },
+                    "user_id": {
+                        "type": "string",
+                        "description": "User ID the query was run for"
+                    },
+                    "result_format": {
+                        "type": "string",
+                        "enum": ["rows", "columns", "arrow"],
+                        "description": "Result layout (same as health_query)"
+                    }
+                },
+                "required": ["cursor", "user_id"]
+            }
+        ),
+        Tool(
+            name="health_query_cancel",
+            description="Cancel a running health_query by the query_id it was started with.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query_id": {
+                        "type": "string",
+                        "description": "query_id passed to health_query"
+                    }
+                },
+                "required": ["query_id"]
+            }
+        ),
         Tool(
             name="get_user_context",
             description="Get user preferences and context from MongoDB. Returns user profile information.",
@@ -84,9 +138,31 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
             user_id = arguments.get("user_id", "default")
             if not sql:
                 return [TextContent(type="text", text='{"error": "SQL query is required"}')]
-            result = await execute_health_query(sql, user_id)
+            result = await execute_health_query(
+                sql,
+                user_id,
+                timeout=arguments.get("timeout"),
+                query_id=arguments.get("query_id"),
+                result_format=arguments.get("result_format", "rows"),
+                page_size=arguments.get("page_size")
+            )
             return [TextContent(type="text", text=str(result))]
         
+        elif name == "health_query_page":
+            cursor = arguments.get("cursor", "")
+            user_id = arguments.get("user_id", "default")
+            if not cursor:
+                return [TextContent(type="text", text='{"error": "cursor is required"}')]
+            result = await fetch_health_query_page(cursor, user_id, arguments.get("result_format", "rows"))
+            return [TextContent(type="text", text=str(result))]
+        
+        elif name == "health_query_cancel":
+            query_id = arguments.get("query_id", "")
+            if not query_id:
+                return [TextContent(type="text", text='{"error": "query_id is required"}')]
+            cancelled = cancel_query(query_id)
+            return [TextContent(type="text", text=str({"success": True, "query_id": query_id, "cancelled": cancelled}))]
+        
         elif name == "get_user_context":
             user_id = arguments.get("user_id", "default")
             result = await get_user_context(user_id)
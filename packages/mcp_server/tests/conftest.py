@@ -0,0 +1,37 @@
+"""
+Shared fixtures for the MCP server tool tests
+Tools are imported as flat modules, like server.py does
+"""
+import sys
+from pathlib import Path
+import pytest
+
+tools_dir = Path(__file__).parent.parent / "tools"
+sys.path.insert(0, str(tools_dir))
+
+CSV_HEADER = "startDate,endDate,value,unit,sourceName\n"
+
+@pytest.fixture
+def write_steps_csv():
+    """Write a steps CSV with `per_day` samples per day for consecutive days of January 2025"""
+    def write(path: Path, days: int, per_day: int = 4, start_day: int = 1, value: int = 100) -> Path:
+        rows = []
+        for day in range(start_day, start_day + days):
+            for hour in range(per_day):
+                rows.append(
+                    f"2025-01-{day:02d} {hour + 8:02d}:00:00 +0000,"
+                    f"2025-01-{day:02d} {hour + 8:02d}:30:00 +0000,{value},count,iPhone\n"
+                )
+        path.write_text(CSV_HEADER + "".join(rows))
+        return path
+    return write
+
+@pytest.fixture
+def user_storage(tmp_path, monkeypatch):
+    """Point health_query at a temporary user data directory"""
+    import health_query
+    user_id = "pytest_user"
+    storage_path = tmp_path / user_id
+    storage_path.mkdir()
+    monkeypatch.setattr(health_query, "get_user_storage_path", lambda _user_id: tmp_path / _user_id)
+    return user_id, storage_path
@@ -0,0 +1,59 @@
+"""Tests for incremental Parquet ingestion of re-uploaded CSV files"""
+import duckdb
+import pytest
+import health_catalog
+from health_catalog import convert_csv_to_parquet, get_parquet_dir, get_rollup_path
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    yield conn
+    conn.close()
+
+def _stored_rows(conn, storage_path, table_name="steps") -> int:
+    parquet_glob = str(get_parquet_dir(storage_path, table_name) / "*.parquet")
+    return conn.execute(f"SELECT COUNT(*) FROM read_parquet('{parquet_glob}')").fetchone()[0]
+
+def test_reupload_appends_only_new_samples(tmp_path, conn, write_steps_csv):
+    csv_file = write_steps_csv(tmp_path / "steps.csv", days=5)
+    first = convert_csv_to_parquet(conn, csv_file, tmp_path)
+    assert first["row_count"] == 20 and "appended" not in first
+
+    # Re-export covering days 1-8: days 1-5 are already stored
+    write_steps_csv(csv_file, days=8)
+    second = convert_csv_to_parquet(conn, csv_file, tmp_path)
+    assert second["appended"] == 12
+    assert second["row_count"] == 32
+    assert _stored_rows(conn, tmp_path) == 32
+
+    rollup = str(get_rollup_path(tmp_path, "steps"))
+    daily = conn.execute(f"SELECT local_date, value_sum FROM read_parquet('{rollup}') ORDER BY 1").fetchall()
+    assert len(daily) == 8
+    assert {value_sum for _, value_sum in daily} == {400}
+
+def test_identical_reupload_appends_nothing(tmp_path, conn, write_steps_csv):
+    csv_file = write_steps_csv(tmp_path / "steps.csv", days=3)
+    convert_csv_to_parquet(conn, csv_file, tmp_path)
+    csv_file.write_text(csv_file.read_text())  # new signature, same samples
+    info = convert_csv_to_parquet(conn, csv_file, tmp_path)
+    assert info["appended"] == 0
+    assert _stored_rows(conn, tmp_path) == 12
+
+def test_changed_values_are_new_samples(tmp_path, conn, write_steps_csv):
+    csv_file = write_steps_csv(tmp_path / "steps.csv", days=3)
+    convert_csv_to_parquet(conn, csv_file, tmp_path)
+    write_steps_csv(csv_file, days=3, value=250)  # same times, corrected values
+    info = convert_csv_to_parquet(conn, csv_file, tmp_path)
+    # value is part of the sample key, so corrected values are appended next to the old ones
+    assert info["appended"] == 12
+    assert _stored_rows(conn, tmp_path) == 24
+
+def test_parts_are_compacted_without_losing_rows(tmp_path, conn, write_steps_csv, monkeypatch):
+    monkeypatch.setattr(health_catalog, "MAX_PARQUET_PARTS", 2)
+    csv_file = tmp_path / "steps.csv"
+    for days in range(1, 5):
+        write_steps_csv(csv_file, days=days)
+        convert_csv_to_parquet(conn, csv_file, tmp_path)
+    parts = list(get_parquet_dir(tmp_path, "steps").glob("*.parquet"))
+    assert len(parts) <= 2
+    assert _stored_rows(conn, tmp_path) == 16
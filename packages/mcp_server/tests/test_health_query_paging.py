@@ -0,0 +1,52 @@
+"""Tests for paged health_query results"""
+import pytest
+from health_query import execute_health_query_sync, fetch_health_query_page_sync
+from result_cache import result_cache
+from result_store import get_results_dir
+
+@pytest.fixture(autouse=True)
+def empty_result_cache():
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+def test_cursor_walks_every_page_in_order(user_storage, write_steps_csv):
+    user_id, storage_path = user_storage
+    write_steps_csv(storage_path / "steps.csv", days=30, per_day=10)
+    sql = 'SELECT startDate, value FROM "steps" ORDER BY startDate'
+
+    first = execute_health_query_sync(sql, user_id, page_size=70)
+    assert first["total_rows"] == 300 and first["row_count"] == 70
+    assert first["prev_cursor"] is None
+    rows, cursor, pages = list(first["data"]), first["next_cursor"], 1
+    while cursor:
+        page = fetch_health_query_page_sync(cursor, user_id)
+        rows.extend(page["data"])
+        cursor, pages = page["next_cursor"], pages + 1
+        assert page["prev_cursor"] is not None
+    assert pages == 5
+    assert rows == execute_health_query_sync(sql, user_id)["data"]
+
+def test_small_paged_result_is_returned_whole_and_cached(user_storage, write_steps_csv):
+    user_id, storage_path = user_storage
+    write_steps_csv(storage_path / "steps.csv", days=3)
+    sql = 'SELECT SUM(value_num) AS total FROM "steps"'
+
+    first = execute_health_query_sync(sql, user_id, page_size=50)
+    assert first["data"] == [{"total": 1200.0}]
+    assert "next_cursor" not in first and not first.get("cached")
+    assert not list(get_results_dir(storage_path).glob("*.parquet"))  # no result file left behind
+
+    assert execute_health_query_sync(sql, user_id, page_size=50)["cached"] is True
+    assert execute_health_query_sync(sql, user_id)["cached"] is True  # same key unpaged
+
+def test_cursor_of_another_user_is_rejected(user_storage, write_steps_csv):
+    user_id, storage_path = user_storage
+    write_steps_csv(storage_path / "steps.csv", days=10)
+    first = execute_health_query_sync('SELECT * FROM "steps"', user_id, page_size=10)
+    page = fetch_health_query_page_sync(first["next_cursor"], "someone_else")
+    assert page["error_type"] == "expired"
+
+def test_invalid_cursor_is_an_error(user_storage):
+    user_id, _ = user_storage
+    assert "error" in fetch_health_query_page_sync("not-a-cursor", user_id)
@@ -0,0 +1,42 @@
+"""Tests for the health_query result cache"""
+import time
+from result_cache import QueryResultCache, normalize_query, get_result_ttl
+
+def test_key_ignores_whitespace_case_and_semicolons():
+    key = QueryResultCache.make_key("u1", 'SELECT  SUM(value_num)\n FROM "Steps";', "fp")
+    assert key == QueryResultCache.make_key("u1", 'select sum(value_num) from "Steps"', "fp")
+
+def test_key_keeps_literals_and_quoted_names():
+    assert normalize_query("SELECT * FROM \"Steps\" WHERE sourceName = 'iPhone'") == \
+        "select * from \"Steps\" where sourcename = 'iPhone'"
+    assert QueryResultCache.make_key("u1", "SELECT 'A'", "fp") != QueryResultCache.make_key("u1", "SELECT 'a'", "fp")
+
+def test_key_changes_with_user_data_and_format():
+    key = QueryResultCache.make_key("u1", "SELECT 1", "fp1")
+    assert key != QueryResultCache.make_key("u2", "SELECT 1", "fp1")
+    assert key != QueryResultCache.make_key("u1", "SELECT 1", "fp2")
+    assert key != QueryResultCache.make_key("u1", "SELECT 1", "fp1", "columns")
+
+def test_invalidate_user_drops_only_that_user():
+    cache = QueryResultCache()
+    cache.put(("u1", "q", "fp", "rows"), {"data": [1]})
+    cache.put(("u2", "q", "fp", "rows"), {"data": [2]})
+    assert cache.invalidate_user("u1") == 1
+    assert cache.get(("u1", "q", "fp", "rows")) is None
+    assert cache.get(("u2", "q", "fp", "rows")) == {"data": [2]}
+
+def test_expired_and_evicted_entries_are_gone():
+    cache = QueryResultCache(max_entries=2)
+    cache.put("old", {"data": 1}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("old") is None
+    cache.put("a", {"data": 1})
+    cache.put("b", {"data": 2})
+    cache.get("a")
+    cache.put("c", {"data": 3})  # evicts b, the least recently used
+    assert cache.get("b") is None and cache.get("a") == {"data": 1}
+
+def test_clock_dependent_queries_expire():
+    assert get_result_ttl("SELECT SUM(value_num) FROM steps") is None
+    assert 0 < get_result_ttl("SELECT * FROM steps WHERE local_date = CURRENT_DATE") <= 86400
+    assert get_result_ttl("SELECT NOW()") > 0
@@ -0,0 +1,52 @@
+"""Tests for routing aggregate queries to the daily rollup views"""
+import pytest
+from rollup_router import route_to_rollup, name_result_columns
+from health_catalog import build_catalog, open_catalog
+
+ROLLUPS = {"steps": "steps__daily"}
+
+@pytest.mark.parametrize("sql, expected", [
+    ('SELECT SUM(value_num) AS total FROM "steps"',
+     'SELECT SUM(value_sum) AS total FROM "steps__daily" AS "steps"'),
+    ('SELECT AVG(value_num) FROM "steps"',
+     'SELECT (SUM(value_sum) / NULLIF(SUM(value_count), 0)) FROM "steps__daily" AS "steps"'),
+    ('SELECT COUNT(*) FROM "steps"',
+     'SELECT CAST(COALESCE(SUM(sample_count), 0) AS BIGINT) FROM "steps__daily" AS "steps"'),
+    ("SELECT local_date, MAX(value_num) AS peak FROM \"steps\" WHERE local_date >= DATE '2025-01-01' "
+     "GROUP BY local_date ORDER BY local_date",
+     "SELECT local_date, MAX(value_max) AS peak FROM \"steps__daily\" AS \"steps\" WHERE local_date >= "
+     "DATE '2025-01-01' GROUP BY local_date ORDER BY local_date"),
+])
+def test_rewrites_daily_aggregates(sql, expected):
+    assert route_to_rollup(sql, ROLLUPS) == expected
+
+@pytest.mark.parametrize("sql", [
+    'SELECT * FROM "steps"',  # not an aggregate
+    "SELECT SUM(value_num) FROM \"steps\" WHERE sourceName = 'iPhone'",  # column the rollup doesn't keep
+    "SELECT date_trunc('hour', start_ts), SUM(value_num) FROM \"steps\" GROUP BY 1",  # finer than a day
+    'SELECT COUNT(DISTINCT local_date) FROM "steps"',
+    'SELECT SUM(s.value_num) FROM "steps" s JOIN "heart_rate" h ON s.local_date = h.local_date',
+    'WITH t AS (SELECT * FROM "steps") SELECT SUM(value_num) FROM t',
+    'SELECT SUM(value_num) FROM "heart_rate"',  # no rollup
+])
+def test_rejects_queries_the_rollup_cannot_answer(sql):
+    assert route_to_rollup(sql, ROLLUPS) is None
+
+def test_rejects_everything_without_rollups():
+    assert route_to_rollup('SELECT SUM(value_num) FROM "steps"', {}) is None
+
+def test_routed_query_returns_the_same_result(tmp_path, write_steps_csv):
+    write_steps_csv(tmp_path / "steps.csv", days=10)
+    manifest = build_catalog(tmp_path)
+    rollups = {name: info["rollup"] for name, info in manifest["tables"].items() if info.get("rollup")}
+    conn, _ = open_catalog(tmp_path)
+    try:
+        for sql in ['SELECT SUM(value_num), AVG(value_num), COUNT(*) FROM "steps"',
+                    'SELECT local_date, SUM(value_num) AS total FROM "steps" GROUP BY local_date ORDER BY local_date']:
+            routed = route_to_rollup(sql, rollups)
+            assert routed is not None
+            column_names = [row[0] for row in conn.execute(f"DESCRIBE {sql}").fetchall()]
+            routed = name_result_columns(routed, column_names)
+            assert conn.execute(routed).df().equals(conn.execute(sql).df())
+    finally:
+        conn.close()
@@ -0,0 +1,26 @@
+"""Tests for rewriting casts and date parsing to the pre-typed view columns"""
+from sql_fixer import use_typed_value_column, use_typed_date_columns, fix_value_column_casting
+
+VIEW_COLUMNS = {"value_num", "start_ts", "end_ts", "local_date"}
+
+def test_numeric_casts_of_value_use_value_num():
+    sql = 'SELECT AVG(CAST(value AS DOUBLE)), SUM(s.value::DOUBLE), MAX(TRY_CAST("steps".value AS DECIMAL(10, 2))) FROM steps s'
+    assert use_typed_value_column(sql) == 'SELECT AVG(value_num), SUM(s.value_num), MAX("steps".value_num) FROM steps s'
+
+def test_casts_to_other_types_are_kept():
+    sql = "SELECT CAST(value AS VARCHAR) FROM sleep"
+    assert use_typed_value_column(sql) == sql
+
+def test_date_parsing_uses_typed_columns():
+    sql = "SELECT DATE(startDate), CAST(endDate AS DATE), strptime(t.startDate, '%Y-%m-%d %H:%M:%S %z') FROM t"
+    assert use_typed_date_columns(sql, VIEW_COLUMNS) == \
+        "SELECT local_date, CAST(end_ts AS DATE), t.start_ts FROM t"
+
+def test_date_parsing_is_kept_without_typed_columns():
+    sql = "SELECT DATE(startDate), startDate::TIMESTAMPTZ FROM t"
+    assert use_typed_date_columns(sql, set()) == sql
+
+def test_value_aggregates_use_value_num_or_cast():
+    assert fix_value_column_casting("SELECT AVG(value) FROM t", None, True) == "SELECT AVG(value_num) FROM t"
+    assert fix_value_column_casting("SELECT AVG(value) FROM t", None, False) == \
+        "SELECT AVG(CAST(value AS DOUBLE)) FROM t"
@@ -0,0 +1,64 @@
+"""
+Tool executor
+Runs blocking tool work (DuckDB, pandas, pymongo) on a bounded thread pool
+so the MCP event loop keeps serving other tool calls
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Max tool calls running at the same time (configurable via environment)
+MAX_WORKERS = int(os.getenv("HEALTHSYNC_MAX_WORKERS", str(min(8, os.cpu_count() or 4))))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="healthsync-tool")
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the tool thread pool
+
+    Args:
+        func: Function to run
+        *args, **kwargs: Arguments passed to the function
+
+    Returns:
+        Function result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def submit_blocking(func, *args, **kwargs) -> Future:
+    """
+    Start a blocking function on the tool thread pool from synchronous code
+
+    Returns:
+        concurrent.futures.Future with the function result
+    """
+    return _executor.submit(func, *args, **kwargs)
+
+# Files described, validated or converted at the same time (configurable via environment)
+FILE_WORKERS = int(os.getenv("HEALTHSYNC_FILE_WORKERS", str(min(8, os.cpu_count() or 4))))
+
+def map_files(func, files: list, workers: int = None) -> list:
+    """
+    Run a per-file function over many files in parallel
+    Uses its own short-lived pool (not the tool pool), so it is safe to call
+    from a tool call that is already running on a tool thread.
+
+    Args:
+        func: Function taking one file
+        files: Files to process
+        workers: Max files processed at the same time (default: HEALTHSYNC_FILE_WORKERS)
+
+    Returns:
+        List of results in the same order as files
+    """
+    workers = max(1, min(workers or FILE_WORKERS, len(files)))
+    if workers == 1:
+        return [func(file) for file in files]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="healthsync-file") as pool:
+        return list(pool.map(func, files))
+
+def threads_per_file_worker(workers: int = None) -> int:
+    """DuckDB threads each per-file connection gets, so parallel files share the CPUs"""
+    return max(1, (os.cpu_count() or 4) // max(1, workers or FILE_WORKERS))
@@ -0,0 +1,980 @@
+"""
+Health data catalog
+Typed Parquet copies of the user's CSV files, and a persistent per-user
+DuckDB database exposing them as tables
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+import duckdb
+
+# Add tools directory to path for imports
+tools_dir = Path(__file__).parent
+if str(tools_dir) not in sys.path:
+    sys.path.insert(0, str(tools_dir))
+
+from table_utils import escape_table_name
+from executor import map_files, threads_per_file_worker
+
+# Catalog files live in a hidden folder next to the user's CSV files,
+# so "Clear All Data" on the Upload page removes them together
+CATALOG_DIR_NAME = ".healthsync"
+MANIFEST_FILE_NAME = "manifest.json"
+
+# Typed Parquet copies of each metric: .healthsync/parquet/<table>/part-*.parquet
+PARQUET_DIR_NAME = "parquet"
+PARQUET_INFO_FILE_NAME = "_source.json"
+
+# Timestamp formats found in Simple Health Export CSV files
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S %z', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+TIMESTAMP_COLUMNS = ['startDate', 'endDate']
+
+# Pre-typed columns every metric view exposes, computed once at load:
+# value_num DOUBLE, start_ts/end_ts TIMESTAMPTZ and local_date DATE
+VALUE_NUM_COLUMN = "value_num"
+TIMESTAMP_VIEW_COLUMNS = {'startDate': 'start_ts', 'endDate': 'end_ts'}
+LOCAL_DATE_COLUMN = "local_date"
+TYPED_VIEW_COLUMNS = [VALUE_NUM_COLUMN, 'start_ts', 'end_ts', LOCAL_DATE_COLUMN]
+
+# Time zone local_date is computed in (default: the machine's time zone)
+LOCAL_TIMEZONE = os.getenv("HEALTHSYNC_TIMEZONE")
+
+# Per-day rollups of each metric: .healthsync/rollups/<table>/daily.parquet,
+# exposed as the view "<table>__daily"
+ROLLUP_DIR_NAME = "rollups"
+ROLLUP_FILE_NAME = "daily.parquet"
+ROLLUP_VIEW_SUFFIX = "__daily"
+ROLLUP_COLUMNS = [
+    "local_date", "sample_count", "value_count", "value_sum",
+    "value_min", "value_max", "value_mean", "first_ts", "last_ts"
+]
+
+# Re-uploaded CSV files only append samples the Parquet copy doesn't have yet
+# (HEALTHSYNC_INCREMENTAL_INGEST=0 rewrites the whole metric instead)
+INCREMENTAL_INGEST = os.getenv("HEALTHSYNC_INCREMENTAL_INGEST", "1") != "0"
+# Columns identifying one sample across exports
+SAMPLE_KEY_COLUMNS = ['startDate', 'endDate', 'sourceName', 'value']
+# Appended parts of a metric are merged back into one file above this count
+MAX_PARQUET_PARTS = int(os.getenv("HEALTHSYNC_MAX_PARQUET_PARTS", "8"))
+
+# Bump when the Parquet/catalog layout changes so existing copies are rebuilt
+STORAGE_LAYOUT_VERSION = 5
+
+# Read-only catalog connections kept open per worker thread (user dir -> connection)
+MAX_CONNECTIONS_PER_THREAD = int(os.getenv("HEALTHSYNC_CONNECTIONS_PER_THREAD", "4"))
+_thread_state = threading.local()
+
+# One writer at a time per user directory (within this process): catalog builds
+# and Parquet ingestion both hold it (see get_storage_lock)
+_storage_locks = {}
+_storage_locks_guard = threading.Lock()
+
+def get_user_storage_path(user_id: str) -> Path:
+    """
+    Get storage directory for a user's health data
+
+    Args:
+        user_id: User ID
+
+    Returns:
+        Path to storage/user_data/<user_id>
+    """
+    # Get project root (3 levels up from tools/)
+    project_root = Path(__file__).parent.parent.parent.parent
+    return project_root / "storage" / "user_data" / user_id
+
+def get_catalog_dir(storage_path: Path) -> Path:
+    """Get directory holding the catalog database and manifest"""
+    return storage_path / CATALOG_DIR_NAME
+
+def get_file_signature(csv_file: Path) -> str:
+    """Signature of a CSV file: name, size and modification time"""
+    stat = csv_file.stat()
+    return f"{csv_file.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def compute_data_fingerprint(storage_path: Path) -> str:
+    """
+    Compute fingerprint of the user's CSV files
+    Based on file name, size and modification time (no content read)
+
+    Args:
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Hex digest identifying the current set of CSV files
+    """
+    entries = []
+    for csv_file in sorted(storage_path.glob("*.csv")):
+        try:
+            entries.append(get_file_signature(csv_file))
+        except OSError:
+            continue
+    return hashlib.sha1("\n".join(entries).encode("utf-8")).hexdigest()
+
+def read_manifest(storage_path: Path) -> dict:
+    """Read catalog manifest, or None if the catalog was never built"""
+    manifest_path = get_catalog_dir(storage_path) / MANIFEST_FILE_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _write_manifest(storage_path: Path, manifest: dict):
+    """Write manifest atomically (write temp file, then rename)"""
+    catalog_dir = get_catalog_dir(storage_path)
+    manifest_path = catalog_dir / MANIFEST_FILE_NAME
+    tmp_path = catalog_dir / f"{MANIFEST_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def load_csv_table(conn: duckdb.DuckDBPyConnection, csv_file: Path, table_name: str) -> str:
+    """
+    Load one CSV file into a DuckDB table
+    Tries read_csv_auto first, then falls back to pandas (skips bad lines)
+
+    Args:
+        conn: DuckDB connection
+        csv_file: Path to CSV file
+        table_name: Table name to create (original name, will be escaped)
+
+    Returns:
+        None on success, error message on failure
+    """
+    escaped_name = escape_table_name(table_name)
+    csv_path = str(csv_file.resolve()).replace("'", "''")
+
+    try:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {escaped_name} AS
+            SELECT * FROM read_csv_auto('{csv_path}')
+        """)
+        return None
+    except Exception as csv_error:
+        # Fall back to pandas (more forgiving with malformed CSV)
+        import pandas as pd
+        try:
+            df = pd.read_csv(
+                csv_file,
+                on_bad_lines='skip',  # Skip bad lines instead of failing
+                engine='python',  # Python engine is more forgiving
+                quoting=1,  # QUOTE_ALL - handle quotes properly
+                escapechar='\\',
+                encoding='utf-8',
+                encoding_errors='replace',  # Replace encoding errors
+                skipinitialspace=True,  # Skip spaces after delimiter
+                skip_blank_lines=True  # Skip blank lines
+            )
+            df = df.dropna(how='all')  # Remove completely empty rows
+
+            if df.empty:
+                return "File is empty after cleaning"
+
+            temp_reg_name = f"temp_reg_{table_name.replace('-', '_').replace('.', '_')[:50]}"
+            conn.register(temp_reg_name, df)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {escaped_name} AS SELECT * FROM {temp_reg_name}")
+            conn.unregister(temp_reg_name)
+            print(f"✅ Loaded {csv_file.name} via pandas fallback (skipped bad lines)")
+            return None
+        except Exception as pandas_error:
+            return f"CSV error: {str(csv_error)[:100]}, Pandas error: {str(pandas_error)[:100]}"
+
+def get_parquet_dir(storage_path: Path, table_name: str) -> Path:
+    """Get directory holding the Parquet files of one metric table"""
+    return get_catalog_dir(storage_path) / PARQUET_DIR_NAME / table_name
+
+def _parquet_glob(parquet_dir: Path) -> str:
+    return str((parquet_dir / "*.parquet").resolve()).replace("'", "''")
+
+def get_local_timezone(conn: duckdb.DuckDBPyConnection) -> str:
+    """Time zone used for local_date (HEALTHSYNC_TIMEZONE, else DuckDB's session time zone)"""
+    if LOCAL_TIMEZONE:
+        return LOCAL_TIMEZONE
+    return conn.execute("SELECT current_setting('TimeZone')").fetchone()[0]
+
+def _typed_select_list(conn: duckdb.DuckDBPyConnection, source: str, timezone: str) -> str:
+    """
+    Build SELECT list that converts value to DOUBLE and dates to TIMESTAMPTZ
+    value stays VARCHAR when it holds non-numeric data (e.g. sleep categories);
+    value_num (only stored when value isn't numeric) and local_date are added.
+    """
+    column_types = {row[0]: row[1] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    select_parts = []
+    typed_exprs = {}
+    for column, column_type in column_types.items():
+        if column in TYPED_VIEW_COLUMNS:
+            continue  # recomputed below
+        escaped_column = escape_table_name(column)
+        if column == "value" and column_type != "DOUBLE":
+            non_numeric = conn.execute(
+                f"SELECT COUNT(*) FROM {source} "
+                f"WHERE {escaped_column} IS NOT NULL AND TRY_CAST({escaped_column} AS DOUBLE) IS NULL"
+            ).fetchone()[0]
+            if non_numeric == 0:
+                select_parts.append(f"TRY_CAST({escaped_column} AS DOUBLE) AS {escaped_column}")
+            else:
+                select_parts.append(escaped_column)
+                select_parts.append(f"TRY_CAST({escaped_column} AS DOUBLE) AS {VALUE_NUM_COLUMN}")
+            continue
+        elif column in TIMESTAMP_COLUMNS and column_type == "VARCHAR":
+            parsers = [
+                f"try_strptime({escaped_column}, '{fmt}')::TIMESTAMPTZ" for fmt in TIMESTAMP_FORMATS
+            ]
+            typed_exprs[column] = f"COALESCE({', '.join(parsers)})"
+            select_parts.append(f"{typed_exprs[column]} AS {escaped_column}")
+            continue
+        elif column in TIMESTAMP_COLUMNS and column_type.startswith("TIMESTAMP"):
+            typed_exprs[column] = f"{escaped_column}::TIMESTAMPTZ"
+            select_parts.append(f"{typed_exprs[column]} AS {escaped_column}")
+            continue
+        select_parts.append(escaped_column)
+    if "startDate" in typed_exprs:
+        escaped_timezone = timezone.replace("'", "''")
+        select_parts.append(
+            f"CAST(timezone('{escaped_timezone}', {typed_exprs['startDate']}) AS DATE) AS {LOCAL_DATE_COLUMN}"
+        )
+    return ", ".join(select_parts)
+
+def _view_select_list(column_types: dict) -> str:
+    """
+    Build SELECT list of a metric view over its Parquet files
+    Typed columns that are plain copies of stored ones (value_num of a DOUBLE
+    value, start_ts/end_ts) are aliases, so they cost nothing to store.
+    """
+    select_parts = ["*"]
+    if VALUE_NUM_COLUMN not in column_types and column_types.get("value") == "DOUBLE":
+        select_parts.append(f'"value" AS {VALUE_NUM_COLUMN}')
+    for column, view_column in TIMESTAMP_VIEW_COLUMNS.items():
+        if view_column not in column_types and column_types.get(column, "").startswith("TIMESTAMP"):
+            select_parts.append(f"{escape_table_name(column)} AS {view_column}")
+    return ", ".join(select_parts)
+
+def _metric_view_sql(parquet_dir: Path, parquet_types: dict) -> str:
+    """SELECT statement exposing a metric's Parquet files with the typed view columns"""
+    return f"SELECT {_view_select_list(parquet_types)} FROM read_parquet('{_parquet_glob(parquet_dir)}')"
+
+def write_table_parquet(conn: duckdb.DuckDBPyConnection, source_table: str, csv_file: Path, storage_path: Path) -> dict:
+    """
+    Write a loaded CSV table to zstd-compressed, typed Parquet
+    Replaces the Parquet files the metric had before the write. Callers hold
+    get_storage_lock(storage_path).
+
+    Args:
+        conn: DuckDB connection holding the loaded table (or registered DataFrame)
+        source_table: Name of the table/view to convert (unescaped)
+        csv_file: CSV file the table was loaded from
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Parquet info dictionary (source signature, row count, column types)
+    """
+    table_name = csv_file.stem
+    parquet_dir = get_parquet_dir(storage_path, table_name)
+    parquet_dir.mkdir(parents=True, exist_ok=True)
+
+    source = escape_table_name(source_table)
+    timezone = get_local_timezone(conn)
+    select_list = _typed_select_list(conn, source, timezone)
+    # Parts from a previous conversion of this metric, dropped once the new one is written
+    old_parts = list(parquet_dir.glob("*.parquet"))
+    part_name = f"part-{uuid.uuid4().hex[:12]}.parquet"
+    tmp_path = parquet_dir / f"{part_name}.tmp"
+    escaped_tmp = str(tmp_path.resolve()).replace("'", "''")
+    conn.execute(f"""
+        COPY (SELECT {select_list} FROM {source})
+        TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """)
+    os.replace(tmp_path, parquet_dir / part_name)
+
+    for old_part in old_parts:
+        try:
+            old_part.unlink()
+        except OSError:
+            pass
+
+    parquet_glob = _parquet_glob(parquet_dir)
+    parquet_types = {
+        row[0]: row[1]
+        for row in conn.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_glob}')").fetchall()
+    }
+    # Column types as exposed by the metric view (stored columns + typed aliases)
+    metric_sql = _metric_view_sql(parquet_dir, parquet_types)
+    column_types = {
+        row[0]: row[1]
+        for row in conn.execute(f"DESCRIBE {metric_sql}").fetchall()
+    }
+    row_count = conn.execute(f"SELECT COUNT(*) FROM read_parquet('{parquet_glob}')").fetchone()[0]
+    rollup = write_daily_rollup(conn, table_name, storage_path, metric_sql, column_types)
+    stats = compute_table_stats(conn, metric_sql, column_types)
+
+    info = {
+        "source": get_file_signature(csv_file),
+        "layout": STORAGE_LAYOUT_VERSION,
+        "timezone": timezone,
+        "row_count": row_count,
+        "parquet_types": parquet_types,
+        "column_types": column_types,
+        "rollup": rollup,
+        "stats": stats
+    }
+    _write_parquet_info(parquet_dir, info)
+    return info
+
+def _write_parquet_info(parquet_dir: Path, info: dict):
+    """Write a metric's Parquet info atomically (write temp file, then rename)"""
+    info_path = parquet_dir / PARQUET_INFO_FILE_NAME
+    tmp_path = parquet_dir / f"{PARQUET_INFO_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_path, info_path)
+
+def _read_parquet_info(storage_path: Path, table_name: str) -> dict:
+    """Read a metric's Parquet info whether or not it is up to date, or None"""
+    info_path = get_parquet_dir(storage_path, table_name) / PARQUET_INFO_FILE_NAME
+    if not info_path.exists():
+        return None
+    try:
+        with open(info_path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def append_table_parquet(conn: duckdb.DuckDBPyConnection, source_table: str, csv_file: Path,
+                         storage_path: Path) -> dict:
+    """
+    Append the samples of a re-uploaded CSV table that the metric's Parquet
+    copy doesn't have yet
+    A sample is identified by (startDate, endDate, sourceName, value); new
+    samples go to a new part file and only the days they fall on are
+    recomputed in the daily rollup. Callers hold get_storage_lock(storage_path).
+
+    Args:
+        conn: DuckDB connection holding the loaded table (or registered DataFrame)
+        source_table: Name of the table/view to convert (unescaped)
+        csv_file: CSV file the table was loaded from
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Parquet info dictionary (with "appended" row count), or None if the
+        metric has no compatible Parquet copy and must be rewritten
+    """
+    table_name = csv_file.stem
+    parquet_dir = get_parquet_dir(storage_path, table_name)
+    previous = _read_parquet_info(storage_path, table_name)
+    timezone = get_local_timezone(conn)
+    if not previous or previous.get("layout") != STORAGE_LAYOUT_VERSION or \
+            previous.get("timezone") != timezone or not any(parquet_dir.glob("*.parquet")):
+        return None
+
+    source = escape_table_name(source_table)
+    parquet_glob = _parquet_glob(parquet_dir)
+    suffix = uuid.uuid4().hex[:12]
+    incoming = f"incoming_{suffix}"
+    new_samples = f"new_samples_{suffix}"
+    try:
+        conn.execute(f"CREATE TEMP TABLE {incoming} AS SELECT {_typed_select_list(conn, source, timezone)} FROM {source}")
+        incoming_types = {row[0]: row[1] for row in conn.execute(f"DESCRIBE {incoming}").fetchall()}
+        if incoming_types != previous.get("parquet_types"):
+            return None  # Columns or types changed (e.g. value became non-numeric)
+        key_columns = [column for column in SAMPLE_KEY_COLUMNS if column in incoming_types]
+        if "startDate" not in key_columns:
+            return None
+
+        key_match = " AND ".join(
+            f"stored.{escape_table_name(column)} IS NOT DISTINCT FROM incoming.{escape_table_name(column)}"
+            for column in key_columns
+        )
+        conn.execute(f"""
+            CREATE TEMP TABLE {new_samples} AS
+            SELECT * FROM {incoming} AS incoming
+            WHERE NOT EXISTS (
+                SELECT 1 FROM read_parquet('{parquet_glob}') AS stored WHERE {key_match}
+            )
+        """)
+        appended = conn.execute(f"SELECT COUNT(*) FROM {new_samples}").fetchone()[0]
+
+        info = dict(previous, source=get_file_signature(csv_file), appended=appended)
+        if appended:
+            part_name = f"part-{uuid.uuid4().hex[:12]}.parquet"
+            tmp_path = parquet_dir / f"{part_name}.tmp"
+            escaped_tmp = str(tmp_path.resolve()).replace("'", "''")
+            conn.execute(f"COPY {new_samples} TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            os.replace(tmp_path, parquet_dir / part_name)
+            _compact_parts(conn, parquet_dir)
+            info["row_count"] = previous["row_count"] + appended
+
+            metric_sql = _metric_view_sql(parquet_dir, previous["parquet_types"])
+            if has_rollup(previous, storage_path, table_name):
+                info["rollup"] = _update_daily_rollup(conn, table_name, storage_path, metric_sql, new_samples)
+            else:
+                info["rollup"] = write_daily_rollup(conn, table_name, storage_path, metric_sql,
+                                                    previous["column_types"])
+            info["stats"] = compute_table_stats(conn, metric_sql, previous["column_types"])
+        _write_parquet_info(parquet_dir, info)
+        return info
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {new_samples}")
+        conn.execute(f"DROP TABLE IF EXISTS {incoming}")
+
+def ingest_table_parquet(conn: duckdb.DuckDBPyConnection, source_table: str, csv_file: Path,
+                         storage_path: Path) -> dict:
+    """
+    Bring a metric's Parquet copy up to date with a loaded CSV table
+    Appends only new samples when possible (see append_table_parquet),
+    otherwise rewrites the metric. Callers hold get_storage_lock(storage_path).
+
+    Returns:
+        Parquet info dictionary
+    """
+    if INCREMENTAL_INGEST:
+        info = append_table_parquet(conn, source_table, csv_file, storage_path)
+        if info:
+            return info
+    return write_table_parquet(conn, source_table, csv_file, storage_path)
+
+def _compact_parts(conn: duckdb.DuckDBPyConnection, parquet_dir: Path):
+    """Merge a metric's part files into one once there are more than MAX_PARQUET_PARTS"""
+    parts = list(parquet_dir.glob("*.parquet"))
+    if len(parts) <= MAX_PARQUET_PARTS:
+        return
+    part_name = f"part-{uuid.uuid4().hex[:12]}.parquet"
+    tmp_path = parquet_dir / f"{part_name}.tmp"
+    escaped_tmp = str(tmp_path.resolve()).replace("'", "''")
+    # Merge exactly the listed parts, so only those are deleted afterwards
+    part_list = ", ".join("'" + str(part.resolve()).replace("'", "''") + "'" for part in parts)
+    conn.execute(f"""
+        COPY (SELECT * FROM read_parquet([{part_list}]))
+        TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """)
+    os.replace(tmp_path, parquet_dir / part_name)
+    for old_part in parts:
+        try:
+            old_part.unlink()
+        except OSError:
+            pass
+
+def compute_table_stats(conn: duckdb.DuckDBPyConnection, metric_sql: str, column_types: dict) -> dict:
+    """
+    Summary statistics of a metric, saved at ingestion for prompts and quick answers:
+    date range, days with data, units, sources, value min/max/mean, mean daily
+    total and sample cadence
+
+    Args:
+        conn: DuckDB connection
+        metric_sql: SELECT statement of the metric view
+        column_types: Column types of the metric view
+
+    Returns:
+        Statistics dictionary (dates as ISO strings; keys missing when a column is)
+    """
+    stats = {}
+    metric = f"({metric_sql}) AS metric"
+    if {"local_date", "start_ts"} <= set(column_types):
+        first_date, last_date, days, first_ts, last_ts = conn.execute(f"""
+            SELECT MIN(local_date), MAX(local_date), COUNT(DISTINCT local_date), MIN(start_ts), MAX(start_ts)
+            FROM {metric}
+        """).fetchone()
+        stats.update({
+            "first_date": first_date.isoformat() if first_date else None,
+            "last_date": last_date.isoformat() if last_date else None,
+            "days_with_data": days,
+            "first_timestamp": first_ts.isoformat() if first_ts else None,
+            "last_timestamp": last_ts.isoformat() if last_ts else None
+        })
+        # Typical time between consecutive samples
+        median_gap = conn.execute(f"""
+            SELECT MEDIAN(gap) FROM (
+                SELECT epoch(start_ts) - LAG(epoch(start_ts)) OVER (ORDER BY start_ts) AS gap
+                FROM {metric}
+            ) WHERE gap > 0
+        """).fetchone()[0]
+        stats["median_interval_seconds"] = round(median_gap, 1) if median_gap is not None else None
+    if VALUE_NUM_COLUMN in column_types:
+        value_min, value_max, value_mean = conn.execute(
+            f"SELECT MIN(value_num), MAX(value_num), AVG(value_num) FROM {metric}"
+        ).fetchone()
+        stats.update({
+            "value_min": value_min,
+            "value_max": value_max,
+            "value_mean": round(value_mean, 4) if value_mean is not None else None
+        })
+        if "local_date" in column_types:
+            # Usual per-day total, for metrics that add up (steps, energy, sleep hours)
+            daily_total_mean = conn.execute(f"""
+                SELECT AVG(daily_total) FROM (
+                    SELECT SUM(value_num) AS daily_total FROM {metric} GROUP BY local_date
+                )
+            """).fetchone()[0]
+            stats["daily_total_mean"] = round(daily_total_mean, 4) if daily_total_mean is not None else None
+    for column, key in (("unit", "units"), ("sourceName", "sources")):
+        if column in column_types:
+            escaped_column = escape_table_name(column)
+            # Most common first
+            stats[key] = [row[0] for row in conn.execute(f"""
+                SELECT {escaped_column} FROM {metric}
+                WHERE {escaped_column} IS NOT NULL
+                GROUP BY {escaped_column}
+                ORDER BY COUNT(*) DESC
+                LIMIT 20
+            """).fetchall()]
+    return stats
+
+def get_rollup_path(storage_path: Path, table_name: str) -> Path:
+    """Get the daily rollup file of one metric table"""
+    return get_catalog_dir(storage_path) / ROLLUP_DIR_NAME / table_name / ROLLUP_FILE_NAME
+
+def get_rollup_view_name(table_name: str) -> str:
+    """Name of the view exposing a metric's daily rollup"""
+    return f"{table_name}{ROLLUP_VIEW_SUFFIX}"
+
+def _daily_rollup_sql(metric_sql: str) -> str:
+    """Per-day aggregates (count, sum, min, max, mean, first/last timestamp) of a metric"""
+    return f"""
+        SELECT
+            local_date,
+            COUNT(*) AS sample_count,
+            COUNT(value_num) AS value_count,
+            SUM(value_num) AS value_sum,
+            MIN(value_num) AS value_min,
+            MAX(value_num) AS value_max,
+            AVG(value_num) AS value_mean,
+            MIN(start_ts) AS first_ts,
+            MAX(start_ts) AS last_ts
+        FROM ({metric_sql})
+        GROUP BY local_date
+        ORDER BY local_date
+    """
+
+def write_daily_rollup(conn: duckdb.DuckDBPyConnection, table_name: str, storage_path: Path,
+                       metric_sql: str, column_types: dict) -> dict:
+    """
+    Write the daily rollup of a metric
+    Needs the typed view columns (local_date, value_num, start_ts).
+
+    Args:
+        conn: DuckDB connection
+        table_name: Metric table name
+        storage_path: Path to directory containing CSV files
+        metric_sql: SELECT statement of the metric view
+        column_types: Column types of the metric view
+
+    Returns:
+        Rollup info ({"file", "days"}), or None if the metric can't be rolled up
+    """
+    rollup_path = get_rollup_path(storage_path, table_name)
+    if not {"local_date", "value_num", "start_ts"} <= set(column_types):
+        try:
+            rollup_path.unlink()
+        except OSError:
+            pass
+        return None
+    rollup_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = rollup_path.parent / f"{ROLLUP_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+    escaped_tmp = str(tmp_path.resolve()).replace("'", "''")
+    days = conn.execute(f"""
+        COPY ({_daily_rollup_sql(metric_sql)})
+        TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """).fetchone()[0]
+    os.replace(tmp_path, rollup_path)
+    return {"file": ROLLUP_FILE_NAME, "days": days}
+
+def _update_daily_rollup(conn: duckdb.DuckDBPyConnection, table_name: str, storage_path: Path,
+                         metric_sql: str, new_samples: str) -> dict:
+    """
+    Recompute the daily rollup rows of the days new samples fall on
+    (every other day is copied from the existing rollup)
+
+    Args:
+        conn: DuckDB connection
+        table_name: Metric table name
+        storage_path: Path to directory containing CSV files
+        metric_sql: SELECT statement of the metric view (including the new samples)
+        new_samples: Table holding the appended samples
+
+    Returns:
+        Rollup info ({"file", "days"})
+    """
+    rollup_path = get_rollup_path(storage_path, table_name)
+    escaped_rollup = str(rollup_path.resolve()).replace("'", "''")
+    tmp_path = rollup_path.parent / f"{ROLLUP_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+    escaped_tmp = str(tmp_path.resolve()).replace("'", "''")
+    touched_days = f"SELECT DISTINCT local_date FROM {new_samples}"
+    touched_metric_sql = f"""
+        SELECT * FROM ({metric_sql}) AS metric
+        WHERE EXISTS (
+            SELECT 1 FROM ({touched_days}) AS touched
+            WHERE touched.local_date IS NOT DISTINCT FROM metric.local_date
+        )
+    """
+    days = conn.execute(f"""
+        COPY (
+            SELECT * FROM (
+                SELECT * FROM read_parquet('{escaped_rollup}') AS kept
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ({touched_days}) AS touched
+                    WHERE touched.local_date IS NOT DISTINCT FROM kept.local_date
+                )
+                UNION ALL BY NAME
+                SELECT * FROM ({_daily_rollup_sql(touched_metric_sql)})
+            )
+            ORDER BY local_date
+        ) TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)
+    """).fetchone()[0]
+    os.replace(tmp_path, rollup_path)
+    return {"file": ROLLUP_FILE_NAME, "days": days}
+
+def _rollup_view_sql(storage_path: Path, table_name: str) -> str:
+    escaped_path = str(get_rollup_path(storage_path, table_name).resolve()).replace("'", "''")
+    return f"SELECT * FROM read_parquet('{escaped_path}')"
+
+def get_parquet_info(csv_file: Path, storage_path: Path) -> dict:
+    """
+    Get Parquet info of a metric if it is up to date with its CSV file
+    (and was written with the current layout and HEALTHSYNC_TIMEZONE)
+
+    Returns:
+        Parquet info dictionary, or None if missing or stale
+    """
+    info = _read_parquet_info(storage_path, csv_file.stem)
+    try:
+        if info and info.get("source") == get_file_signature(csv_file) and \
+                info.get("layout") == STORAGE_LAYOUT_VERSION and \
+                (not LOCAL_TIMEZONE or info.get("timezone") == LOCAL_TIMEZONE):
+            return info
+    except OSError:
+        pass
+    return None
+
+def convert_csv_to_parquet(conn: duckdb.DuckDBPyConnection, csv_file: Path, storage_path: Path) -> dict:
+    """
+    Load a CSV file and write it as typed Parquet
+    (appending only new samples when the metric was converted before)
+
+    Args:
+        conn: DuckDB connection used for the conversion
+        csv_file: Path to CSV file
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Parquet info dictionary, or dict with "error" key on failure
+    """
+    staging_table = f"staging_{csv_file.stem}"
+    error = load_csv_table(conn, csv_file, staging_table)
+    if error:
+        return {"error": error}
+    try:
+        return ingest_table_parquet(conn, staging_table, csv_file, storage_path)
+    except Exception as e:
+        return {"error": f"Parquet conversion failed: {str(e)[:200]}"}
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {escape_table_name(staging_table)}")
+
+def has_rollup(parquet_info: dict, storage_path: Path, table_name: str) -> bool:
+    """Check a metric's daily rollup was written with its current Parquet copy"""
+    return bool(parquet_info and parquet_info.get("rollup")) and get_rollup_path(storage_path, table_name).is_file()
+
+def register_metric_table(conn: duckdb.DuckDBPyConnection, csv_file: Path, storage_path: Path,
+                          as_view: bool = True) -> str:
+    """
+    Make one metric available on a connection under its original name
+    Uses the typed Parquet copy when it is up to date (plus its daily rollup
+    view), otherwise the CSV file
+
+    Args:
+        conn: DuckDB connection
+        csv_file: Path to CSV file
+        storage_path: Path to directory containing CSV files
+        as_view: Register Parquet as a view (True) or copy it into a table
+
+    Returns:
+        None on success, error message on failure
+    """
+    table_name = csv_file.stem
+    parquet_info = get_parquet_info(csv_file, storage_path)
+    if parquet_info:
+        view_sql = _metric_view_sql(get_parquet_dir(storage_path, table_name), parquet_info["parquet_types"])
+        kind = "VIEW" if as_view else "TABLE"
+        try:
+            conn.execute(f"""
+                CREATE {kind} IF NOT EXISTS {escape_table_name(table_name)} AS
+                {view_sql}
+            """)
+            if has_rollup(parquet_info, storage_path, table_name):
+                conn.execute(f"""
+                    CREATE VIEW IF NOT EXISTS {escape_table_name(get_rollup_view_name(table_name))} AS
+                    {_rollup_view_sql(storage_path, table_name)}
+                """)
+            return None
+        except Exception as e:
+            print(f"Could not read Parquet for {table_name}, using CSV: {e}")
+    return load_csv_table(conn, csv_file, table_name)
+
+def get_timestamp_columns(table_types: dict, table_names: list) -> set:
+    """
+    Find date columns that are natively typed in every given table
+
+    Args:
+        table_types: Dict of table name -> {column: type}
+        table_names: Tables a query uses
+
+    Returns:
+        Set of lower-case column names typed as TIMESTAMP/TIMESTAMPTZ
+        (empty if any table has no type information)
+    """
+    typed = set()
+    untyped = set()
+    for table_name in table_names:
+        column_types = table_types.get(table_name)
+        if not column_types:
+            return set()
+        for column, column_type in column_types.items():
+            if column_type.startswith("TIMESTAMP"):
+                typed.add(column.lower())
+            else:
+                untyped.add(column.lower())
+    return typed - untyped
+
+def get_typed_view_columns(table_types: dict, table_names: list) -> set:
+    """
+    Find pre-typed view columns (value_num, start_ts, end_ts, local_date)
+    that every given table exposes
+
+    Returns:
+        Set of typed view column names (empty if any table has no type information)
+    """
+    available = set(TYPED_VIEW_COLUMNS)
+    for table_name in table_names:
+        available &= set(table_types.get(table_name) or {})
+    return available
+
+def _is_current(manifest: dict, fingerprint: str, storage_path: Path) -> bool:
+    """Check a manifest describes an existing catalog of the current files, layout and time zone"""
+    return bool(
+        manifest and manifest.get("fingerprint") == fingerprint and
+        manifest.get("layout") == STORAGE_LAYOUT_VERSION and
+        manifest.get("timezone") == LOCAL_TIMEZONE and
+        (get_catalog_dir(storage_path) / manifest.get("database", "")).is_file()
+    )
+
+def get_storage_lock(storage_path: Path) -> threading.Lock:
+    """
+    Get the lock serializing writes to a user's Parquet copies and catalog
+    Hold it around ingest_table_parquet/write_table_parquet/append_table_parquet
+    (build_catalog takes it itself). Not reentrant.
+    """
+    key = str(storage_path.resolve())
+    with _storage_locks_guard:
+        if key not in _storage_locks:
+            _storage_locks[key] = threading.Lock()
+        return _storage_locks[key]
+
+def _ensure_parquet(csv_file: Path, storage_path: Path) -> dict:
+    """
+    Get a metric's up-to-date Parquet info, converting the CSV file on its own
+    connection if needed
+
+    Returns:
+        Parquet info dictionary, or dict with "error" key on failure
+    """
+    parquet_info = get_parquet_info(csv_file, storage_path)
+    if parquet_info:
+        return parquet_info
+    staging_conn = duckdb.connect()
+    try:
+        staging_conn.execute(f"SET threads TO {threads_per_file_worker()}")
+        return convert_csv_to_parquet(staging_conn, csv_file, storage_path)
+    finally:
+        staging_conn.close()
+
+def build_catalog(storage_path: Path) -> dict:
+    """
+    Build the persistent catalog database from all CSV files
+    The database is written under a fingerprint-specific name and only
+    published (via the manifest) once complete, so readers never see a
+    half-built catalog and can keep using the previous one meanwhile.
+
+    Args:
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Manifest dictionary describing the new catalog
+    """
+    with get_storage_lock(storage_path):
+        fingerprint = compute_data_fingerprint(storage_path)
+
+        # Another thread may have built it while we waited for the lock
+        manifest = read_manifest(storage_path)
+        if _is_current(manifest, fingerprint, storage_path):
+            return manifest
+
+        catalog_dir = get_catalog_dir(storage_path)
+        catalog_dir.mkdir(parents=True, exist_ok=True)
+
+        database_name = f"catalog-{fingerprint[:16]}-v{STORAGE_LAYOUT_VERSION}.duckdb"
+        tmp_path = catalog_dir / f"{database_name}.{uuid.uuid4().hex}.tmp"
+
+        # Typed Parquet is written on upload; convert anything missing or stale (files in parallel)
+        csv_files = sorted(storage_path.glob("*.csv"))
+        parquet_infos = map_files(lambda csv_file: _ensure_parquet(csv_file, storage_path), csv_files)
+
+        tables = {}
+        failed_files = []
+        conn = duckdb.connect(str(tmp_path))
+        try:
+            for csv_file, parquet_info in zip(csv_files, parquet_infos):
+                original_name = csv_file.stem
+                escaped_name = escape_table_name(original_name)
+
+                if "error" not in parquet_info:
+                    view_sql = _metric_view_sql(get_parquet_dir(storage_path, original_name),
+                                                parquet_info["parquet_types"])
+                    conn.execute(f"""
+                        CREATE VIEW {escaped_name} AS
+                        {view_sql}
+                    """)
+                    tables[original_name] = {
+                        "file": csv_file.name,
+                        "storage": "parquet",
+                        "row_count": parquet_info["row_count"],
+                        "column_types": parquet_info["column_types"],
+                        "stats": parquet_info.get("stats", {})
+                    }
+                    if has_rollup(parquet_info, storage_path, original_name):
+                        rollup_view = get_rollup_view_name(original_name)
+                        conn.execute(f"""
+                            CREATE VIEW {escape_table_name(rollup_view)} AS
+                            {_rollup_view_sql(storage_path, original_name)}
+                        """)
+                        tables[original_name]["rollup"] = rollup_view
+                    continue
+
+                # Parquet conversion failed - keep the raw CSV data inside the catalog
+                error = load_csv_table(conn, csv_file, original_name)
+                if error:
+                    failed_files.append({"file": csv_file.name, "error": error})
+                    continue
+                row_count = conn.execute(f"SELECT COUNT(*) FROM {escaped_name}").fetchone()[0]
+                column_types = {
+                    row[0]: row[1] for row in conn.execute(f"DESCRIBE {escaped_name}").fetchall()
+                }
+                tables[original_name] = {
+                    "file": csv_file.name,
+                    "storage": "table",
+                    "row_count": row_count,
+                    "column_types": column_types
+                }
+            conn.execute("CHECKPOINT")
+        finally:
+            conn.close()
+
+        os.replace(tmp_path, catalog_dir / database_name)
+
+        manifest = {
+            "fingerprint": fingerprint,
+            "layout": STORAGE_LAYOUT_VERSION,
+            "timezone": LOCAL_TIMEZONE,
+            "database": database_name,
+            "tables": tables,
+            "failed_files": failed_files
+        }
+        _write_manifest(storage_path, manifest)
+
+        # Remove Parquet copies and rollups of CSV files that no longer exist
+        csv_names = {csv_file.stem for csv_file in storage_path.glob("*.csv")}
+        for root in (catalog_dir / PARQUET_DIR_NAME, catalog_dir / ROLLUP_DIR_NAME):
+            if root.exists():
+                for metric_dir in root.iterdir():
+                    if metric_dir.is_dir() and metric_dir.name not in csv_names:
+                        shutil.rmtree(metric_dir, ignore_errors=True)
+
+        # Remove catalogs from older fingerprints (open handles stay valid on POSIX)
+        for old_file in catalog_dir.glob("catalog-*.duckdb*"):
+            if old_file.name != database_name and not old_file.name.endswith(".tmp"):
+                try:
+                    old_file.unlink()
+                except OSError:
+                    pass
+
+        return manifest
+
+def ensure_catalog(storage_path: Path) -> dict:
+    """
+    Get manifest of an up-to-date catalog, rebuilding it if the CSV files changed
+
+    Args:
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Manifest dictionary
+    """
+    manifest = read_manifest(storage_path)
+    if _is_current(manifest, compute_data_fingerprint(storage_path), storage_path):
+        return manifest
+    return build_catalog(storage_path)
+
+def open_catalog(storage_path: Path) -> tuple:
+    """
+    Open the user's catalog read-only (building it first if needed)
+
+    Args:
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Tuple of (DuckDB connection, manifest)
+    """
+    manifest = ensure_catalog(storage_path)
+    database_path = get_catalog_dir(storage_path) / manifest["database"]
+    conn = duckdb.connect(str(database_path), read_only=True)
+    return conn, manifest
+
+def get_catalog_connection(storage_path: Path) -> tuple:
+    """
+    Get this thread's read-only connection to the user's catalog
+    Each worker thread keeps its own connection open between calls and only
+    reconnects when the catalog is rebuilt. Do not close the returned connection.
+
+    Args:
+        storage_path: Path to directory containing CSV files
+
+    Returns:
+        Tuple of (DuckDB connection, manifest)
+    """
+    manifest = ensure_catalog(storage_path)
+    database_path = str(get_catalog_dir(storage_path) / manifest["database"])
+
+    connections = getattr(_thread_state, "connections", None)
+    if connections is None:
+        connections = _thread_state.connections = OrderedDict()
+
+    key = str(storage_path.resolve())
+    cached = connections.get(key)
+    if cached and cached[0] == database_path:
+        connections.move_to_end(key)
+        return cached[1], manifest
+
+    if cached:
+        # Catalog was rebuilt - drop the connection to the old file
+        connections.pop(key)
+        try:
+            cached[1].close()
+        except Exception:
+            pass
+
+    conn = duckdb.connect(database_path, read_only=True)
+    connections[key] = (database_path, conn)
+    while len(connections) > MAX_CONNECTIONS_PER_THREAD:
+        _, (_, old_conn) = connections.popitem(last=False)
+        try:
+            old_conn.close()
+        except Exception:
+            pass
+    return conn, manifest
@@ -1,36 +1,375 @@
 """
 Tool: Execute SQL query on health data
-Uses DuckDB to query CSV files directly
+Uses DuckDB to query the user's persistent health data catalog
 """
+import asyncio
+import base64
 import json
+import os
 import sys
 import duckdb
 from pathlib import Path
-from datetime import datetime
 
 # Add tools directory to path for imports
 tools_dir = Path(__file__).parent
 if str(tools_dir) not in sys.path:
     sys.path.insert(0, str(tools_dir))
 
-from table_utils import escape_table_name
+from table_utils import escape_table_name, extract_table_references
+from health_catalog import (
+    get_user_storage_path, get_catalog_connection, register_metric_table, get_parquet_info, get_timestamp_columns,
+    get_typed_view_columns, compute_data_fingerprint, has_rollup, get_rollup_view_name
+)
+from rollup_router import route_to_rollup, name_result_columns
+from result_cache import result_cache, get_result_ttl
+from executor import run_blocking
+from query_control import QUERY_TIMEOUT, new_query_id, start_query, end_query, cancel_query
+from result_store import (
+    MAX_PAGE_SIZE, new_result_path, register_result, get_result, encode_cursor, decode_cursor
+)
 from sql_fixer import fix_ambiguous_columns, fix_date_functions, fix_value_column_casting
 import re
 
-async def execute_health_query(sql: str, user_id: str) -> dict:
+try:
+    import pyarrow  # noqa: F401 - needed for result_format="arrow"
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Result payload layouts accepted by health_query
+RESULT_FORMATS = ("rows", "columns", "arrow")
+
+# Table loading mode: "catalog" (default), "lazy" or "eager"
+TABLE_LOADING_MODE = os.getenv("HEALTHSYNC_TABLE_LOADING", "catalog")
+
+# Answer day-or-coarser aggregates from the daily rollup views
+ROLLUP_ROUTING = os.getenv("HEALTHSYNC_ROLLUP_ROUTING", "1").lower() not in ("0", "false", "no")
+
+def rewrite_health_sql(sql: str, table_mapping: dict, typed_columns: set = None,
+                       view_columns: set = None) -> str:
+    """
+    Rewrite an AI-generated query for DuckDB
+    Escapes table names and applies the SQL fixer (date functions, value casting,
+    ambiguous columns). Only depends on table names, not on loaded data.
+    
+    Args:
+        sql: SQL query string
+        table_mapping: Dict mapping original table names to table names
+        typed_columns: Date columns already stored as TIMESTAMP (not re-parsed)
+        view_columns: Pre-typed view columns (value_num, start_ts, end_ts, local_date)
+            all queried tables expose - casts/parsing are redirected to them
+    
+    Returns:
+        Rewritten SQL query
+    """
+    # Replace table names in SQL query with escaped names (keep original names)
+    # Escape table names in all contexts: FROM, JOIN, CAST, SELECT, etc.
+    # Sort by length (longest first) to avoid partial replacements
+    sorted_table_names = sorted(table_mapping.keys(), key=len, reverse=True)
+    normalized_sql = sql
+    
+    for original_name in sorted_table_names:
+        escaped_name = escape_table_name(original_name)
+        escaped_original = re.escape(original_name)
+        
+        # Pattern 1: Match after FROM, JOIN, etc.
+        pattern1 = r'(?i)(FROM|JOIN|INTO|UPDATE|TABLE)\s+' + escaped_original + r'(?=\s|;|$|,|\()'
+        normalized_sql = re.sub(pattern1, r'\1 ' + escaped_name, normalized_sql)
+        
+        # Pattern 2: Match in CAST statements: CAST(table.value AS ...)
+        # Don't use \b because table names have dashes. Use lookbehind/lookahead instead
+        # Match: CAST(table.value AS ...) or CAST( table.value AS ...)
+        cast_pattern = r'(?i)(CAST\s*\()\s*' + escaped_original + r'\.(\w+)(?=\s+AS)'
+        normalized_sql = re.sub(cast_pattern, r'\1' + escaped_name + r'.\2', normalized_sql)
+        
+        # Pattern 3: Match table.column in any context (SELECT, WHERE, etc.)
+        # Match: table.column where table is the original_name
+        # Use negative lookbehind to ensure not already escaped
+        table_column_pattern = r'(?i)(?<!")' + escaped_original + r'\.(\w+)(?=\s|,|;|\)|$|AS|WHERE|GROUP|ORDER|HAVING)'
+        normalized_sql = re.sub(table_column_pattern, escaped_name + r'.\1', normalized_sql)
+        
+        # Pattern 4: Match standalone table names (not table.column, not in FROM/JOIN)
+        # Use lookbehind/lookahead to ensure it's a complete identifier
+        # Don't match if it's already part of table.column (handled by Pattern 3)
+        standalone_pattern = r'(?i)(?<!["\w])' + escaped_original + r'(?!\.|\w)'
+        # Only replace if not already escaped
+        if original_name in normalized_sql and escaped_name not in normalized_sql:
+            # Check if it's not already in a FROM/JOIN context (handled by Pattern 1)
+            if not re.search(r'(?i)(FROM|JOIN)\s+' + escaped_original, normalized_sql):
+                normalized_sql = re.sub(standalone_pattern, escaped_name, normalized_sql)
+        
+        # Pattern 5: Replace if quoted (but keep the quotes, just ensure they're there)
+        pattern_quoted = r'"' + escaped_original + r'"'
+        if pattern_quoted in normalized_sql:
+            normalized_sql = re.sub(pattern_quoted, escaped_name, normalized_sql, flags=re.IGNORECASE)
+        
+        # Pattern 6: Replace unquoted table names in FROM/JOIN (backup for Pattern 1)
+        pattern_unquoted = r'(?i)(FROM|JOIN)\s+' + escaped_original + r'(?=\s|,|;|$|WHERE|GROUP|ORDER|HAVING)'
+        normalized_sql = re.sub(pattern_unquoted, r'\1 ' + escaped_name, normalized_sql)
+    
+    # Fix ambiguous column references, date functions, and value column casting
+    try:
+        # sql_fixer is already imported at top of file
+        # First fix date functions (MySQL/PostgreSQL -> DuckDB)
+        normalized_sql = fix_date_functions(normalized_sql, typed_columns, view_columns)
+        # Then fix value column casting (VARCHAR -> DOUBLE for aggregates)
+        # Pass table_mapping so it can escape table names in CAST statements
+        view_columns = view_columns or set()
+        normalized_sql = fix_value_column_casting(normalized_sql, table_mapping, "value_num" in view_columns)
+        # Re-escape table names after value casting (in case new CAST statements were created)
+        # This ensures table names in CAST statements are properly escaped
+        for original_name in sorted_table_names:
+            escaped_name = escape_table_name(original_name)
+            escaped_original = re.escape(original_name)
+            # Escape table names in CAST statements: CAST(table.column AS ...)
+            # Match both with and without quotes, handle table names with dashes
+            cast_pattern = r'(?i)(CAST\s*\()\s*' + escaped_original + r'\.(\w+)(?=\s+AS)'
+            normalized_sql = re.sub(cast_pattern, r'\1' + escaped_name + r'.\2', normalized_sql)
+            # Also match if there are spaces: CAST( table.column AS ...)
+            cast_pattern_spaced = r'(?i)(CAST\s*\(\s*)' + escaped_original + r'\.(\w+)(?=\s+AS)'
+            normalized_sql = re.sub(cast_pattern_spaced, r'\1' + escaped_name + r'.\2', normalized_sql)
+        # Finally fix ambiguous columns
+        normalized_sql = fix_ambiguous_columns(normalized_sql, list(table_mapping.keys()))
+    except Exception as fix_error:
+        # If fix fails, continue with original SQL
+        print(f"SQL fixer error: {fix_error}")
+        pass
+    
+    return normalized_sql
+
+def _register_csv_tables(conn: duckdb.DuckDBPyConnection, csv_files: list, storage_path: Path) -> tuple:
+    """
+    Register metric tables on an in-memory connection (Parquet views, or CSV loads)
+    
+    Returns:
+        Tuple of (created table names, failed file dicts)
+    """
+    created_tables = []
+    failed_files = []
+    for csv_file in csv_files:
+        error = register_metric_table(conn, csv_file, storage_path)
+        if error:
+            failed_files.append({"file": csv_file.name, "error": error})
+        else:
+            created_tables.append(csv_file.stem)
+    return created_tables, failed_files
+
+def _timestamp_column_indexes(description: list) -> list:
+    """Indexes of result columns DuckDB returns as datetime objects"""
+    return [i for i, desc in enumerate(description) if str(desc[1]).startswith("TIMESTAMP")]
+
+def _fetch_result(conn: duckdb.DuckDBPyConnection, result_format: str) -> dict:
+    """
+    Fetch the pending result of conn.execute() in the requested format
+    
+    Args:
+        conn: Connection with an executed query
+        result_format: Payload layout
+            - "rows": list of {column: value} dicts
+            - "columns": {column: [values]} (column names aren't repeated per row)
+            - "arrow": Arrow IPC stream, base64 encoded (needs pyarrow)
+    
+    Returns:
+        Dictionary with "columns", "row_count" and "data" (or "arrow_ipc")
+    """
+    description = conn.description or []
+    columns = [desc[0] for desc in description]
+    
+    if result_format == "arrow":
+        import pyarrow as pa
+        table = conn.fetch_arrow_table()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return {
+            "arrow_ipc": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii"),
+            "columns": columns,
+            "row_count": table.num_rows
+        }
+    
+    rows = conn.fetchall()
+    # Only timestamp columns need converting to strings
+    timestamp_indexes = _timestamp_column_indexes(description)
+    
+    if result_format == "columns":
+        values = [list(column_values) for column_values in zip(*rows)] if rows else [[] for _ in columns]
+        for i in timestamp_indexes:
+            values[i] = [v.isoformat() if v is not None else None for v in values[i]]
+        return {
+            "data": dict(zip(columns, values)),
+            "columns": columns,
+            "row_count": len(rows)
+        }
+    
+    if timestamp_indexes:
+        converted = []
+        for row in rows:
+            row = list(row)
+            for i in timestamp_indexes:
+                if row[i] is not None:
+                    row[i] = row[i].isoformat()
+            converted.append(row)
+        rows = converted
+    return {
+        "data": [dict(zip(columns, row)) for row in rows],
+        "columns": columns,
+        "row_count": len(rows)
+    }
+
+def _route_query(conn: duckdb.DuckDBPyConnection, normalized_sql: str, rollup_views: dict) -> str:
+    """
+    Rewrite the query to read daily rollups if it can be answered from them
+    
+    Returns:
+        Routed SQL (with the original column names), or None to query raw data
+    """
+    if not ROLLUP_ROUTING:
+        return None
+    routed_sql = route_to_rollup(normalized_sql, rollup_views)
+    if not routed_sql:
+        return None
+    try:
+        query = normalized_sql.strip().rstrip(';')
+        column_names = [row[0] for row in conn.execute(f"DESCRIBE {query}").fetchall()]
+        routed_sql = name_result_columns(routed_sql, column_names)
+        conn.execute(f"DESCRIBE {routed_sql}").fetchall()  # make sure it binds
+        return routed_sql
+    except Exception as route_error:
+        print(f"Rollup routing skipped: {route_error}")
+        return None
+
+def _is_pageable(sql: str) -> bool:
+    """Only queries that produce rows (SELECT/WITH/...) can be spilled for pagination"""
+    return bool(re.match(r'\s*\(?\s*(SELECT|WITH|FROM|VALUES|TABLE)\b', sql, re.IGNORECASE))
+
+def _spill_result(conn: duckdb.DuckDBPyConnection, sql: str, path: Path) -> int:
+    """
+    Write the full result of a query to a Parquet file
+    
+    Returns:
+        Number of rows written
+    """
+    escaped_path = str(path).replace("'", "''")
+    query = sql.strip().rstrip(';')
+    try:
+        return conn.execute(f"COPY ({query}) TO '{escaped_path}' (FORMAT PARQUET, COMPRESSION ZSTD)").fetchone()[0]
+    except BaseException:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        raise
+
+def _read_whole_spill(path: Path, result_format: str) -> dict:
+    """Read a spilled result that fits in one page, then remove its file"""
+    conn = duckdb.connect()
+    try:
+        conn.execute("SELECT * FROM read_parquet(?)", [str(path)])
+        return _fetch_result(conn, result_format)
+    finally:
+        conn.close()
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def _read_result_page(handle, offset: int, result_format: str) -> dict:
+    """Read one page of a spilled result"""
+    conn = duckdb.connect()
+    try:
+        conn.execute("SELECT * FROM read_parquet(?) LIMIT ? OFFSET ?",
+                     [str(handle.path), handle.page_size, offset])
+        fetched = _fetch_result(conn, result_format)
+    finally:
+        conn.close()
+    next_offset = offset + handle.page_size
+    return {
+        "success": True,
+        **fetched,
+        "result_format": result_format,
+        "total_rows": handle.total_rows,
+        "offset": offset,
+        "page_size": handle.page_size,
+        "next_cursor": encode_cursor(handle.handle_id, next_offset) if next_offset < handle.total_rows else None,
+        "prev_cursor": encode_cursor(handle.handle_id, max(0, offset - handle.page_size)) if offset > 0 else None,
+        "expires_in": handle.expires_in()
+    }
+
+def _interrupted_result(running, sql: str, normalized_sql: str, user_id: str, timeout: float) -> dict:
+    """Build the structured error returned for a timed out or cancelled query"""
+    if running.reason == "timeout":
+        limit = QUERY_TIMEOUT if timeout is None else timeout
+        message = f"Query timed out after {limit:g} seconds. Try a narrower date range or fewer tables."
+    else:
+        message = "Query was cancelled"
+    return {
+        "error": message,
+        "error_type": running.reason or "cancelled",
+        "query_id": running.query_id,
+        "query": sql,
+        "normalized_query": normalized_sql,
+        "user_id": user_id
+    }
+
+async def execute_health_query(sql: str, user_id: str, load_mode: str = None,
+                               timeout: float = None, query_id: str = None,
+                               result_format: str = "rows", page_size: int = None) -> dict:
+    """
+    Execute SQL query on user's health data (runs on the tool thread pool)
+    If the awaiting task is cancelled, the running DuckDB query is interrupted too.
+    See execute_health_query_sync for arguments
+    """
+    query_id = query_id or new_query_id()
+    try:
+        return await run_blocking(execute_health_query_sync, sql, user_id, load_mode,
+                                  timeout, query_id, result_format, page_size)
+    except asyncio.CancelledError:
+        cancel_query(query_id)
+        raise
+
+def execute_health_query_sync(sql: str, user_id: str, load_mode: str = None,
+                              timeout: float = None, query_id: str = None,
+                              result_format: str = "rows", page_size: int = None) -> dict:
     """
     Execute SQL query on user's health data using DuckDB
     
     Args:
         sql: SQL query string
         user_id: User ID whose data to query
+        load_mode: How tables are made available (default: HEALTHSYNC_TABLE_LOADING)
+            - "catalog": open the persistent per-user catalog (falls back to "lazy")
+            - "lazy": load only the CSV files the query references
+            - "eager": load every CSV file
+        timeout: Seconds before the query is interrupted (default: HEALTHSYNC_QUERY_TIMEOUT)
+        query_id: ID that cancel_query() can use to abort the query
+        result_format: "rows" (list of dicts, default), "columns" (dict of lists)
+            or "arrow" (base64 Arrow IPC stream in "arrow_ipc")
+        page_size: If set and the result has more rows, return only the first page_size
+            rows plus "next_cursor"; further pages come from fetch_health_query_page
+            (result is held server-side). Smaller results are returned whole.
     
     Returns:
         Dictionary with query results
     """
-    # Get project root (3 levels up from tools/)
-    project_root = Path(__file__).parent.parent.parent.parent
-    storage_path = project_root / "storage" / "user_data" / user_id
+    query_id = query_id or new_query_id()
+    result_format = (result_format or "rows").lower()
+    if result_format not in RESULT_FORMATS:
+        return {
+            "error": f"Unknown result_format '{result_format}'. Use one of: {', '.join(RESULT_FORMATS)}",
+            "user_id": user_id
+        }
+    if result_format == "arrow" and not PYARROW_AVAILABLE:
+        print("pyarrow not installed, returning columnar result instead of Arrow")
+        result_format = "columns"
+    if page_size is not None:
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            return {"error": "page_size must be a positive integer", "user_id": user_id}
+        if page_size <= 0:
+            return {"error": "page_size must be a positive integer", "user_id": user_id}
+        page_size = min(page_size, MAX_PAGE_SIZE)
+    storage_path = get_user_storage_path(user_id)
     
     if not storage_path.exists():
         return {
@@ -38,135 +377,80 @@ async def execute_health_query(sql: str, user_id: str) -> dict:
             "user_id": user_id
         }
     
-    # Connect to DuckDB
-    conn = duckdb.connect()
+    # Find CSV files
+    csv_files = list(storage_path.glob("*.csv"))
     
-    try:
-        # Register CSV files as tables
-        csv_files = list(storage_path.glob("*.csv"))
-        
-        if not csv_files:
-            return {
-                "error": "No CSV files found",
-                "user_id": user_id
+    if not csv_files:
+        return {
+            "error": "No CSV files found",
+            "user_id": user_id
+        }
+    
+    # Serve repeated queries from the result cache (key changes whenever the files change).
+    # Complete results are cached, so a paged request reuses one that fits in its first page;
+    # larger paged results live in the result store instead
+    cache_key = result_cache.make_key(user_id, sql, compute_data_fingerprint(storage_path), result_format)
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None and (not page_size or cached_result.get("row_count", 0) <= page_size):
+        return {**cached_result, "cached": True}
+    
+    # Table names keep original CSV names (escaped when used in SQL)
+    table_mapping = {csv_file.stem: csv_file.stem for csv_file in csv_files}
+    
+    mode = (load_mode or TABLE_LOADING_MODE).lower()
+    conn = None
+    shared_connection = False  # per-thread catalog connection stays open
+    created_tables = []
+    failed_files = []
+    table_types = {}  # table name -> {column: type}, used to skip needless casts
+    rollup_views = {}  # table name -> daily rollup view
+    
+    if mode == "catalog":
+        # Open the persistent catalog (built on upload, rebuilt only if CSV files changed)
+        try:
+            conn, manifest = get_catalog_connection(storage_path)
+            shared_connection = True
+            created_tables = list(manifest.get("tables", {}).keys())
+            failed_files = manifest.get("failed_files", [])
+            table_types = {
+                name: info.get("column_types", {}) for name, info in manifest.get("tables", {}).items()
             }
-        
-        # Create tables from CSV files - keep original names, just escape them
-        table_mapping = {}  # original_name -> escaped_name (for reference)
-        failed_files = []
-        created_tables = []  # Track successfully created tables
-        
+            rollup_views = {
+                name: info["rollup"] for name, info in manifest.get("tables", {}).items() if info.get("rollup")
+            }
+        except Exception as catalog_error:
+            print(f"Catalog unavailable, loading referenced CSV files in memory: {catalog_error}")
+            mode = "lazy"
+    
+    if conn is None:
+        # Typed Parquet copies (written on upload) know their column types up front
         for csv_file in csv_files:
-            original_name = csv_file.stem
-            # Keep original name, just escape it for SQL
-            escaped_name = escape_table_name(original_name)
-            table_mapping[original_name] = original_name  # No normalization
-            
-            # Skip if table already exists (from previous iteration)
-            try:
-                conn.execute(f"SELECT 1 FROM {escaped_name} LIMIT 1").fetchone()
-                created_tables.append(original_name)
-                continue  # Table already exists, skip
-            except:
-                pass  # Table doesn't exist, continue to create it
-            
-            try:
-                # Try with read_csv_auto first (handles most cases)
-                csv_path = str(csv_file.resolve()).replace("'", "''").replace("\\", "\\\\")  # Use absolute path
-                
-                # DuckDB read_csv_auto with options for better error handling
-                csv_error = None
-                try:
-                    # Try with read_csv_auto (simplest, auto-detects everything)
-                    # DuckDB read_csv_auto doesn't support named parameters in this way
-                    # Use simple call and let it auto-detect
-                    conn.execute(f"""
-                        CREATE TABLE IF NOT EXISTS {escaped_name} AS 
-                        SELECT * FROM read_csv_auto('{csv_path}')
-                    """)
-                    # Verify table was created and has data
-                    test_result = conn.execute(f"SELECT COUNT(*) FROM {escaped_name}").fetchone()
-                    if test_result and test_result[0] > 0:
-                        created_tables.append(original_name)
-                    else:
-                        # Table created but empty - still add it
-                        created_tables.append(original_name)
-                except Exception as e:
-                    csv_error = e
-                    # Check if it's a CSV parsing error (line error, conversion error, etc.)
-                    error_str = str(e).lower()
-                    if any(keyword in error_str for keyword in ['csv error', 'conversion error', 'line:', 'parser error']):
-                        # This is a CSV parsing error, will try pandas fallback
-                        pass
-                    else:
-                        # Other error, try pandas anyway
-                        pass
-                
-                # If DuckDB failed, try pandas fallback
-                if csv_error and original_name not in created_tables:
-                    # If that fails, try with pandas as fallback (more forgiving)
-                    import pandas as pd
-                    try:
-                        # Read CSV with pandas (handles malformed CSV better)
-                        # Use on_bad_lines='skip' to skip problematic lines
-                        df = pd.read_csv(
-                            csv_file,
-                            on_bad_lines='skip',  # Skip bad lines instead of failing
-                            engine='python',  # Python engine is more forgiving
-                            quoting=1,  # QUOTE_ALL - handle quotes properly
-                            escapechar='\\',
-                            low_memory=False,
-                            encoding='utf-8',
-                            errors='replace',  # Replace encoding errors
-                            skipinitialspace=True,  # Skip spaces after delimiter
-                            skip_blank_lines=True  # Skip blank lines
-                        )
-                        # Clean the dataframe
-                        df = df.dropna(how='all')  # Remove completely empty rows
-                        # Remove rows that are completely empty or have all NaN
-                        df = df[~df.isnull().all(axis=1)]
-                        
-                        if df.empty:
-                            failed_files.append({
-                                "file": csv_file.name,
-                                "error": "File is empty after cleaning"
-                            })
-                            continue
-                        
-                        # Register as DuckDB table with escaped name (keep original name)
-                        # First register with temp name, then create table with escaped name
-                        temp_reg_name = f"temp_reg_{original_name.replace('-', '_').replace('.', '_')[:50]}"
-                        conn.register(temp_reg_name, df)
-                        # Create table with escaped original name from registered dataframe
-                        conn.execute(f"CREATE TABLE IF NOT EXISTS {escaped_name} AS SELECT * FROM {temp_reg_name}")
-                        conn.unregister(temp_reg_name)
-                        # Verify table was created
-                        test_result = conn.execute(f"SELECT COUNT(*) FROM {escaped_name}").fetchone()
-                        if test_result:
-                            created_tables.append(original_name)
-                            print(f"✅ Loaded {csv_file.name} via pandas fallback (skipped bad lines)")
-                    except Exception as pandas_error:
-                        # If both fail, log and continue with next file
-                        failed_files.append({
-                            "file": csv_file.name,
-                            "error": f"CSV error: {str(csv_error)[:100]}, Pandas error: {str(pandas_error)[:100]}"
-                        })
-                        continue
-                elif csv_error:
-                    # DuckDB failed but we didn't try pandas - this shouldn't happen
-                    failed_files.append({
-                        "file": csv_file.name,
-                        "error": f"CSV error: {str(csv_error)[:100]}"
-                    })
-                    continue
-            except Exception as e:
-                # Catch any other unexpected errors
-                failed_files.append({
-                    "file": csv_file.name,
-                    "error": str(e)[:200]
-                })
-                continue
-        
+            parquet_info = get_parquet_info(csv_file, storage_path)
+            if parquet_info:
+                table_types[csv_file.stem] = parquet_info.get("column_types", {})
+                if has_rollup(parquet_info, storage_path, csv_file.stem):
+                    rollup_views[csv_file.stem] = get_rollup_view_name(csv_file.stem)
+    
+    # Rewrite SQL before loading - it only depends on table names and types,
+    # so lazy loading can look at the rewritten query before any file is read
+    query_tables = extract_table_references(sql, list(table_mapping.keys())) or list(table_mapping.keys())
+    typed_columns = get_timestamp_columns(table_types, list(query_tables))
+    view_columns = get_typed_view_columns(table_types, list(query_tables))
+    normalized_sql = rewrite_health_sql(sql, table_mapping, typed_columns, view_columns)
+    
+    if conn is None:
+        conn = duckdb.connect()
+        files_to_load = csv_files
+        if mode == "lazy":
+            referenced = extract_table_references(normalized_sql, list(table_mapping.keys()))
+            if referenced is not None:
+                files_to_load = [f for f in csv_files if f.stem in referenced]
+            else:
+                # Can't tell which tables the query needs - register everything
+                mode = "eager"
+        created_tables, failed_files = _register_csv_tables(conn, files_to_load, storage_path)
+    
+    try:
         # Ensure at least some tables were created
         if not created_tables:
             return {
@@ -176,78 +460,6 @@ async def execute_health_query(sql: str, user_id: str) -> dict:
                 "failed_files": failed_files[:5]
             }
         
-        # Replace table names in SQL query with escaped names (keep original names)
-        # Escape table names in all contexts: FROM, JOIN, CAST, SELECT, etc.
-        # Sort by length (longest first) to avoid partial replacements
-        sorted_table_names = sorted(table_mapping.keys(), key=len, reverse=True)
-        normalized_sql = sql
-        
-        for original_name in sorted_table_names:
-            escaped_name = escape_table_name(original_name)
-            escaped_original = re.escape(original_name)
-            
-            # Pattern 1: Match after FROM, JOIN, etc.
-            pattern1 = r'(?i)(FROM|JOIN|INTO|UPDATE|TABLE)\s+' + escaped_original + r'(?=\s|;|$|,|\()'
-            normalized_sql = re.sub(pattern1, r'\1 ' + escaped_name, normalized_sql)
-            
-            # Pattern 2: Match in CAST statements: CAST(table.value AS ...)
-            # Don't use \b because table names have dashes. Use lookbehind/lookahead instead
-            # Match: CAST(table.value AS ...) or CAST( table.value AS ...)
-            cast_pattern = r'(?i)(CAST\s*\()\s*' + escaped_original + r'\.(\w+)(?=\s+AS)'
-            normalized_sql = re.sub(cast_pattern, r'\1' + escaped_name + r'.\2', normalized_sql)
-            
-            # Pattern 3: Match table.column in any context (SELECT, WHERE, etc.)
-            # Match: table.column where table is the original_name
-            # Use negative lookbehind to ensure not already escaped
-            table_column_pattern = r'(?i)(?<!")' + escaped_original + r'\.(\w+)(?=\s|,|;|\)|$|AS|WHERE|GROUP|ORDER|HAVING)'
-            normalized_sql = re.sub(table_column_pattern, escaped_name + r'.\1', normalized_sql)
-            
-            # Pattern 4: Match standalone table names (not table.column, not in FROM/JOIN)
-            # Use lookbehind/lookahead to ensure it's a complete identifier
-            # Don't match if it's already part of table.column (handled by Pattern 3)
-            standalone_pattern = r'(?i)(?<!["\w])' + escaped_original + r'(?!\.|\w)'
-            # Only replace if not already escaped
-            if original_name in normalized_sql and escaped_name not in normalized_sql:
-                # Check if it's not already in a FROM/JOIN context (handled by Pattern 1)
-                if not re.search(r'(?i)(FROM|JOIN)\s+' + escaped_original, normalized_sql):
-                    normalized_sql = re.sub(standalone_pattern, escaped_name, normalized_sql)
-            
-            # Pattern 5: Replace if quoted (but keep the quotes, just ensure they're there)
-            pattern_quoted = r'"' + escaped_original + r'"'
-            if pattern_quoted in normalized_sql:
-                normalized_sql = re.sub(pattern_quoted, escaped_name, normalized_sql, flags=re.IGNORECASE)
-            
-            # Pattern 6: Replace unquoted table names in FROM/JOIN (backup for Pattern 1)
-            pattern_unquoted = r'(?i)(FROM|JOIN)\s+' + escaped_original + r'(?=\s|,|;|$|WHERE|GROUP|ORDER|HAVING)'
-            normalized_sql = re.sub(pattern_unquoted, r'\1 ' + escaped_name, normalized_sql)
-        
-        # Fix ambiguous column references, date functions, and value column casting
-        try:
-            # sql_fixer is already imported at top of file
-            # First fix date functions (MySQL/PostgreSQL -> DuckDB)
-            normalized_sql = fix_date_functions(normalized_sql)
-            # Then fix value column casting (VARCHAR -> DOUBLE for aggregates)
-            # Pass table_mapping so it can escape table names in CAST statements
-            normalized_sql = fix_value_column_casting(normalized_sql, table_mapping)
-            # Re-escape table names after value casting (in case new CAST statements were created)
-            # This ensures table names in CAST statements are properly escaped
-            for original_name in sorted_table_names:
-                escaped_name = escape_table_name(original_name)
-                escaped_original = re.escape(original_name)
-                # Escape table names in CAST statements: CAST(table.column AS ...)
-                # Match both with and without quotes, handle table names with dashes
-                cast_pattern = r'(?i)(CAST\s*\()\s*' + escaped_original + r'\.(\w+)(?=\s+AS)'
-                normalized_sql = re.sub(cast_pattern, r'\1' + escaped_name + r'.\2', normalized_sql)
-                # Also match if there are spaces: CAST( table.column AS ...)
-                cast_pattern_spaced = r'(?i)(CAST\s*\(\s*)' + escaped_original + r'\.(\w+)(?=\s+AS)'
-                normalized_sql = re.sub(cast_pattern_spaced, r'\1' + escaped_name + r'.\2', normalized_sql)
-            # Finally fix ambiguous columns
-            normalized_sql = fix_ambiguous_columns(normalized_sql, list(table_mapping.keys()))
-        except Exception as fix_error:
-            # If fix fails, continue with original SQL
-            print(f"SQL fixer error: {fix_error}")
-            pass
-        
         # Verify all tables in query exist
         # Extract table names from normalized SQL (simple check)
         for original_table in created_tables:
@@ -266,9 +478,43 @@ async def execute_health_query(sql: str, user_id: str) -> dict:
                         "user_id": user_id
                     }
         
-        # Execute query
+        # Day-or-coarser aggregates are answered from the daily rollups
+        routed_sql = _route_query(conn, normalized_sql, rollup_views)
+        executed_sql = routed_sql or normalized_sql
+        
+        # Paginated queries run once, straight into a Parquet file (COPY returns the row count).
+        # A result that fits in one page is read back whole, its file removed and the result
+        # cached; larger ones stay in the result store and are served a page at a time
+        pageable = bool(page_size) and _is_pageable(executed_sql)
+        
+        def run_query():
+            if not pageable:
+                conn.execute(executed_sql)
+                return _fetch_result(conn, result_format), None
+            handle_id, spill_path = new_result_path(storage_path)
+            return None, (handle_id, spill_path, _spill_result(conn, executed_sql, spill_path))
+        
+        # Execute query (interrupted on timeout or cancel_query)
+        running = start_query(query_id, conn, timeout)
+        if running.reason:
+            end_query(running)
+            return _interrupted_result(running, sql, normalized_sql, user_id, timeout)
         try:
-            result = conn.execute(normalized_sql).fetchall()
+            try:
+                fetched, spilled = run_query()
+            except Exception as query_error:
+                error_msg = str(query_error)
+                if mode != "lazy" or not ("does not exist" in error_msg or "Table with name" in error_msg):
+                    raise
+                # Lazy mode missed a reference - register the remaining files and retry once
+                remaining_files = [f for f in csv_files if f.stem not in created_tables]
+                more_tables, more_failed = _register_csv_tables(conn, remaining_files, storage_path)
+                created_tables.extend(more_tables)
+                failed_files.extend(more_failed)
+                mode = "eager"
+                fetched, spilled = run_query()
+        except duckdb.InterruptException:
+            return _interrupted_result(running, sql, normalized_sql, user_id, timeout)
         except Exception as query_error:
             # If query fails, try to provide helpful error message
             error_msg = str(query_error)
@@ -290,35 +536,37 @@ async def execute_health_query(sql: str, user_id: str) -> dict:
                     "user_id": user_id
                 }
             raise
+        finally:
+            end_query(running)
         
-        # Get column names
-        columns = [desc[0] for desc in conn.description] if conn.description else []
-        
-        # Convert to list of dicts
-        rows = []
-        for row in result:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                value = row[i]
-                # Convert datetime objects to strings
-                if isinstance(value, datetime):
-                    value = value.isoformat()
-                row_dict[col] = value
-            rows.append(row_dict)
+        if spilled:
+            handle_id, spill_path, total_rows = spilled
+            if total_rows <= page_size:
+                fetched = _read_whole_spill(spill_path, result_format)
+                spilled = None
+            else:
+                handle = register_result(handle_id, user_id, spill_path, total_rows, page_size, sql, normalized_sql)
+                fetched = _read_result_page(handle, 0, result_format)
         
         result = {
             "success": True,
-            "data": rows,
-            "row_count": len(rows),
-            "columns": columns,
+            **fetched,
+            "result_format": result_format,
             "query": sql,
             "normalized_query": normalized_sql,
-            "table_mapping": table_mapping
+            "table_mapping": table_mapping,
+            "load_mode": mode
         }
+        if routed_sql:
+            result["rollup"] = True
+            result["executed_query"] = routed_sql
         
         if failed_files:
             result["warnings"] = f"Failed to load {len(failed_files)} file(s): {[f['file'] for f in failed_files]}"
         
+        if not spilled:
+            result_cache.put(cache_key, result, get_result_ttl(normalized_sql))
+        
         return result
     
     except Exception as e:
@@ -329,5 +577,55 @@ async def execute_health_query(sql: str, user_id: str) -> dict:
         }
     
     finally:
-        conn.close()
+        if not shared_connection:
+            conn.close()
+
+
+async def fetch_health_query_page(cursor: str, user_id: str, result_format: str = "rows") -> dict:
+    """
+    Fetch a page of a paginated health_query result (runs on the tool thread pool)
+    See fetch_health_query_page_sync for arguments
+    """
+    return await run_blocking(fetch_health_query_page_sync, cursor, user_id, result_format)
 
+def fetch_health_query_page_sync(cursor: str, user_id: str, result_format: str = "rows") -> dict:
+    """
+    Fetch a page of a paginated health_query result
+    
+    Args:
+        cursor: "next_cursor" or "prev_cursor" from a previous page
+        user_id: User ID the query was run for
+        result_format: "rows", "columns" or "arrow" (see execute_health_query_sync)
+    
+    Returns:
+        Dictionary with the page rows, "total_rows" and cursors for the neighbouring pages
+    """
+    result_format = (result_format or "rows").lower()
+    if result_format not in RESULT_FORMATS:
+        return {
+            "error": f"Unknown result_format '{result_format}'. Use one of: {', '.join(RESULT_FORMATS)}",
+            "user_id": user_id
+        }
+    if result_format == "arrow" and not PYARROW_AVAILABLE:
+        result_format = "columns"
+    
+    try:
+        handle_id, offset = decode_cursor(cursor or "")
+    except ValueError as e:
+        return {"error": str(e), "user_id": user_id}
+    
+    handle = get_result(handle_id, user_id)
+    if handle is None:
+        return {
+            "error": "Result expired or not found. Run the query again.",
+            "error_type": "expired",
+            "user_id": user_id
+        }
+    
+    try:
+        page = _read_result_page(handle, offset, result_format)
+    except Exception as e:
+        return {"error": str(e), "user_id": user_id}
+    page["query"] = handle.query
+    page["normalized_query"] = handle.normalized_query
+    return page
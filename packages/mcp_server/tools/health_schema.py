@@ -1,10 +1,18 @@
 """
 Tool: Get health data schema
 Returns available tables and their columns
+
+Column types, row counts and per-table statistics (date range, units,
+sources, value range, cadence) come from ingestion metadata (the typed
+Parquet copies and the catalog manifest); files that were never ingested are
+described by DuckDB's CSV sniffer over a bounded sample. The result is saved
+in .healthsync/schema.json keyed by the data fingerprint, so repeated calls
+only read that file.
 """
 import json
 import os
 import sys
+import uuid
 from pathlib import Path
 import duckdb
 
@@ -14,127 +22,199 @@ if str(tools_dir) not in sys.path:
     sys.path.insert(0, str(tools_dir))
 
 from table_utils import escape_table_name
+from executor import run_blocking, map_files, threads_per_file_worker
+from health_catalog import (
+    get_user_storage_path, get_catalog_dir, compute_data_fingerprint, read_manifest, get_parquet_info,
+    has_rollup, get_rollup_view_name, STORAGE_LAYOUT_VERSION, LOCAL_TIMEZONE
+)
+
+SCHEMA_FILE_NAME = "schema.json"
+# Rows the CSV sniffer reads from files without ingestion metadata
+SCHEMA_SAMPLE_ROWS = int(os.getenv("HEALTHSYNC_SCHEMA_SAMPLE_ROWS", "2048"))
 
 async def get_health_schema(user_id: str) -> dict:
+    """
+    Get schema of available health data tables (runs on the tool thread pool)
+    See get_health_schema_sync for arguments
+    """
+    return await run_blocking(get_health_schema_sync, user_id)
+
+def get_health_schema_sync(user_id: str) -> dict:
     """
     Get schema of available health data tables
-    
+
     Args:
         user_id: User ID to get schema for
-    
+
     Returns:
         Dictionary with table schemas
     """
-    # Get project root (3 levels up from tools/)
-    project_root = Path(__file__).parent.parent.parent.parent
-    storage_path = project_root / "storage" / "user_data" / user_id
-    
+    storage_path = get_user_storage_path(user_id)
+
     if not storage_path.exists():
         return {
             "error": "No data found for user",
             "user_id": user_id,
             "tables": {}
         }
-    
+
     # Find all CSV files
-    csv_files = list(storage_path.glob("*.csv"))
-    
+    csv_files = sorted(storage_path.glob("*.csv"))
+
     if not csv_files:
         return {
             "error": "No CSV files found",
             "user_id": user_id,
             "tables": {}
         }
-    
-    # Connect to DuckDB
-    conn = duckdb.connect()
-    schemas = {}
-    
+
+    fingerprint = compute_data_fingerprint(storage_path)
+    cached = read_schema_cache(storage_path, fingerprint)
+    if cached is not None:
+        return {**cached, "user_id": user_id, "cached": True}
+
+    manifest = read_manifest(storage_path)
+    if not manifest or manifest.get("fingerprint") != fingerprint:
+        manifest = None  # Describes other files
+
+    def describe(csv_file: Path) -> dict:
+        schema = _ingested_schema(csv_file, storage_path, manifest)
+        if schema is not None:
+            return schema
+        conn = duckdb.connect()
+        try:
+            conn.execute(f"SET threads TO {threads_per_file_worker()}")
+            return _sniff_schema(conn, csv_file)
+        finally:
+            conn.close()
+
     try:
-        for csv_file in csv_files:
-            original_name = csv_file.stem  # Keep original name
-            # Use original name with temp prefix
-            temp_table_name = f"temp_{original_name.replace('-', '_').replace('.', '_')[:50]}"
-            escaped_temp_name = escape_table_name(temp_table_name)
-            escaped_original_name = escape_table_name(original_name)
-            
-            try:
-                csv_path = str(csv_file).replace("'", "''")  # Escape single quotes
-                
-                # Try read_csv_auto with error handling options
-                try:
-                    # Use read_csv_auto without parameters (auto-detects)
-                    conn.execute(f"""
-                        CREATE TABLE IF NOT EXISTS {escaped_temp_name} AS 
-                        SELECT * FROM read_csv_auto('{csv_path}')
-                    """)
-                except Exception as csv_error:
-                    # Fallback to pandas if read_csv_auto fails (more forgiving)
-                    import pandas as pd
-                    try:
-                        df = pd.read_csv(
-                            csv_file,
-                            on_bad_lines='skip',  # Skip bad lines
-                            engine='python',
-                            quoting=1,
-                            escapechar='\\',
-                            low_memory=False,
-                            encoding='utf-8',
-                            errors='replace'
-                        )
-                        df = df.dropna(how='all')
-                        df = df[~df.isnull().all(axis=1)]
-                        # Register as temporary table name
-                        temp_pandas_name = f"temp_pandas_{normalized_name}"
-                        conn.register(temp_pandas_name, df)
-                        # Recreate as temp table
-                        conn.execute(f"CREATE TABLE IF NOT EXISTS {escaped_temp_name} AS SELECT * FROM {temp_pandas_name}")
-                        conn.unregister(temp_pandas_name)
-                    except Exception as pandas_error:
-                        # If both fail, mark as error but continue
-                        schemas[original_name] = {
-                            "error": f"CSV parsing failed: {str(csv_error)[:100]}",
-                            "file": csv_file.name
-                        }
-                        continue
-                
-                # Get column info
-                columns_info = conn.execute(
-                    f"DESCRIBE {escaped_temp_name}"
-                ).fetchall()
-                
-                schemas[original_name] = {
-                    "table_name": original_name,  # Use original name
-                    "escaped_name": escaped_original_name,  # Escaped name ready to use in queries
-                    "columns": [col[0] for col in columns_info],
-                    "column_types": {col[0]: col[1] for col in columns_info},
-                    "file": csv_file.name,
-                    "row_count": conn.execute(f"SELECT COUNT(*) FROM {escaped_temp_name}").fetchone()[0]
-                }
-                
-                # Clean up temp table
-                conn.execute(f"DROP TABLE IF EXISTS {escaped_temp_name}")
-            
-            except Exception as e:
-                schemas[table_name] = {
-                    "error": str(e),
-                    "file": csv_file.name
-                }
-        
-        return {
-            "success": True,
-            "user_id": user_id,
-            "tables": schemas,
-            "table_count": len(schemas)
+        # Files are described in parallel (HEALTHSYNC_FILE_WORKERS)
+        schemas = {
+            csv_file.stem: schema for csv_file, schema in zip(csv_files, map_files(describe, csv_files))
         }
-    
     except Exception as e:
         return {
             "error": str(e),
             "user_id": user_id,
             "tables": {}
         }
-    
-    finally:
-        conn.close()
 
+    result = {
+        "success": True,
+        "user_id": user_id,
+        "tables": schemas,
+        "table_count": len(schemas)
+    }
+    # Sniffed schemas have no row count yet - keep computing them until the files are ingested
+    if all("row_count" in schema and schema["row_count"] is not None for schema in schemas.values()):
+        write_schema_cache(storage_path, fingerprint, result)
+    return result
+
+def _table_schema(table_name: str, csv_file: Path, column_types: dict, row_count: int) -> dict:
+    return {
+        "table_name": table_name,  # Use original name
+        "escaped_name": escape_table_name(table_name),  # Escaped name ready to use in queries
+        "columns": list(column_types.keys()),
+        "column_types": column_types,
+        "file": csv_file.name,
+        "row_count": row_count
+    }
+
+def _ingested_schema(csv_file: Path, storage_path: Path, manifest: dict) -> dict:
+    """
+    Schema of a file from ingestion metadata (typed Parquet copy, else the catalog manifest)
+
+    Returns:
+        Schema dictionary, or None if the file wasn't ingested yet
+    """
+    table_name = csv_file.stem
+    parquet_info = get_parquet_info(csv_file, storage_path)
+    if parquet_info:
+        schema = _table_schema(table_name, csv_file, parquet_info["column_types"], parquet_info["row_count"])
+        schema["stats"] = parquet_info.get("stats", {})
+        if has_rollup(parquet_info, storage_path, table_name):
+            schema["rollup_view"] = get_rollup_view_name(table_name)
+        return schema
+    table_info = (manifest or {}).get("tables", {}).get(table_name)
+    if table_info and table_info.get("column_types"):
+        schema = _table_schema(table_name, csv_file, table_info["column_types"], table_info.get("row_count"))
+        if table_info.get("stats"):
+            schema["stats"] = table_info["stats"]
+        return schema
+    return None
+
+def _sniff_schema(conn: duckdb.DuckDBPyConnection, csv_file: Path) -> dict:
+    """
+    Schema of a file that wasn't ingested yet, sniffed from a bounded sample
+    (row count is unknown until the file is ingested)
+    """
+    csv_path = str(csv_file).replace("'", "''")  # Escape single quotes
+    try:
+        columns_info = conn.execute(
+            f"DESCRIBE SELECT * FROM read_csv_auto('{csv_path}', sample_size={SCHEMA_SAMPLE_ROWS})"
+        ).fetchall()
+        column_types = {col[0]: col[1] for col in columns_info}
+    except Exception as csv_error:
+        # Fallback to pandas on the same sample (more forgiving)
+        import pandas as pd
+        try:
+            df = pd.read_csv(
+                csv_file,
+                nrows=SCHEMA_SAMPLE_ROWS,
+                on_bad_lines='skip',  # Skip bad lines
+                engine='python',
+                quoting=1,
+                escapechar='\\',
+                encoding='utf-8',
+                encoding_errors='replace'
+            )
+            df = df.dropna(how='all')
+            temp_name = f"temp_sample_{uuid.uuid4().hex[:8]}"
+            conn.register(temp_name, df)
+            try:
+                column_types = {col[0]: col[1] for col in conn.execute(f"DESCRIBE {temp_name}").fetchall()}
+            finally:
+                conn.unregister(temp_name)
+        except Exception:
+            return {
+                "error": f"CSV parsing failed: {str(csv_error)[:100]}",
+                "file": csv_file.name
+            }
+    return _table_schema(csv_file.stem, csv_file, column_types, None)
+
+def read_schema_cache(storage_path: Path, fingerprint: str) -> dict:
+    """
+    Read the saved schema if it describes the current files
+
+    Returns:
+        Schema result dictionary, or None if missing or stale
+    """
+    schema_path = get_catalog_dir(storage_path) / SCHEMA_FILE_NAME
+    try:
+        with open(schema_path, "r") as f:
+            cached = json.load(f)
+    except Exception:
+        return None
+    if cached.get("fingerprint") != fingerprint or cached.get("layout") != STORAGE_LAYOUT_VERSION or \
+            cached.get("timezone") != LOCAL_TIMEZONE:
+        return None
+    return cached.get("schema")
+
+def write_schema_cache(storage_path: Path, fingerprint: str, result: dict):
+    """Save a schema result for the current files (write temp file, then rename)"""
+    catalog_dir = get_catalog_dir(storage_path)
+    schema_path = catalog_dir / SCHEMA_FILE_NAME
+    tmp_path = catalog_dir / f"{SCHEMA_FILE_NAME}.{uuid.uuid4().hex}.tmp"
+    try:
+        catalog_dir.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                "layout": STORAGE_LAYOUT_VERSION,
+                "timezone": LOCAL_TIMEZONE,
+                "schema": {key: value for key, value in result.items() if key != "user_id"}
+            }, f, indent=2)
+        os.replace(tmp_path, schema_path)
+    except OSError as e:
+        print(f"Could not save schema cache: {e}")
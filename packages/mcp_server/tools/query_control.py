@@ -0,0 +1,104 @@
+"""
+Query control
+Track running health queries so they can be timed out or cancelled
+"""
+import os
+import threading
+import uuid
+import duckdb
+
+# Default per-query time limit in seconds (0 disables it)
+QUERY_TIMEOUT = float(os.getenv("HEALTHSYNC_QUERY_TIMEOUT", "30"))
+
+class RunningQuery:
+    """A query executing on a DuckDB connection"""
+
+    def __init__(self, query_id: str, conn: duckdb.DuckDBPyConnection):
+        self.query_id = query_id
+        self.conn = conn
+        self.reason = None  # "timeout" or "cancelled" once interrupted
+        self.finished = False
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def interrupt(self, reason: str) -> bool:
+        """Interrupt the query (no-op once it has finished)"""
+        with self._lock:
+            if self.finished or self.reason:
+                return False
+            self.reason = reason
+            self.conn.interrupt()
+            return True
+
+    def start_timer(self, timeout: float):
+        """Interrupt the query with reason "timeout" after `timeout` seconds"""
+        if timeout and timeout > 0:
+            self._timer = threading.Timer(timeout, self.interrupt, args=("timeout",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def finish(self):
+        """Mark finished so a late timer/cancel can't hit the connection's next query"""
+        with self._lock:
+            self.finished = True
+        if self._timer:
+            self._timer.cancel()
+
+_running = {}
+_running_lock = threading.Lock()
+# Cancels that arrived before the query started executing (e.g. while tables were loading)
+_pending_cancels = set()
+MAX_PENDING_CANCELS = 1000
+
+def new_query_id() -> str:
+    """Generate an ID for a query"""
+    return uuid.uuid4().hex
+
+def start_query(query_id: str, conn: duckdb.DuckDBPyConnection, timeout: float = None) -> RunningQuery:
+    """
+    Register a query as running and start its timeout
+
+    Args:
+        query_id: Query ID (used by cancel_query)
+        conn: Connection the query runs on
+        timeout: Seconds before the query is interrupted (default: HEALTHSYNC_QUERY_TIMEOUT)
+
+    Returns:
+        RunningQuery handle - call end_query() when done
+    """
+    running = RunningQuery(query_id, conn)
+    with _running_lock:
+        _running[query_id] = running
+        if query_id in _pending_cancels:
+            _pending_cancels.discard(query_id)
+            running.reason = "cancelled"
+            return running
+    running.start_timer(QUERY_TIMEOUT if timeout is None else timeout)
+    return running
+
+def end_query(running: RunningQuery):
+    """Unregister a finished query"""
+    running.finish()
+    with _running_lock:
+        if _running.get(running.query_id) is running:
+            del _running[running.query_id]
+
+def cancel_query(query_id: str) -> bool:
+    """
+    Cancel a running query
+
+    Args:
+        query_id: ID passed to health_query
+
+    Returns:
+        True if a running query was interrupted, False if it isn't running
+        (a query that hasn't started yet is cancelled as soon as it starts)
+    """
+    with _running_lock:
+        running = _running.get(query_id)
+        if running is None:
+            if len(_pending_cancels) >= MAX_PENDING_CANCELS:
+                _pending_cancels.clear()
+            _pending_cancels.add(query_id)
+            return False
+    return running.interrupt("cancelled")
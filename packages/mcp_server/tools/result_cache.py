@@ -0,0 +1,141 @@
+"""
+Query result cache
+LRU cache of health_query results keyed by user, normalized SQL and data fingerprint
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Cache limits (configurable via environment)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("HEALTHSYNC_RESULT_CACHE_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("HEALTHSYNC_RESULT_CACHE_MB", "64")) * 1024 * 1024)
+# Max lifetime of results that depend on the current time (NOW(), CURRENT_TIMESTAMP)
+RESULT_CACHE_RELATIVE_TTL = int(os.getenv("HEALTHSYNC_RESULT_CACHE_RELATIVE_TTL", "300"))
+
+# Functions whose value changes with the clock
+_DATE_RELATIVE_PATTERN = re.compile(r'(?i)\b(CURRENT_DATE|TODAY\s*\()')
+_TIME_RELATIVE_PATTERN = re.compile(r'(?i)\b(CURRENT_TIMESTAMP|CURRENT_TIME|NOW\s*\(|GET_CURRENT_TIMESTAMP\s*\()')
+
+def normalize_query(sql: str) -> str:
+    """
+    Normalize SQL for cache keys
+    Collapses whitespace, drops trailing semicolons and lower-cases everything
+    outside string literals and quoted identifiers.
+
+    Args:
+        sql: SQL query string
+
+    Returns:
+        Normalized SQL string
+    """
+    parts = re.split(r"('(?:[^']|'')*'|\"[^\"]*\")", sql.strip().rstrip(';').strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            normalized.append(part)  # literal or quoted identifier - keep as-is
+        else:
+            normalized.append(re.sub(r'\s+', ' ', part).lower())
+    return "".join(normalized).strip()
+
+def get_result_ttl(sql: str) -> float:
+    """
+    Get time-to-live (seconds) for a query result
+
+    Returns:
+        None if the result never expires on its own, otherwise seconds to keep it
+    """
+    if _TIME_RELATIVE_PATTERN.search(sql):
+        return RESULT_CACHE_RELATIVE_TTL
+    if _DATE_RELATIVE_PATTERN.search(sql):
+        # CURRENT_DATE changes at midnight
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return (midnight - now).total_seconds()
+    return None
+
+class QueryResultCache:
+    """Thread-safe LRU cache with entry-count, byte-size and TTL limits"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (result, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_id: str, sql: str, fingerprint: str, variant: str = "rows") -> tuple:
+        """Build cache key from user, normalized SQL, data fingerprint and result layout"""
+        return (user_id, normalize_query(sql), fingerprint, variant)
+
+    def get(self, key: tuple) -> dict:
+        """Get cached result, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, size, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: tuple, result: dict, ttl: float = None):
+        """Store a result (skipped if it alone exceeds the byte limit)"""
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size, expires_at)
+            self._bytes += size
+            # Evict least recently used entries
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop all cached results of a user (e.g. after new files are uploaded)"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user_id]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        """Drop all cached results"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _remove(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+# Process-wide cache shared by the MCP server and direct queries
+result_cache = QueryResultCache()
+
+def invalidate_user_results(user_id: str) -> int:
+    """Drop cached query results of a user"""
+    return result_cache.invalidate_user(user_id)
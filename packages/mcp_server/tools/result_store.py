@@ -0,0 +1,151 @@
+"""
+Query result store
+Server-held handles for paginated health_query results
+
+A paginated query writes its full result once to a Parquet file under
+.healthsync/results/, and pages are read back from that file on demand,
+so memory and payload size only depend on the page size.
+"""
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from health_catalog import get_catalog_dir
+
+# Seconds a result handle stays valid after its last use
+RESULT_HANDLE_TTL = int(os.getenv("HEALTHSYNC_RESULT_HANDLE_TTL", "600"))
+# Max open result handles (oldest are dropped first)
+MAX_RESULT_HANDLES = int(os.getenv("HEALTHSYNC_RESULT_HANDLES", "64"))
+# Upper bound for page_size
+MAX_PAGE_SIZE = int(os.getenv("HEALTHSYNC_MAX_PAGE_SIZE", "5000"))
+
+RESULTS_DIR_NAME = "results"
+
+class ResultHandle:
+    """A spilled query result that pages are read from"""
+
+    def __init__(self, handle_id: str, user_id: str, path: Path, total_rows: int, page_size: int,
+                 query: str, normalized_query: str):
+        self.handle_id = handle_id
+        self.user_id = user_id
+        self.path = path
+        self.total_rows = total_rows
+        self.page_size = page_size
+        self.query = query
+        self.normalized_query = normalized_query
+        self.expires_at = time.time() + RESULT_HANDLE_TTL
+
+    def touch(self):
+        """Extend the handle's lifetime after it's used"""
+        self.expires_at = time.time() + RESULT_HANDLE_TTL
+
+    def expires_in(self) -> int:
+        """Seconds until the handle expires"""
+        return max(0, int(self.expires_at - time.time()))
+
+_handles = OrderedDict()  # handle_id -> ResultHandle, least recently used first
+_handles_lock = threading.Lock()
+
+def get_results_dir(storage_path: Path) -> Path:
+    """Get directory holding spilled query results"""
+    return get_catalog_dir(storage_path) / RESULTS_DIR_NAME
+
+def new_result_path(storage_path: Path) -> tuple:
+    """
+    Reserve a file for a query result
+
+    Returns:
+        Tuple of (handle ID, Parquet file path)
+    """
+    results_dir = get_results_dir(storage_path)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    _remove_stale_files(results_dir)
+    handle_id = uuid.uuid4().hex
+    return handle_id, results_dir / f"{handle_id}.parquet"
+
+def register_result(handle_id: str, user_id: str, path: Path, total_rows: int, page_size: int,
+                    query: str, normalized_query: str) -> ResultHandle:
+    """Register a spilled result so its pages can be fetched with a cursor"""
+    handle = ResultHandle(handle_id, user_id, path, total_rows, page_size, query, normalized_query)
+    with _handles_lock:
+        _handles[handle_id] = handle
+        _expire_handles()
+    return handle
+
+def get_result(handle_id: str, user_id: str) -> ResultHandle:
+    """
+    Get a live result handle
+
+    Returns:
+        ResultHandle, or None if it expired, doesn't exist or belongs to another user
+    """
+    with _handles_lock:
+        _expire_handles()
+        handle = _handles.get(handle_id)
+        if handle is None or handle.user_id != user_id or not handle.path.exists():
+            return None
+        handle.touch()
+        _handles.move_to_end(handle_id)
+        return handle
+
+def drop_result(handle_id: str):
+    """Release a result handle and delete its file"""
+    with _handles_lock:
+        handle = _handles.pop(handle_id, None)
+    if handle:
+        _delete_file(handle.path)
+
+def encode_cursor(handle_id: str, offset: int) -> str:
+    """Build the opaque cursor for the page starting at `offset`"""
+    payload = json.dumps({"h": handle_id, "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Parse a cursor
+
+    Returns:
+        Tuple of (handle ID, offset)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        handle_id, offset = str(payload["h"]), int(payload["o"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if offset < 0:
+        raise ValueError("Invalid cursor: negative offset")
+    return handle_id, offset
+
+def _expire_handles():
+    """Drop expired handles and the oldest ones above MAX_RESULT_HANDLES (caller holds the lock)"""
+    now = time.time()
+    for handle_id in [h for h, handle in _handles.items() if handle.expires_at <= now]:
+        _delete_file(_handles.pop(handle_id).path)
+    while len(_handles) > MAX_RESULT_HANDLES:
+        _, handle = _handles.popitem(last=False)
+        _delete_file(handle.path)
+
+def _remove_stale_files(results_dir: Path):
+    """Delete result files left behind by handles that no longer exist (e.g. after a restart)"""
+    cutoff = time.time() - RESULT_HANDLE_TTL
+    with _handles_lock:
+        live = {handle.path for handle in _handles.values()}
+    for result_file in results_dir.glob("*.parquet"):
+        try:
+            if result_file not in live and result_file.stat().st_mtime < cutoff:
+                result_file.unlink()
+        except OSError:
+            pass
+
+def _delete_file(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,133 @@
+"""
+Rollup Router
+Answer day-or-coarser aggregate queries from the daily rollup views
+
+Only simple single-table queries are routed: every column the query touches
+outside its aggregates must be local_date, and every aggregate must be one the
+daily rollup can reproduce exactly. Anything else runs on the raw data.
+"""
+import re
+
+# Aggregates over raw samples -> equivalent aggregate over daily rollup rows
+_COLUMN_REF = r'(?:(?:"[^"]+"|\w+)\.)?'
+ROLLUP_AGGREGATES = [
+    (r'SUM\s*\(\s*' + _COLUMN_REF + r'"?value_num"?\s*\)', 'SUM(value_sum)'),
+    (r'AVG\s*\(\s*' + _COLUMN_REF + r'"?value_num"?\s*\)', '(SUM(value_sum) / NULLIF(SUM(value_count), 0))'),
+    (r'MIN\s*\(\s*' + _COLUMN_REF + r'"?value_num"?\s*\)', 'MIN(value_min)'),
+    (r'MAX\s*\(\s*' + _COLUMN_REF + r'"?value_num"?\s*\)', 'MAX(value_max)'),
+    # COUNT of no rows is 0, SUM of no rows is NULL
+    (r'COUNT\s*\(\s*' + _COLUMN_REF + r'"?value_num"?\s*\)', 'CAST(COALESCE(SUM(value_count), 0) AS BIGINT)'),
+    (r'COUNT\s*\(\s*(?:\*|1)\s*\)', 'CAST(COALESCE(SUM(sample_count), 0) AS BIGINT)'),
+    (r'MIN\s*\(\s*' + _COLUMN_REF + r'"?start_ts"?\s*\)', 'MIN(first_ts)'),
+    (r'MAX\s*\(\s*' + _COLUMN_REF + r'"?start_ts"?\s*\)', 'MAX(last_ts)'),
+]
+
+# Words allowed outside the rewritten aggregates (keywords, date functions and
+# units); any other identifier means the query needs raw data
+ALLOWED_WORDS = {
+    'select', 'from', 'where', 'group', 'by', 'order', 'having', 'limit', 'offset', 'as', 'and', 'or', 'not',
+    'between', 'in', 'is', 'null', 'asc', 'desc', 'nulls', 'first', 'last', 'interval', 'current_date',
+    'today', 'cast', 'try_cast', 'date', 'timestamp', 'timestamptz', 'double', 'integer', 'bigint', 'varchar',
+    'date_trunc', 'date_part', 'datepart', 'extract', 'strftime', 'year', 'month', 'week', 'day',
+    'dayofweek', 'dayofmonth', 'dayofyear', 'isodow', 'quarter', 'yearweek', 'weekofyear', 'years',
+    'months', 'weeks', 'days', 'round', 'coalesce', 'nullif', 'min', 'max', 'local_date', 'case', 'when',
+    'then', 'else', 'end', 'true', 'false'
+}
+
+# Shapes the router never touches
+_UNSUPPORTED = re.compile(
+    r'(?i)\b(JOIN|UNION|INTERSECT|EXCEPT|WITH|OVER|QUALIFY|DISTINCT|SELECT\b.*\bSELECT|ROLLUP|CUBE|GROUPING)\b',
+    re.DOTALL
+)
+
+_QUERY_PATTERN = re.compile(
+    r'(?is)^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<table>"[^"]+"|\w+)'
+    r'(?:\s+(?:AS\s+)?(?P<alias>(?!(?:WHERE|GROUP|HAVING|ORDER|LIMIT)\b)\w+))?'
+    r'(?P<rest>\s+(?:WHERE|GROUP|HAVING|ORDER|LIMIT)\b.*)?\s*$'
+)
+
+_PLACEHOLDER = "__rollup_agg_{}__"
+
+def route_to_rollup(sql: str, rollup_views: dict) -> str:
+    """
+    Rewrite an aggregate query to read from a daily rollup view
+
+    Args:
+        sql: Normalized SQL query (table names already escaped)
+        rollup_views: Dict of metric table name -> rollup view name
+
+    Returns:
+        Rewritten SQL, or None if the query can't be answered from rollups
+    """
+    if not rollup_views:
+        return None
+    query = sql.strip().rstrip(';').strip()
+    if _UNSUPPORTED.search(_strip_literals(query)):
+        return None
+
+    match = _QUERY_PATTERN.match(query)
+    if not match:
+        return None
+    table = match.group('table').strip('"')
+    rollup_view = rollup_views.get(table)
+    if not rollup_view:
+        return None
+    alias = match.group('alias')
+    select_clause = match.group('select')
+    rest = match.group('rest') or ""
+
+    # Rewrite aggregates to placeholders so the remaining text can be checked
+    replacements = []
+
+    def replace_aggregates(text: str) -> str:
+        for pattern, rollup_expr in ROLLUP_AGGREGATES:
+            def to_placeholder(m, rollup_expr=rollup_expr):
+                replacements.append(rollup_expr)
+                return _PLACEHOLDER.format(len(replacements) - 1)
+            text = re.sub(r'(?i)\b' + pattern, to_placeholder, text)
+        return text
+
+    select_clause = replace_aggregates(select_clause)
+    rest = replace_aggregates(rest)
+    if not replacements:
+        return None  # Not an aggregate query - rows would differ
+
+    output_names = {name.lower() for name in re.findall(r'(?i)\bAS\s+"?(\w+)"?', select_clause)}
+    allowed = ALLOWED_WORDS | output_names | {table.lower()}
+    if alias:
+        allowed.add(alias.lower())
+    for text in (select_clause, rest):
+        if not _only_allowed_words(text, allowed, table):
+            return None
+
+    def restore(text: str) -> str:
+        return re.sub(r'__rollup_agg_(\d+)__', lambda m: replacements[int(m.group(1))], text)
+
+    # Keep the metric's name (or alias) so qualified references still resolve
+    from_clause = f'"{rollup_view}" AS ' + (alias if alias else f'"{table}"')
+    return f"SELECT {restore(select_clause)} FROM {from_clause}{restore(rest)}"
+
+def name_result_columns(routed_sql: str, column_names: list) -> str:
+    """
+    Give a routed query the column names the original query would have produced
+    (unaliased aggregates are named after their expression, e.g. "sum(value_num)")
+    """
+    quoted_names = ", ".join('"' + name.replace('"', '""') + '"' for name in column_names)
+    return f"SELECT * FROM ({routed_sql}) AS rollup_result({quoted_names})"
+
+def _strip_literals(sql: str) -> str:
+    """Blank out string literals"""
+    return re.sub(r"'(?:[^']|'')*'", "''", sql)
+
+def _only_allowed_words(text: str, allowed: set, table: str) -> bool:
+    """Check every identifier in a clause is allowed (so only local_date is read)"""
+    text = _strip_literals(text)
+    text = re.sub(r'__rollup_agg_\d+__', ' ', text)
+    for quoted in re.findall(r'"([^"]+)"', text):
+        if quoted.lower() not in allowed and quoted != table:
+            return False
+    text = re.sub(r'"[^"]+"', ' ', text)
+    for word in re.findall(r'[A-Za-z_]\w*', text):
+        if word.lower() not in allowed:
+            return False
+    return True
@@ -4,7 +4,79 @@ Fix common SQL issues like ambiguous column references, date functions, and type
 """
 import re
 
-def fix_value_column_casting(sql: str, table_mapping: dict = None) -> str:
+# Optional "table." prefix: plain or double-quoted table name / alias
+TABLE_PREFIX = r'((?:"[^"]+"|\w+)\.)?'
+
+# Pre-typed metric view columns for the raw date columns
+DATE_VIEW_COLUMNS = {'startdate': 'start_ts', 'enddate': 'end_ts'}
+
+def use_typed_value_column(sql: str) -> str:
+    """
+    Replace explicit numeric casts of value with the pre-typed value_num column
+    e.g. CAST(t.value AS DOUBLE) -> t.value_num, value::DOUBLE -> value_num
+    """
+    numeric_type = r'(?:DOUBLE|FLOAT|REAL|DECIMAL(?:\s*\([^)]*\))?|NUMERIC(?:\s*\([^)]*\))?)'
+    sql = re.sub(
+        r'(?i)\b(?:TRY_)?CAST\s*\(\s*' + TABLE_PREFIX + r'value\s+AS\s+' + numeric_type + r'\s*\)',
+        lambda m: f"{m.group(1) or ''}value_num",
+        sql
+    )
+    return re.sub(
+        r'(?i)(?<![\w"])' + TABLE_PREFIX + r'value\s*::\s*' + numeric_type + r'(?!\w)',
+        lambda m: f"{m.group(1) or ''}value_num",
+        sql
+    )
+
+def use_typed_date_columns(sql: str, view_columns: set) -> str:
+    """
+    Replace per-row parsing/casting of startDate/endDate with the pre-typed view columns
+    e.g. strptime(startDate, '...') -> start_ts, CAST(startDate AS DATE) -> local_date
+    
+    Args:
+        sql: SQL query string
+        view_columns: Typed view columns every queried table has
+    """
+    view_columns = view_columns or set()
+    date_column = r'(startDate|endDate)\b'
+    
+    def typed_timestamp(match):
+        view_column = DATE_VIEW_COLUMNS[match.group(2).lower()]
+        if view_column not in view_columns:
+            return match.group(0)
+        return f"{match.group(1) or ''}{view_column}"
+    
+    def typed_date(match):
+        prefix = match.group(1) or ""
+        column = match.group(2).lower()
+        if column == 'startdate' and 'local_date' in view_columns:
+            return f"{prefix}local_date"
+        view_column = DATE_VIEW_COLUMNS[column]
+        if view_column not in view_columns:
+            return match.group(0)
+        return f"CAST({prefix}{view_column} AS DATE)"
+    
+    # Date of the sample: DATE(startDate), CAST(startDate AS DATE), startDate::DATE
+    sql = re.sub(r'(?i)(?<![\w.])DATE\s*\(\s*' + TABLE_PREFIX + date_column + r'\s*\)', typed_date, sql)
+    sql = re.sub(r'(?i)\b(?:TRY_)?CAST\s*\(\s*' + TABLE_PREFIX + date_column + r'\s+AS\s+DATE\s*\)', typed_date, sql)
+    sql = re.sub(r'(?i)(?<![\w"])' + TABLE_PREFIX + date_column + r'\s*::\s*DATE(?!\w)', typed_date, sql)
+    
+    # Timestamps: strptime(startDate, '...'), CAST(startDate AS TIMESTAMP[TZ]), startDate::TIMESTAMPTZ
+    timestamp_type = r'(?:TIMESTAMPTZ|TIMESTAMP\s+WITH\s+TIME\s+ZONE|TIMESTAMP)'
+    sql = re.sub(
+        r'(?i)\b(?:try_)?strptime\s*\(\s*' + TABLE_PREFIX + date_column + r"\s*,\s*'[^']*'\s*\)(?:\s*::\s*" + timestamp_type + r')?',
+        typed_timestamp, sql
+    )
+    sql = re.sub(
+        r'(?i)\b(?:TRY_)?CAST\s*\(\s*' + TABLE_PREFIX + date_column + r'\s+AS\s+' + timestamp_type + r'\s*\)',
+        typed_timestamp, sql
+    )
+    sql = re.sub(
+        r'(?i)(?<![\w"])' + TABLE_PREFIX + date_column + r'\s*::\s*' + timestamp_type + r'(?!\w)',
+        typed_timestamp, sql
+    )
+    return sql
+
+def fix_value_column_casting(sql: str, table_mapping: dict = None, typed_value: bool = False) -> str:
     """
     Fix value column casting in aggregate functions
     value columns are VARCHAR but need to be cast to DOUBLE for AVG, SUM, etc.
@@ -12,12 +84,19 @@ def fix_value_column_casting(sql: str, table_mapping: dict = None) -> str:
     Args:
         sql: SQL query string
         table_mapping: Dict mapping original table names to escaped names (optional)
+        typed_value: Tables expose the pre-typed value_num column - use it instead of casting
     
     Returns:
-        Fixed SQL query with value columns cast to DOUBLE
+        Fixed SQL query with value columns cast to DOUBLE (or replaced by value_num)
     """
     result_sql = sql
     
+    def as_double(column_ref: str) -> str:
+        return f"{column_ref}_num" if typed_value else f"CAST({column_ref} AS DOUBLE)"
+    
+    if typed_value:
+        result_sql = use_typed_value_column(result_sql)
+    
     # Import escape_table_name if table_mapping is provided
     escape_func = None
     if table_mapping:
@@ -48,10 +127,10 @@ def fix_value_column_casting(sql: str, table_mapping: dict = None) -> str:
                 for orig_name in sorted(table_mapping.keys(), key=len, reverse=True):
                     if table_name == orig_name or orig_name.endswith(table_name) or table_name in orig_name:
                         escaped_table = escape_func(orig_name)
-                        return f"{func}(CAST({escaped_table}.value AS DOUBLE))"
-            return f"{func}(CAST({table_with_dot}value AS DOUBLE))"
+                        return f"{func}({as_double(f'{escaped_table}.value')})"
+            return f"{func}({as_double(f'{table_with_dot}value')})"
         else:
-            return f"{func}(CAST(value AS DOUBLE))"
+            return f"{func}({as_double('value')})"
     
     result_sql = re.sub(aggregate_pattern, fix_aggregate_value, result_sql)
     
@@ -74,27 +153,45 @@ def fix_value_column_casting(sql: str, table_mapping: dict = None) -> str:
                 for orig_name in sorted(table_mapping.keys(), key=len, reverse=True):
                     if table_name == orig_name or orig_name.endswith(table_name) or table_name in orig_name:
                         escaped_table = escape_func(orig_name)
-                        return f"CAST({escaped_table}.value AS DOUBLE) {operator} {operand}"
-            return f"CAST({table_with_dot}value AS DOUBLE) {operator} {operand}"
+                        return f"{as_double(f'{escaped_table}.value')} {operator} {operand}"
+            return f"{as_double(f'{table_with_dot}value')} {operator} {operand}"
         else:
-            return f"CAST(value AS DOUBLE) {operator} {operand}"
+            return f"{as_double('value')} {operator} {operand}"
     
     result_sql = re.sub(arithmetic_pattern, fix_arithmetic_value, result_sql)
     
     return result_sql
 
-def fix_date_functions(sql: str) -> str:
+def fix_date_functions(sql: str, typed_columns: set = None, view_columns: set = None) -> str:
     """
     Convert MySQL/PostgreSQL date functions to DuckDB syntax
     Also fix date type casting issues
     
     Args:
         sql: SQL query string
+        typed_columns: Lower-case names of date columns already stored as
+            TIMESTAMP/TIMESTAMPTZ (e.g. from Parquet) - compared natively, not re-parsed
+        view_columns: Pre-typed view columns (start_ts, end_ts, local_date) every
+            queried table has - startDate/endDate parsing is redirected to them
     
     Returns:
         Fixed SQL query with DuckDB date syntax
     """
     result_sql = sql
+    typed_columns = {column.lower() for column in (typed_columns or [])}
+    view_columns = set(view_columns or [])
+    
+    def native_column(table_prefix: str, column_name: str) -> str:
+        """Column reference usable without parsing, or None if it must be parsed"""
+        view_column = DATE_VIEW_COLUMNS.get(column_name.lower())
+        if view_column in view_columns:
+            return f"{table_prefix}{view_column}"
+        if column_name.lower() in typed_columns:
+            return f"{table_prefix}{column_name}"
+        return None
+    
+    if view_columns:
+        result_sql = use_typed_date_columns(result_sql, view_columns)
     
     # Fix DATE_SUB(DATE, INTERVAL N UNIT) -> DATE - INTERVAL 'N UNIT'
     # Pattern: DATE_SUB(date_expr, INTERVAL N DAY/MONTH/YEAR/HOUR/MINUTE/SECOND)
@@ -151,7 +248,7 @@ def fix_date_functions(sql: str) -> str:
     
     # First, fix comparisons with CURRENT_DATE/CURRENT_TIMESTAMP and INTERVAL
     # Pattern: (table.)column >= CURRENT_DATE - INTERVAL 'N unit'
-    comparison_with_interval_pattern = r'(?i)(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*(CURRENT_DATE|CURRENT_TIMESTAMP|NOW\(\))\s*-\s*INTERVAL\s*[\'"](\d+)\s+(\w+)[\'"]'
+    comparison_with_interval_pattern = r'(?i)(?<![\w."])(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*(CURRENT_DATE|CURRENT_TIMESTAMP|NOW\(\))\s*-\s*INTERVAL\s*[\'"](\d+)\s+(\w+)[\'"]'
     
     def fix_date_comparison_with_interval(match):
         table_prefix = match.group(1) or ""
@@ -168,6 +265,17 @@ def fix_date_functions(sql: str) -> str:
         else:
             interval_unit_normalized = interval_unit_lower
         
+        # Normalize operator (≥ -> >=)
+        if operator == '≥':
+            operator = '>='
+        elif operator == '≤':
+            operator = '<='
+        
+        # Natively typed column: compare directly, no per-row parsing
+        native = native_column(table_prefix, column_name)
+        if native:
+            return f"{native} {operator} {date_function} - INTERVAL '{interval_value} {interval_unit_normalized}'"
+        
         # Build the fixed comparison with cast
         # Use COALESCE with multiple format attempts for robust date parsing
         # Handles formats like:
@@ -190,19 +298,13 @@ def fix_date_functions(sql: str) -> str:
                 TRY_CAST({column_name} AS TIMESTAMPTZ)
             )"""
         
-        # Normalize operator (≥ -> >=)
-        if operator == '≥':
-            operator = '>='
-        elif operator == '≤':
-            operator = '<='
-        
         return f"{fixed_column} {operator} {date_function} - INTERVAL '{interval_value} {interval_unit_normalized}'"
     
     result_sql = re.sub(comparison_with_interval_pattern, fix_date_comparison_with_interval, result_sql)
     
     # Second, fix simple comparisons with CURRENT_DATE/CURRENT_TIMESTAMP (no INTERVAL)
     # Pattern: (table.)column >= CURRENT_DATE
-    comparison_simple_pattern = r'(?i)(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*(CURRENT_DATE|CURRENT_TIMESTAMP|NOW\(\))(?!\s*[-+])'
+    comparison_simple_pattern = r'(?i)(?<![\w."])(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*(CURRENT_DATE|CURRENT_TIMESTAMP|NOW\(\))(?!\s*[-+])'
     
     def fix_date_comparison_simple(match):
         table_prefix = match.group(1) or ""
@@ -210,6 +312,17 @@ def fix_date_functions(sql: str) -> str:
         operator = match.group(3)
         date_function = match.group(4)
         
+        # Normalize operator (≥ -> >=)
+        if operator == '≥':
+            operator = '>='
+        elif operator == '≤':
+            operator = '<='
+        
+        # Natively typed column: compare directly, no per-row parsing
+        native = native_column(table_prefix, column_name)
+        if native:
+            return f"{native} {operator} {date_function}"
+        
         # Build the fixed comparison with cast
         # Use COALESCE with multiple format attempts for robust date parsing
         if table_prefix:
@@ -227,19 +340,13 @@ def fix_date_functions(sql: str) -> str:
                 TRY_CAST({column_name} AS TIMESTAMPTZ)
             )"""
         
-        # Normalize operator (≥ -> >=)
-        if operator == '≥':
-            operator = '>='
-        elif operator == '≤':
-            operator = '<='
-        
         return f"{fixed_column} {operator} {date_function}"
     
     result_sql = re.sub(comparison_simple_pattern, fix_date_comparison_simple, result_sql)
     
     # Also fix comparisons with date literals
     # Pattern: (table.)column >= '2024-01-01' or column <= '2024-01-01'
-    date_literal_pattern = r'(?i)(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*[\'"](\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2}:\d{2})?)[\'"]'
+    date_literal_pattern = r'(?i)(?<![\w."])(\w+\.)?(startDate|endDate|date|timestamp|created_at|updated_at|start_time|end_time|start_date|end_date|created_date|updated_date)\s*([<>=≤≥]+)\s*[\'"](\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2}:\d{2})?)[\'"]'
     
     def fix_date_literal_comparison(match):
         table_prefix = match.group(1) or ""
@@ -247,18 +354,23 @@ def fix_date_functions(sql: str) -> str:
         operator = match.group(3)
         date_literal = match.group(4)
         
-        # Use strptime to parse timestamp strings with timezone
-        if table_prefix:
-            fixed_column = f"strptime({table_prefix}{column_name}, '%Y-%m-%d %H:%M:%S %z')::TIMESTAMPTZ"
-        else:
-            fixed_column = f"strptime({column_name}, '%Y-%m-%d %H:%M:%S %z')::TIMESTAMPTZ"
-        
         # Normalize operator (≥ -> >=)
         if operator == '≥':
             operator = '>='
         elif operator == '≤':
             operator = '<='
         
+        # Natively typed column: compare directly, no per-row parsing
+        native = native_column(table_prefix, column_name)
+        if native:
+            return f"{native} {operator} '{date_literal}'::TIMESTAMPTZ"
+        
+        # Use strptime to parse timestamp strings with timezone
+        if table_prefix:
+            fixed_column = f"strptime({table_prefix}{column_name}, '%Y-%m-%d %H:%M:%S %z')::TIMESTAMPTZ"
+        else:
+            fixed_column = f"strptime({column_name}, '%Y-%m-%d %H:%M:%S %z')::TIMESTAMPTZ"
+        
         return f"{fixed_column} {operator} '{date_literal}'::TIMESTAMPTZ"
     
     result_sql = re.sub(date_literal_pattern, fix_date_literal_comparison, result_sql)
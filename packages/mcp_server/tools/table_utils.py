@@ -109,3 +109,58 @@ def replace_table_names_in_sql(sql: str, table_mapping: dict) -> str:
     
     return result_sql
 
+
+def extract_table_references(sql: str, table_names: list) -> set:
+    """
+    Find which known tables a SQL query references
+    
+    Args:
+        sql: SQL query (ideally already rewritten, with escaped table names)
+        table_names: List of available (original) table names
+    
+    Returns:
+        Set of referenced table names, or None if references can't be resolved
+        (a FROM/JOIN target is not a known table or CTE, or nothing matched)
+    """
+    if not table_names:
+        return None
+    
+    known = {name.lower(): name for name in table_names}
+    
+    # Ignore string literals (table names inside them are not references)
+    stripped_sql = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    # FROM inside EXTRACT(day FROM col), SUBSTRING(x FROM 1), TRIM(... FROM x) is not a table
+    stripped_sql = re.sub(
+        r'(?i)\b(EXTRACT|SUBSTRING|TRIM|OVERLAY|POSITION)\s*\(([^()]*?)\bFROM\b',
+        r'\1(\2 ',
+        stripped_sql
+    )
+    
+    # CTE names (WITH name AS (...), name2 AS (...)) are valid FROM targets
+    cte_names = {
+        (quoted or bare).lower()
+        for quoted, bare in re.findall(r'(?i)(?:\bWITH\s+(?:RECURSIVE\s+)?|,\s*)(?:"([^"]+)"|([\w-]+))\s+AS\s*\(', stripped_sql)
+    }
+    
+    referenced = set()
+    
+    # Every FROM/JOIN target must be a known table, a CTE or a subquery
+    for match in re.finditer(r'(?i)\b(?:FROM|JOIN)\s+(?:"([^"]+)"|([\w.-]+))', stripped_sql):
+        name = match.group(1) or match.group(2)
+        if not match.group(1) and '.' in name:
+            name = name.split('.')[-1]  # schema-qualified: main.steps
+        if name.lower() in known:
+            referenced.add(known[name.lower()])
+        elif name.lower() not in cte_names:
+            return None
+    
+    # Tables also appear in comma-separated FROM lists and as table.column
+    for lower_name, name in known.items():
+        if name in referenced:
+            continue
+        quoted = '"' + re.escape(name) + '"'
+        bare = r'(?<![\w"-])' + re.escape(name) + r'(?![\w"-])'
+        if re.search(quoted, stripped_sql, re.IGNORECASE) or re.search(bare, stripped_sql, re.IGNORECASE):
+            referenced.add(name)
+    
+    return referenced or None
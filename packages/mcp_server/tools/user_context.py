@@ -3,12 +3,41 @@ Tool: Get user context from MongoDB
 Returns user profile and preferences
 """
 import os
+import sys
+import threading
+from pathlib import Path
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Add tools directory to path for imports
+tools_dir = Path(__file__).parent
+if str(tools_dir) not in sys.path:
+    sys.path.insert(0, str(tools_dir))
+
+from executor import run_blocking
+
+# MongoClient is thread-safe and pools connections - share one per process
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client() -> MongoClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+            _client = MongoClient(mongodb_uri)
+        return _client
+
 async def get_user_context(user_id: str) -> dict:
+    """
+    Get user context from MongoDB (runs on the tool thread pool)
+    See get_user_context_sync for arguments
+    """
+    return await run_blocking(get_user_context_sync, user_id)
+
+def get_user_context_sync(user_id: str) -> dict:
     """
     Get user context from MongoDB
     
@@ -19,10 +48,9 @@ async def get_user_context(user_id: str) -> dict:
         Dictionary with user context
     """
     try:
-        mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
         db_name = os.getenv("MONGODB_DB", "healthsync")
         
-        client = MongoClient(mongodb_uri)
+        client = _get_client()
         db = client[db_name]
         
         # Get user profile
@@ -0,0 +1,88 @@
+"""
+Benchmark the chat pipeline offline
+Runs chat turns headless against a user's data with the stub LLM backend (no
+network, no MongoDB) and reports throughput and per-stage latency
+
+Usage:
+    python scripts/benchmark_chat.py <user_id> [--turns 100] [--sessions 8] [--llm-latency 0.5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "apps" / "streamlit"))
+
+# Mix of template-routed, cached/LLM-generated and stats-answered questions
+QUESTIONS = [
+    "How many steps did I take last week?",
+    "What was my average heart rate in the last 30 days?",
+    "Show me my sleep data for the past 7 days",
+    "How many workouts did I do this month?",
+    "What's my step count trend over the last month?",
+    "Số bước trung bình mỗi ngày trong 14 ngày qua?",
+    "Dữ liệu của tôi bắt đầu từ ngày nào?",
+    "Compare my heart rate on days with workouts",
+]
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat pipeline with the stub LLM backend")
+    parser.add_argument("user_id", help="User whose data directory is queried (storage/user_data/<user_id>)")
+    parser.add_argument("--turns", type=int, default=100, help="Chat turns to run")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent chat sessions")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM seconds per call")
+    args = parser.parse_args()
+
+    os.environ["HEALTHSYNC_LLM_STUB_LATENCY"] = str(args.llm_latency)
+    os.environ["HEALTHSYNC_LLM_STUB_CHUNK_DELAY"] = "0"
+    from utils.llm_backend import get_llm_backend
+    from utils.chat_pipeline import ChatPipeline, STAGES
+    from health_catalog import get_user_storage_path
+
+    storage_path = get_user_storage_path(args.user_id)
+    if not storage_path.exists():
+        print(f"❌ No data for user {args.user_id}: {storage_path}")
+        sys.exit(1)
+    llm = get_llm_backend("stub")
+
+    def run_turn(index: int):
+        # Each session runs its turns on its own event loop, like a Streamlit script thread
+        pipeline = ChatPipeline(args.user_id, storage_path, llm=llm)
+        started = time.perf_counter()
+        turn = asyncio.run(pipeline.run(QUESTIONS[index % len(QUESTIONS)]))
+        return turn, time.perf_counter() - started
+
+    print(f"🏃 {args.turns} turns, {args.sessions} sessions, stub LLM latency {args.llm_latency}s")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as sessions:
+        results = list(sessions.map(run_turn, range(args.turns)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(1 for turn, _ in results if turn.error)
+    latencies = [seconds for _, seconds in results]
+    print(f"\n✅ {len(results)} turns in {elapsed:.2f}s ({len(results) / elapsed:.1f} turns/s), {errors} query errors")
+    print(f"  • Turn latency: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.0f} ms")
+    for stage in STAGES:
+        timings = [turn.timings[stage] for turn, _ in results if stage in turn.timings]
+        if timings:
+            print(f"  • {stage:8s} n={len(timings):4d}  p50 {percentile(timings, 0.5) * 1000:7.1f} ms  "
+                  f"p95 {percentile(timings, 0.95) * 1000:7.1f} ms  mean {statistics.mean(timings) * 1000:7.1f} ms")
+    sources = {}
+    for turn, _ in results:
+        key = f"{turn.sql_source or '-'} SQL / {turn.answer_source or '-'} answer"
+        sources[key] = sources.get(key, 0) + 1
+    print("  • Paths: " + ", ".join(f"{key}: {count}" for key, count in sorted(sources.items())))
+
+if __name__ == "__main__":
+    main()